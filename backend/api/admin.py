@@ -4,7 +4,8 @@ from .models import (
     User, Transaction, Card, Deposit, Loan, 
     Mortgage, Application, Currency, CurrencyHistory, ForumPost, ForumComment, ForumLike, Terminal,
     AIChat, AIChatMessage, PredictionPost, PredictionComment, PredictionLike,
-    CryptoCurrency, CryptoWallet, CryptoTransaction, CryptoPriceHistory
+    CryptoCurrency, CryptoWallet, CryptoTransaction, CryptoPriceHistory,
+    CurrencyHistoryRollup, CryptoPriceRollup
 )
 from .forms import CustomUserCreationForm, CustomUserChangeForm
 
@@ -231,3 +232,24 @@ class CryptoPriceHistoryAdmin(admin.ModelAdmin):
 
     def has_add_permission(self, request):
         return False  # Price history is auto-generated
+
+
+@admin.register(CurrencyHistoryRollup)
+class CurrencyHistoryRollupAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'resolution', 'bucket_start', 'open', 'high', 'low', 'close', 'ticks')
+    list_filter = ('resolution', 'currency')
+    date_hierarchy = 'bucket_start'
+
+    def has_add_permission(self, request):
+        return False  # Candles are maintained by RollupService
+
+
+@admin.register(CryptoPriceRollup)
+class CryptoPriceRollupAdmin(admin.ModelAdmin):
+    list_display = ('cryptocurrency', 'resolution', 'bucket_start', 'open', 'high', 'low', 'close', 'ticks')
+    list_filter = ('resolution', 'cryptocurrency')
+    raw_id_fields = ('cryptocurrency',)
+    date_hierarchy = 'bucket_start'
+
+    def has_add_permission(self, request):
+        return False  # Candles are maintained by RollupService
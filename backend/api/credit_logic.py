@@ -1,88 +1,287 @@
 from django.conf import settings
 from django.utils import timezone
+from django.utils.functional import cached_property
 from datetime import date, timedelta
 from decimal import Decimal
-from django.db.models import Sum
+from django.db.models import Count, Max, Q, Sum
+import numpy as np
+
+# Users per grouped query when loading scoring features
+FEATURE_CHUNK_SIZE = 500
+
+# Integer scoring inputs, one NumPy column each
+COUNT_FEATURES = (
+    'account_age_days', 'transaction_count', 'recent_transactions_count',
+    'active_loans', 'overdue_loans', 'completed_loans',
+    'active_mortgages', 'completed_mortgages',
+)
+
+
+class ScoringFeatures:
+    """
+    The scoring inputs of several users, one NumPy column per input in the
+    order of users, and the vectorized scoring rules over them.
+    """
+
+    def __init__(self, users):
+        self.users = list(users)
+        size = len(self.users)
+        self.columns = {name: np.zeros(size, dtype=np.int64) for name in COUNT_FEATURES}
+        self.columns['has_joined'] = np.zeros(size, dtype=bool)
+        self.columns['total_balance'] = np.zeros(size, dtype=np.float64)
+        # The exact sums, for the Decimal arithmetic of the offers
+        self.total_balances = [Decimal('0.0')] * size
+        # Time of the latest transaction, the watermark of CreditScore
+        self.last_transaction_at = [None] * size
+
+    @classmethod
+    def load(cls, users, contiguous=False):
+        """
+        Four grouped aggregate queries per FEATURE_CHUNK_SIZE users: the
+        transaction and 30-day counts, the card balance sums, and the loan
+        and mortgage counts by state.
+
+        contiguous: users are every user between the first and the last
+        primary key, in order. The four queries then cover the whole range
+        at once with a range scan instead of IN lists.
+        """
+        features = cls(users)
+        columns = features.columns
+        today = timezone.now().date()
+        for i, user in enumerate(features.users):
+            if user.date_joined:
+                columns['has_joined'][i] = True
+                columns['account_age_days'][i] = (today - user.date_joined.date()).days
+
+        if contiguous:
+            if features.users:
+                features._aggregate(gte=features.users[0].pk, lte=features.users[-1].pk)
+        else:
+            user_ids = list(features.index)
+            for start in range(0, len(user_ids), FEATURE_CHUNK_SIZE):
+                features._aggregate(**{'in': user_ids[start:start + FEATURE_CHUNK_SIZE]})
+        return features
+
+    @cached_property
+    def index(self):
+        """Position of each user, by primary key"""
+        return {user.pk: i for i, user in enumerate(self.users)}
+
+    def _aggregate(self, **lookups):
+        """Fill the columns from the grouped queries over the users matching lookups on the user id"""
+        from .models import Transaction, Card, Loan, Mortgage
+
+        columns = self.columns
+        now = timezone.now()
+        today = now.date()
+        one_month_ago = now - timedelta(days=30)
+        by_user = {f'user_id__{lookup}': value for lookup, value in lookups.items()}
+        by_owner = {f'owner_id__{lookup}': value for lookup, value in lookups.items()}
+
+        transactions = (
+            Transaction.objects.filter(**by_user).values_list('user_id')
+            .annotate(
+                count=Count('id'),
+                recent=Count('id', filter=Q(timestamp__gte=one_month_ago)),
+                latest=Max('timestamp'),
+            )
+            .order_by()
+        )
+        for user_id, count, recent, latest in transactions:
+            i = self.index.get(user_id)
+            if i is not None:
+                columns['transaction_count'][i] = count
+                columns['recent_transactions_count'][i] = recent
+                self.last_transaction_at[i] = latest
+
+        cards = Card.objects.filter(**by_owner).values_list('owner_id').annotate(balance=Sum('balance')).order_by()
+        for user_id, balance in cards:
+            i = self.index.get(user_id)
+            if i is not None:
+                balance = balance or Decimal('0.0')
+                self.total_balances[i] = balance
+                columns['total_balance'][i] = float(balance)
+
+        loans = (
+            Loan.objects.filter(**by_user).values_list('user_id')
+            .annotate(
+                active=Count('id', filter=Q(is_active=True)),
+                overdue=Count('id', filter=Q(is_active=True, next_payment_date__lt=today)),
+                completed=Count('id', filter=Q(is_active=False)),
+            )
+            .order_by()
+        )
+        for user_id, active, overdue, completed in loans:
+            i = self.index.get(user_id)
+            if i is not None:
+                columns['active_loans'][i] = active
+                columns['overdue_loans'][i] = overdue
+                columns['completed_loans'][i] = completed
+
+        mortgages = (
+            Mortgage.objects.filter(**by_user).values_list('user_id')
+            .annotate(active=Count('id', filter=Q(is_active=True)), completed=Count('id', filter=Q(is_active=False)))
+            .order_by()
+        )
+        for user_id, active, completed in mortgages:
+            i = self.index.get(user_id)
+            if i is not None:
+                columns['active_mortgages'][i] = active
+                columns['completed_mortgages'][i] = completed
+
+    def scores(self):
+        """The components of the score of every user, as arrays"""
+        c = self.columns
+        account_age_bonus = np.where(c['has_joined'], np.minimum(c['account_age_days'] // 7, 100), 0)
+        transaction_bonus = np.minimum(c['transaction_count'] * 5, 100)
+        balance = c['total_balance']
+        balance_bonus = np.select([balance >= 100000, balance >= 50000, balance >= 10000], [100, 50, 25], 0)
+        loan_penalty = 20 * c['active_loans'] + 50 * c['overdue_loans']
+        completed_loan_bonus = 75 * c['completed_loans']
+        # The legacy scoring also gave 20 per active mortgage of at most three
+        # times the balance of user.card, but User has no card relation
+        # (cards are user.cards): that bonus never applied, so it is left out
+        mortgage_bonus = 30 * c['active_mortgages'] + 150 * c['completed_mortgages']
+        recent_activity_bonus = np.where(c['recent_transactions_count'] >= 5, 25, 0)
+        score = (
+            400 + account_age_bonus + transaction_bonus + balance_bonus - loan_penalty
+            + completed_loan_bonus + mortgage_bonus + recent_activity_bonus
+        )
+        return {
+            'account_age_bonus': account_age_bonus,
+            'transaction_bonus': transaction_bonus,
+            'balance_bonus': balance_bonus,
+            'loan_penalty': loan_penalty,
+            'completed_loan_bonus': completed_loan_bonus,
+            'recent_activity_bonus': recent_activity_bonus,
+            'final_score': np.clip(score, 0, 1000),
+        }
+
+    def breakdown(self, i, scores):
+        """The breakdown of get_detailed_credit_score() for the i-th user"""
+        c = self.columns
+        breakdown = {'base_score': 400}
+        if c['has_joined'][i]:
+            breakdown['account_age_bonus'] = int(scores['account_age_bonus'][i])
+            breakdown['account_age_days'] = int(c['account_age_days'][i])
+        breakdown.update({
+            'transaction_bonus': int(scores['transaction_bonus'][i]),
+            'transaction_count': int(c['transaction_count'][i]),
+            'balance_bonus': int(scores['balance_bonus'][i]),
+            'current_balance': float(c['total_balance'][i]),
+            'loan_penalty': int(scores['loan_penalty'][i]),
+            'completed_loan_bonus': int(scores['completed_loan_bonus'][i]),
+            'recent_activity_bonus': int(scores['recent_activity_bonus'][i]),
+            'recent_transactions_count': int(c['recent_transactions_count'][i]),
+            'final_score': int(scores['final_score'][i]),
+        })
+        return breakdown
+
+
+class CreditScoringContext:
+    """
+    The scoring inputs and score of one user, loaded once and kept until
+    invalidate(). CreditLogicManager.prefetch() fills the contexts of many
+    users from one ScoringFeatures.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._total_balance = None
+        self._active_mortgages = None
+        self._breakdown = None
+
+    def invalidate(self):
+        """Drop the loaded inputs, e.g. after a write to the user's products"""
+        self._breakdown = None
+
+    @property
+    def loaded(self):
+        return self._breakdown is not None
+
+    def fill(self, features, i, scores):
+        self._total_balance = features.total_balances[i]
+        self._active_mortgages = int(features.columns['active_mortgages'][i])
+        self._breakdown = features.breakdown(i, scores)
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            features = ScoringFeatures.load([self.user])
+            self.fill(features, 0, features.scores())
+
+    @property
+    def breakdown(self):
+        self._ensure_loaded()
+        return self._breakdown
+
+    @property
+    def total_balance(self):
+        self._ensure_loaded()
+        return self._total_balance
+
+    @property
+    def active_mortgages(self):
+        self._ensure_loaded()
+        return self._active_mortgages
+
 
 # This class replicates the logic from CreditHistoryManager.swift
 class CreditLogicManager:
-    
+    """
+    Credit decisions for users. The scoring inputs of each user are loaded
+    once per manager, so an offer computed from several of these methods
+    costs the queries of a single score; call invalidate() after changing
+    a user's products. prefetch() loads many users in a fixed number of
+    queries.
+    """
+
+    def __init__(self):
+        self._contexts = {}
+
+    def scoring_context(self, user):
+        context = self._contexts.get(user.pk)
+        if context is None:
+            context = self._contexts[user.pk] = CreditScoringContext(user)
+        return context
+
+    def prefetch(self, users):
+        """
+        Load the scoring inputs of many users at once, with the grouped
+        queries of ScoringFeatures, and score them in one vectorized pass
+        """
+        missing = {}
+        for user in users:
+            if not self.scoring_context(user).loaded:
+                missing.setdefault(user.pk, user)
+        if not missing:
+            return
+        features = ScoringFeatures.load(missing.values())
+        scores = features.scores()
+        for i, user in enumerate(features.users):
+            self.scoring_context(user).fill(features, i, scores)
+
+    def score_users(self, users):
+        """The final score of each user, by primary key"""
+        users = list(users)
+        self.prefetch(users)
+        return {user.pk: self.calculate_credit_score(user) for user in users}
+
+    def invalidate(self, user=None):
+        """Forget the scoring inputs of a user, or of every user"""
+        if user is None:
+            self._contexts.clear()
+        else:
+            self._contexts.pop(user.pk, None)
+
     def get_detailed_credit_score(self, user):
         """
         Calculates the credit score and returns a detailed breakdown.
         """
-        breakdown = {'base_score': 400}
-        score = 400
-
-        # Account age factor
-        if user.date_joined:
-            account_age_days = (timezone.now().date() - user.date_joined.date()).days
-            age_bonus = min(account_age_days // 7, 100)
-            score += age_bonus
-            breakdown['account_age_bonus'] = age_bonus
-            breakdown['account_age_days'] = account_age_days
-
-        # Transaction history factor
-        transaction_count = user.transactions.count()
-        transaction_bonus = min(transaction_count * 5, 100)
-        score += transaction_bonus
-        breakdown['transaction_bonus'] = transaction_bonus
-        breakdown['transaction_count'] = transaction_count
-
-        # Balance factor
-        total_balance = user.cards.aggregate(Sum('balance'))['balance__sum'] or Decimal('0.0')
-        balance_bonus = 0
-        if total_balance >= 100000:
-            balance_bonus = 100
-        elif total_balance >= 50000:
-            balance_bonus = 50
-        elif total_balance >= 10000:
-            balance_bonus = 25
-        score += balance_bonus
-        breakdown['balance_bonus'] = balance_bonus
-        breakdown['current_balance'] = float(total_balance)
-
-        # Loan history
-        loan_penalty = 0
-        loan_bonus = 0
-        for loan in user.loans.all():
-            if loan.is_active:
-                loan_penalty += 20
-                if loan.next_payment_date and loan.next_payment_date < timezone.now().date():
-                    loan_penalty += 50
-            else:
-                loan_bonus += 75
-        score -= loan_penalty
-        score += loan_bonus
-        breakdown['loan_penalty'] = loan_penalty
-        breakdown['completed_loan_bonus'] = loan_bonus
-
-        # Mortgage history
-        for mortgage in user.mortgages.all():
-            if mortgage.is_active:
-                score += 30
-                if hasattr(user, 'card') and user.card.balance > 0:
-                    mortgage_to_balance_ratio = mortgage.total_amount / user.card.balance
-                    if mortgage_to_balance_ratio <= 3:
-                        score += 20
-            else:
-                score += 150 # Completed mortgage bonus
-        
-        # Recent transaction frequency
-        one_month_ago = timezone.now() - timedelta(days=30)
-        recent_transactions_count = user.transactions.filter(timestamp__gte=one_month_ago).count()
-        recent_bonus = 25 if recent_transactions_count >= 5 else 0
-        score += recent_bonus
-        breakdown['recent_activity_bonus'] = recent_bonus
-        breakdown['recent_transactions_count'] = recent_transactions_count
-        
-        final_score = max(0, min(1000, score))
-        breakdown['final_score'] = final_score
-        return breakdown
+        return dict(self.scoring_context(user).breakdown)
 
     def calculate_credit_score(self, user):
         # This now uses the detailed calculation but returns only the final score
-        return self.get_detailed_credit_score(user)['final_score']
+        return self.scoring_context(user).breakdown['final_score']
 
     def can_take_credit(self, user):
         return self.calculate_credit_score(user) >= 400
@@ -99,7 +298,7 @@ class CreditLogicManager:
         else:
             base_amount = Decimal('0')
 
-        total_balance = user.cards.aggregate(Sum('balance'))['balance__sum'] or Decimal('0.0')
+        total_balance = self.scoring_context(user).total_balance
         balance_multiplier = min(total_balance / Decimal('10000'), Decimal('2.0'))
         return base_amount * balance_multiplier
 
@@ -136,8 +335,7 @@ class CreditLogicManager:
     # --- Mortgage Logic ---
 
     def can_take_mortgage(self, user):
-        mortgages = user.mortgages.filter(is_active=True).count()
-        if mortgages > 0:
+        if self.scoring_context(user).active_mortgages > 0:
             return False  # Already has an active mortgage
         
         return self.calculate_credit_score(user) >= 600
@@ -157,7 +355,7 @@ class CreditLogicManager:
             base_multiplier = Decimal('0.0')
 
         # Using total balance as a proxy for annual income for simplicity
-        total_balance = user.cards.aggregate(Sum('balance'))['balance__sum'] or Decimal('0.0')
+        total_balance = self.scoring_context(user).total_balance
         max_amount = total_balance * 12 * base_multiplier # Assuming total balance is a monthly income proxy
         
         return min(max_amount, Decimal('10000000'))
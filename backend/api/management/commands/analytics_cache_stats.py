@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.services.analytics_cache_service import AnalyticsSnapshotService
+
+
+class Command(BaseCommand):
+    help = 'Report the hit ratio of the cached /api/analytics/ snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after reporting them')
+
+    def handle(self, *args, **options):
+        service = AnalyticsSnapshotService()
+        stats = service.stats()
+        ratio = 'n/a' if stats['hit_ratio'] is None else f"{stats['hit_ratio']:.1%}"
+        self.stdout.write(self.style.SUCCESS(f"{stats['hits']} hits, {stats['misses']} misses, hit ratio {ratio}."))
+        if options['reset']:
+            service.reset_stats()
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.services.retention_service import RetentionService
+from api.services.rollup_service import SOURCES
+
+
+class Command(BaseCommand):
+    help = 'Compact raw price ticks older than the retention period into candles and delete them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['currency', 'crypto', 'all'], default='all')
+        parser.add_argument('--days', type=int, help='Retention in days (default: PRICE_HISTORY_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=RetentionService.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the ticks that would be deleted')
+
+    def handle(self, *args, **options):
+        try:
+            service = RetentionService(days=options['days'], batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        sources = list(SOURCES) if options['source'] == 'all' else [options['source']]
+        self.stdout.write(f'Retention {service.days} days, cutoff {service.cutoff():%Y-%m-%d %H:%M}')
+        for source in sources:
+            result = service.apply(source, dry_run=options['dry_run'])
+            verb = 'would delete' if options['dry_run'] else 'deleted'
+            self.stdout.write(
+                f"{source}: {verb} {result['deleted']} ticks, dropped {result['dropped']} with partitions"
+            )
+        self.stdout.write(self.style.SUCCESS('Retention policy applied.'))
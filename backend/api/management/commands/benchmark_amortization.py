@@ -0,0 +1,54 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from api.services.amortization_service import AmortizationService
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the NumPy amortization schedule against a per-month Python loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--principal', type=float, default=4_000_000)
+        parser.add_argument('--annual-rate', type=float, default=7.0)
+        parser.add_argument('--term-years', type=int, default=30)
+        parser.add_argument('--repeat', type=int, default=1000, help='Runs per scenario')
+
+    def handle(self, *args, **options):
+        service = AmortizationService()
+        principal, annual_rate = options['principal'], options['annual_rate']
+        term_months = options['term_years'] * 12
+        scenarios = [
+            ('annuity', lambda: service.schedule(principal, annual_rate, term_months)),
+            ('extra monthly', lambda: service.schedule(principal, annual_rate, term_months, extra_monthly=principal / 400)),
+            ('3 lump sums, reduce_payment', lambda: service.schedule(
+                principal, annual_rate, term_months, strategy='reduce_payment',
+                lump_sums={12: principal / 10, 60: principal / 10, 120: principal / 10},
+            )),
+            ('python loop', lambda: loop_schedule(service, principal, annual_rate, term_months)),
+        ]
+
+        self.stdout.write(f'{term_months}-month schedule of {principal:,.0f} at {annual_rate}%, {options["repeat"]} runs')
+        header = f"{'scenario':<30}{'median ms':>11}{'best ms':>11}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, run in scenarios:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(f'{name:<30}{statistics.median(timings) * 1000:>11.3f}{min(timings) * 1000:>11.3f}')
+
+
+def loop_schedule(service, principal, annual_rate, term_months):
+    """The same annuity schedule, one Python iteration per month, for comparison"""
+    rate = annual_rate / 100 / 12
+    payment = service.annuity_payment(principal, annual_rate, term_months)
+    balance = principal
+    rows = []
+    for month in range(1, term_months + 1):
+        interest = balance * rate
+        paid = payment if month < term_months else balance + interest
+        balance = balance + interest - paid
+        rows.append((month, round(paid, 2), round(interest, 2), round(paid - interest, 2), round(balance, 2)))
+    return rows
@@ -0,0 +1,122 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api.models import Card, LedgerPosting, User
+
+# Phone and card number prefixes of the seeded users, never handed out to
+# real customers
+PHONE_PREFIX = '+7001'
+CARD_PREFIX = '9001'
+AMOUNT = Decimal('10.00')
+
+
+class Command(BaseCommand):
+    help = 'Compare /api/transfers/batch/ with the same payouts posted to /api/transfers/ one by one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=1000)
+        parser.add_argument('--by-phone', action='store_true', help='Address recipients by phone number')
+
+    def handle(self, *args, **options):
+        payer, source, recipients = self.seed(options['recipients'])
+        key = 'phone_number' if options['by_phone'] else 'card_number'
+        identifiers = [
+            recipient.owner.phone_number if key == 'phone_number' else recipient.card_number
+            for recipient in recipients
+        ]
+        client = APIClient()
+        client.force_authenticate(user=payer)
+
+        # One untimed request of each kind first, so neither side pays for
+        # what the first request of a process loads
+        self.transfer(client, source, identifiers[0])
+        client.post(reverse('transfers-batch'), {
+            'source_card_id': str(source.id),
+            'transfers': [{'recipient': identifiers[0], 'amount': str(AMOUNT)}],
+        }, format='json')
+
+        loop_queries = QueryCounter()
+        with connection.execute_wrapper(loop_queries):
+            started = time.perf_counter()
+            for identifier in identifiers:
+                self.transfer(client, source, identifier)
+            loop_elapsed = time.perf_counter() - started
+
+        rows = [{'recipient': identifier, 'amount': str(AMOUNT)} for identifier in identifiers]
+        batch_queries = QueryCounter()
+        with connection.execute_wrapper(batch_queries):
+            started = time.perf_counter()
+            response = client.post(reverse('transfers-batch'), {
+                'source_card_id': str(source.id),
+                'transfers': rows,
+            }, format='json')
+            batch_elapsed = time.perf_counter() - started
+
+        failed = response.data.get('failed', len(rows))
+        self.stdout.write(f"{len(rows)} payouts by {key}")
+        self.stdout.write(f"{'loop':<8}{loop_queries.count:>9} queries{loop_elapsed * 1000:>12.1f} ms")
+        self.stdout.write(f"{'batch':<8}{batch_queries.count:>9} queries{batch_elapsed * 1000:>12.1f} ms")
+        self.stdout.write(f"Speedup {loop_elapsed / batch_elapsed:.1f}x, {failed} batch rows failed")
+
+        self.stdout.write(f'Removed {self.clean()} benchmark rows')
+
+    def clean(self):
+        card_ids = list(Card.objects.filter(
+            card_number__startswith=CARD_PREFIX, owner__phone_number__startswith=PHONE_PREFIX
+        ).values_list('id', flat=True))
+        deleted, _ = User.objects.filter(phone_number__startswith=PHONE_PREFIX).delete()
+        # Postings outlive their cards: drop the journals the cards took part
+        # in, closing ones included, or each run grows the ledger
+        journals = LedgerPosting.objects.filter(card_id__in=card_ids).values('journal_id')
+        postings, _ = LedgerPosting.objects.filter(journal_id__in=journals).delete()
+        return deleted + postings
+
+    def transfer(self, client, source, identifier):
+        client.post(reverse('transfers'), {
+            'source_card_id': str(source.id),
+            'target_card_number': identifier,
+            'amount': str(AMOUNT),
+        }, format='json')
+
+    def seed(self, count):
+        self.clean()
+        payer = User.objects.create_user(phone_number=f'{PHONE_PREFIX}{0:07d}', first_name='Payroll', last_name='Payer')
+        source = Card.objects.create(
+            owner=payer,
+            card_name='Payroll',
+            card_number=f'{CARD_PREFIX}{0:012d}',
+            balance=AMOUNT * (count + 1) * 2,
+            card_expiry_date=Card.generate_expiration_date(),
+            cvv='000',
+        )
+        users = User.objects.bulk_create([
+            User(phone_number=f'{PHONE_PREFIX}{i:07d}', first_name='Employee', last_name=str(i))
+            for i in range(1, count + 1)
+        ])
+        cards = [
+            Card(
+                owner=user,
+                card_name='Salary',
+                card_number=f'{CARD_PREFIX}{i:012d}',
+                card_number_normalized=f'{CARD_PREFIX}{i:012d}',
+                card_expiry_date=Card.generate_expiration_date(),
+                cvv='000',
+            )
+            for i, user in enumerate(users, start=1)
+        ]
+        Card.objects.bulk_create(cards)
+        return payer, source, Card.objects.filter(owner__in=users).select_related('owner').order_by('card_number')
+
+
+class QueryCounter:
+    """Counts queries without keeping them, unlike CaptureQueriesContext"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
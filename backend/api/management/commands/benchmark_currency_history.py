@@ -0,0 +1,103 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from api.models import Currency, CurrencyHistory, CurrencyHistoryRollup
+from api.services.history_service import CurrencyHistoryService, PERIODS
+from api.services.rollup_service import RollupService
+from api.services.synthetic_history_service import SyntheticHistoryService
+
+# ISO 4217 code reserved for testing, never collides with a real currency
+BENCHMARK_CURRENCY = 'XTS'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the currency history endpoint against a large CurrencyHistory table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000, help='Number of ticks to seed')
+        parser.add_argument('--days', type=int, default=365, help='Time span covered by the seeded ticks')
+        parser.add_argument('--batch-size', type=int, default=20_000)
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per period, the best one is reported')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse ticks seeded by a previous run')
+        parser.add_argument('--keep', action='store_true', help='Do not delete the seeded ticks afterwards')
+        parser.add_argument('--skip-legacy', action='store_true', help='Do not run the per-bucket implementation')
+
+    def handle(self, *args, **options):
+        currency, _ = Currency.objects.get_or_create(
+            code=BENCHMARK_CURRENCY, defaults={'name': 'Benchmark Currency'}
+        )
+        now = timezone.now()
+
+        if not options['skip_seed']:
+            self.seed(currency, now, options['rows'], options['days'], options['batch_size'])
+            started = time.perf_counter()
+            candles = RollupService().refresh('currency', asset_ids=[currency.pk], full=True)
+            self.stdout.write(f'Built {candles} candles in {time.perf_counter() - started:.1f}s')
+
+        total = CurrencyHistory.objects.filter(currency=currency).count()
+        self.stdout.write(f'{BENCHMARK_CURRENCY} has {total} ticks')
+
+        service = CurrencyHistoryService()
+        header = f"{'period':<8}{'implementation':<16}{'queries':>9}{'best ms':>11}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for period in PERIODS:
+            runs = [(service.choose_strategy(period), lambda: service.get_points(currency, period, now=now))]
+            if not options['skip_legacy']:
+                runs.append(('per-bucket', lambda: legacy_points(currency, period, now)))
+
+            for name, run in runs:
+                queries, best = self.measure(run, options['repeat'])
+                self.stdout.write(f'{period:<8}{name:<16}{queries:>9}{best * 1000:>11.2f}')
+
+        if not options['keep']:
+            deleted, _ = CurrencyHistory.objects.filter(currency=currency).delete()
+            CurrencyHistoryRollup.objects.filter(currency=currency).delete()
+            currency.delete()
+            self.stdout.write(f'Removed {deleted} benchmark rows')
+
+    def seed(self, currency, now, rows, days, batch_size):
+        self.stdout.write(f'Seeding {rows} ticks over {days} days...')
+        started = time.perf_counter()
+        step = timedelta(days=days) / rows
+        service = SyntheticHistoryService(chunk_size=batch_size)
+        service.generate_asset('currency', currency.pk, 75.0, now - timedelta(days=days), now, step)
+        self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+    def measure(self, run, repeat):
+        best = None
+        queries = 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - started
+            queries = len(ctx.captured_queries)
+            best = elapsed if best is None else min(best, elapsed)
+        return queries, best
+
+
+def legacy_points(currency, period, now):
+    """The original per-bucket implementation, kept for comparison only"""
+    spec = PERIODS[period]
+    start = now - spec['window']
+    history = CurrencyHistory.objects.filter(
+        currency=currency, timestamp__gte=start
+    ).order_by('timestamp')
+
+    points = []
+    for i in range(spec['buckets']):
+        bucket_start = start + spec['width'] * i
+        bucket = history.filter(timestamp__gte=bucket_start, timestamp__lt=bucket_start + spec['width'])
+        tick = bucket.first() if spec['pick'] == 'first' else bucket.last()
+        if not tick:
+            tick = history.filter(timestamp__lt=bucket_start).last()
+        points.append({
+            'timestamp': spec['label'](i, bucket_start),
+            'rate': float(tick.rate) if tick else 0,
+        })
+    return points
@@ -0,0 +1,73 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.services.rollup_service import RollupService
+from api.services.snapshot_service import CurrencySnapshotService
+from api.services.synthetic_history_service import SyntheticHistoryService, SOURCES
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic minute-level price history for currencies and cryptocurrencies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['currency', 'crypto', 'all'], default='all')
+        parser.add_argument('--assets', nargs='+', help='Currency codes / crypto ids (default: all)')
+        parser.add_argument('--days', type=int, default=365, help='Length of the generated range, ending now')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between ticks')
+        parser.add_argument('--volatility', type=float, help='Annualized volatility (default depends on the source)')
+        parser.add_argument('--seed', type=int, help='Seed of the random walk')
+        parser.add_argument('--method', choices=['auto', 'bulk', 'copy'], default='auto',
+                            help='auto uses COPY on PostgreSQL and bulk_create elsewhere')
+        parser.add_argument('--chunk-size', type=int, default=SyntheticHistoryService.CHUNK_SIZE)
+        parser.add_argument('--replace', action='store_true', help='Delete existing ticks in the range first')
+        parser.add_argument('--skip-existing', action='store_true',
+                            help='Keep existing ticks and skip colliding ones (uses bulk_create)')
+        parser.add_argument('--skip-rollups', action='store_true', help='Do not rebuild candles and snapshots')
+
+    def handle(self, *args, **options):
+        interval = timedelta(seconds=options['interval'])
+        end = timezone.now().replace(second=0, microsecond=0)
+        start = end - timedelta(days=options['days'])
+        sources = list(SOURCES) if options['source'] == 'all' else [options['source']]
+
+        service = SyntheticHistoryService(
+            seed=options['seed'], method=options['method'], chunk_size=options['chunk_size']
+        )
+        started = time.perf_counter()
+        total = 0
+
+        for source in sources:
+            config = SOURCES[source]
+            prices = service.start_prices(source, options['assets'])
+            existing = config['tick_model'].objects.filter(
+                timestamp__gte=start, timestamp__lt=end,
+                **{f"{config['asset_field']}__in": list(prices)},
+            )
+            if options['replace']:
+                deleted, _ = existing.delete()
+                self.stdout.write(f'Removed {deleted} existing {source} ticks')
+            elif not options['skip_existing'] and existing.exists():
+                raise CommandError(
+                    f'{source} ticks already exist in the range, use --replace or --skip-existing'
+                )
+
+            for asset_id, price in prices.items():
+                asset_started = time.perf_counter()
+                written = service.generate_asset(
+                    source, asset_id, price, start, end, interval,
+                    volatility=options['volatility'], ignore_conflicts=options['skip_existing'],
+                )
+                elapsed = time.perf_counter() - asset_started
+                total += written
+                self.stdout.write(f'{source} {asset_id}: {written} ticks in {elapsed:.1f}s')
+
+            if not options['skip_rollups']:
+                RollupService().refresh(source, asset_ids=list(prices), since=start)
+                if source == 'currency':
+                    CurrencySnapshotService().refresh(codes=list(prices))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total} ticks in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)'
+        ))
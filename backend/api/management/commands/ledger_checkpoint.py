@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.services.ledger_service import LedgerService
+
+
+class Command(BaseCommand):
+    help = 'Checkpoint card balances in the ledger and optionally audit Card.balance against it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Fail when a card balance differs from the ledger')
+
+    def handle(self, *args, **options):
+        service = LedgerService()
+        written = service.checkpoint()
+        self.stdout.write(f'Wrote {written} checkpoints')
+
+        if options['verify']:
+            discrepancies = service.discrepancies()
+            for card_id, balance, ledger_balance in discrepancies:
+                self.stdout.write(f'{card_id}: card {balance}, ledger {ledger_balance}')
+            if discrepancies:
+                raise CommandError(f'{len(discrepancies)} cards differ from the ledger')
+            self.stdout.write('Every card balance matches the ledger')
+        self.stdout.write(self.style.SUCCESS('Ledger checkpoint complete.'))
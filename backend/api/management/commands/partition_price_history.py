@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.services.partition_service import PartitionService
+from api.services.rollup_service import SOURCES
+
+
+class Command(BaseCommand):
+    help = (
+        'Partition the raw price-history tables by month (PostgreSQL only). '
+        'The conversion copies every row while holding a lock on the table, '
+        'run it in a maintenance window.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['currency', 'crypto', 'all'], default='all')
+        parser.add_argument('--months-ahead', type=int, default=2, help='Future monthly partitions to create')
+
+    def handle(self, *args, **options):
+        service = PartitionService()
+        if not service.is_supported():
+            raise CommandError('Partitioning requires PostgreSQL')
+
+        sources = list(SOURCES) if options['source'] == 'all' else [options['source']]
+        for source in sources:
+            model = SOURCES[source]['tick_model']
+            if service.convert(model, months_ahead=options['months_ahead']):
+                self.stdout.write(f'{model._meta.db_table}: converted to monthly partitions')
+            else:
+                service.ensure_partitions(model, timezone.now(), service.horizon(options['months_ahead']))
+                self.stdout.write(f'{model._meta.db_table}: already partitioned, future partitions ensured')
+        self.stdout.write(self.style.SUCCESS('Done.'))
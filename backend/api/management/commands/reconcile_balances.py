@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api.services.balance_service import BalanceReconciliationService
+
+
+class Command(BaseCommand):
+    help = 'Detect and repair users whose total_balance drifted from their cards and deposits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drifted users')
+
+    def handle(self, *args, **options):
+        count = BalanceReconciliationService().reconcile(dry_run=options['dry_run'])
+        verb = 'drifted' if options['dry_run'] else 'corrected'
+        self.stdout.write(self.style.SUCCESS(f'{count} accounts {verb}.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from api.services.credit_score_service import CreditScoreService
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored credit scores that are dirty or were scored on an earlier day'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check-watermarks', action='store_true',
+            help='Also recompute scores with transactions newer than their watermark',
+        )
+
+    def handle(self, *args, **options):
+        refreshed = CreditScoreService().refresh(check_watermarks=options['check_watermarks'])
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {refreshed} credit scores.'))
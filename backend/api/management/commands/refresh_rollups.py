@@ -0,0 +1,27 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.services.rollup_service import RollupService, SOURCES
+
+
+class Command(BaseCommand):
+    help = 'Roll raw price ticks up into hourly, daily and monthly OHLC candles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=[*SOURCES, 'all'], default='all')
+        parser.add_argument('--since', help='Rebuild candles from this date (YYYY-MM-DD), e.g. after a backfill')
+        parser.add_argument('--full', action='store_true', help='Rebuild every candle from the first tick')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = timezone.make_aware(datetime.strptime(options['since'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError('--since must be in YYYY-MM-DD format')
+
+        service = RollupService()
+        sources = SOURCES if options['source'] == 'all' else [options['source']]
+        for source in sources:
+            written = service.refresh(source, since=since, full=options['full'])
+            self.stdout.write(self.style.SUCCESS(f'{source}: {written} candles written'))
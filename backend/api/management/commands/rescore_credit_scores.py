@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from api.services.credit_score_service import CreditScoreService, RESCORE_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Recompute and store the credit score of every user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=RESCORE_CHUNK_SIZE, help='Users per chunk')
+
+    def handle(self, *args, **options):
+        stats = CreditScoreService().rescore_all(chunk_size=options['chunk_size'])
+        self.stdout.write(
+            f"{stats['users']} users in {stats['chunks']} chunks, {stats['seconds']}s"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rescored at {stats['users_per_second']} users/s."))
@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from api.models import Card, User
+from api.services.transfer_service import TransferService
+
+# Phone and card number prefixes of the seeded users, never handed out to
+# real customers
+PHONE_PREFIX = '+7000'
+CARD_PREFIX = '9000'
+INITIAL_BALANCE = Decimal('1000000.00')
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent transfers between a few cards and check that no update is lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=4, help='Number of seeded cards, fewer means more contention')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--transfers', type=int, default=200, help='Transfers per thread')
+        parser.add_argument('--retries', type=int, default=5, help='Attempts per transfer on lock errors')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible runs')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        cards = self.seed(options['cards'])
+        plans = [
+            [self.plan(rng, cards) for _ in range(options['transfers'])]
+            for _ in range(options['threads'])
+        ]
+
+        expected = Counter()
+        failures = Counter()
+        lock = threading.Lock()
+
+        def worker(plan):
+            service = TransferService()
+            moved = Counter()
+            failed = Counter()
+            try:
+                for source, target, amount in plan:
+                    for attempt in range(options['retries']):
+                        try:
+                            service.transfer(source.owner, source.id, target.card_number, amount)
+                        except OperationalError:
+                            # SQLite reports lock contention instead of waiting
+                            failed['retried'] += 1
+                            time.sleep(0.001 * (attempt + 1))
+                            continue
+                        moved[source.id] -= amount
+                        moved[target.id] += amount
+                        break
+                    else:
+                        failed['gave_up'] += 1
+            finally:
+                connection.close()
+            with lock:
+                expected.update(moved)
+                failures.update(failed)
+
+        threads = [threading.Thread(target=worker, args=(plan,)) for plan in plans]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        completed = sum(len(plan) for plan in plans) - failures['gave_up']
+        self.stdout.write(
+            f"{completed} transfers in {elapsed:.2f}s with {options['threads']} threads "
+            f"on {len(cards)} cards: {completed / elapsed:.1f} transfers/s "
+            f"({failures['retried']} retries, {failures['gave_up']} given up)"
+        )
+
+        lost = []
+        for card in Card.objects.filter(id__in=[card.id for card in cards]):
+            wanted = INITIAL_BALANCE + expected[card.id]
+            if card.balance != wanted:
+                lost.append(f"{card.card_number}: {card.balance} != {wanted}")
+        User.objects.filter(phone_number__startswith=PHONE_PREFIX).delete()
+
+        if lost:
+            raise CommandError('Lost updates detected:\n' + '\n'.join(lost))
+        self.stdout.write(self.style.SUCCESS('No lost updates'))
+
+    def seed(self, count):
+        User.objects.filter(phone_number__startswith=PHONE_PREFIX).delete()
+        cards = []
+        for i in range(count):
+            user = User.objects.create_user(
+                phone_number=f'{PHONE_PREFIX}{i:07d}',
+                first_name='Stress',
+                last_name=f'User {i}',
+            )
+            cards.append(Card.objects.create(
+                owner=user,
+                card_name='Stress test',
+                card_number=f'{CARD_PREFIX}{i:012d}',
+                balance=INITIAL_BALANCE,
+                card_expiry_date=Card.generate_expiration_date(),
+                cvv='000',
+            ))
+        return cards
+
+    def plan(self, rng, cards):
+        source, target = rng.sample(cards, 2)
+        return source, target, Decimal(rng.randint(1, 10000)) / 100
@@ -0,0 +1,135 @@
+"""
+Per-request SQL query accounting and query budgets
+"""
+import logging
+import re
+import time
+from collections import Counter
+from django.conf import settings
+from django.db import connection
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+# Literals inlined into raw SQL, and the placeholder lists of IN (...)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+
+
+class QueryBudgetExceeded(Exception):
+    """A view ran more queries than its declared query_budget"""
+
+
+def sql_shape(sql):
+    """
+    The SQL with its literals and the length of its IN lists removed, so
+    that the same query run for different rows has the same shape
+    """
+    shape = _STRING_LITERAL.sub('?', sql)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(...)', shape)
+    return shape
+
+
+def declared_query_budget(view_func, method):
+    """
+    The query_budget of a view: an int for every method, or a dict from
+    HTTP method to int. None when the view declares none.
+    """
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(method)
+    return budget
+
+
+class QueryStats:
+    """
+    Counts the queries run through connection.execute_wrapper(). With
+    record_sql it also keeps their SQL, shaped only when shapes are read.
+    """
+
+    def __init__(self, record_sql=True):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = [] if record_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            if self.statements is not None:
+                self.statements.append(sql)
+
+    @cached_property
+    def shapes(self):
+        """Counter of the shapes of the recorded queries, empty without record_sql"""
+        return Counter(sql_shape(sql) for sql in self.statements or ())
+
+    @property
+    def duration_ms(self):
+        return round(self.duration * 1000, 2)
+
+    def repeated(self, threshold):
+        """(shape, count) of the shapes run at least threshold times, most frequent first"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the queries and the database time of each request.
+
+    The counts are left on the response as response.query_stats and, when
+    QUERY_INSPECTOR_HEADERS is on (DEBUG by default), sent as X-DB-Queries,
+    X-DB-Time-ms and X-DB-Repeated-Queries, with a log line for every query
+    shape repeated QUERY_REPEAT_THRESHOLD times or more: the usual sign of
+    an N+1.
+
+    A view may declare a query_budget: the queries a request may run,
+    authentication included, as an int or a dict from HTTP method to int.
+    A request that exceeds it is logged, or raises QueryBudgetExceeded when
+    QUERY_BUDGET_ENFORCE is on, as it is under the test runner.
+
+    The SQL of each query is kept, for the repeated query checks, only when
+    the headers or the enforcement are on: otherwise a request costs a
+    counter and a timer.
+
+    The body of a streaming response is produced after the middleware
+    returns, so its queries are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats(record_sql=settings.QUERY_INSPECTOR_HEADERS or settings.QUERY_BUDGET_ENFORCE)
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+        response.query_stats = stats
+        response.query_budget = getattr(request, 'query_budget', None)
+        self.report(request, response, stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = declared_query_budget(view_func, request.method)
+
+    def report(self, request, response, stats):
+        endpoint = f"{request.method} {request.path}"
+        if settings.QUERY_INSPECTOR_HEADERS:
+            repeated = stats.repeated(settings.QUERY_REPEAT_THRESHOLD)
+            response['X-DB-Queries'] = str(stats.count)
+            response['X-DB-Time-ms'] = str(stats.duration_ms)
+            response['X-DB-Repeated-Queries'] = str(len(repeated))
+            for shape, count in repeated:
+                logger.warning(f"{endpoint} ran the same query {count} times, possible N+1: {shape[:300]}")
+
+        budget = response.query_budget
+        if budget is not None and stats.count > budget:
+            message = f"{endpoint} ran {stats.count} queries, over its budget of {budget}"
+            if settings.QUERY_BUDGET_ENFORCE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
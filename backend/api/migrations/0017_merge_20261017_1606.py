@@ -0,0 +1,14 @@
+# Generated by Django 4.2.7 on 2026-10-17 16:06
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_create_admin_user'),
+        ('api', '0016_remove_card_card_expiry_and_more'),
+    ]
+
+    operations = [
+    ]
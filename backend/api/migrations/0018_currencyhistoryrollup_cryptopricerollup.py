@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-17 16:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_merge_20261017_1606'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyHistoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('bucket_start', models.DateTimeField(help_text='UTC start of the hour/day/month')),
+                ('open', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('high', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('low', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('close', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('ticks', models.IntegerField(default=0, help_text='Number of raw ticks in the bucket')),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='api.currency')),
+            ],
+            options={
+                'verbose_name': 'Currency History Rollup',
+                'verbose_name_plural': 'Currency History Rollups',
+                'ordering': ['-bucket_start'],
+                'unique_together': {('currency', 'resolution', 'bucket_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CryptoPriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('bucket_start', models.DateTimeField(help_text='UTC start of the hour/day/month')),
+                ('open', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('high', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('low', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('close', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('market_cap', models.BigIntegerField(default=0)),
+                ('volume_24h', models.BigIntegerField(default=0)),
+                ('ticks', models.IntegerField(default=0, help_text='Number of raw ticks in the bucket')),
+                ('cryptocurrency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_rollups', to='api.cryptocurrency')),
+            ],
+            options={
+                'verbose_name': 'Crypto Price Rollup',
+                'verbose_name_plural': 'Crypto Price Rollups',
+                'ordering': ['-bucket_start'],
+                'unique_together': {('cryptocurrency', 'resolution', 'bucket_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-17 16:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_snapshots(apps, schema_editor):
+    Currency = apps.get_model('api', 'Currency')
+    CurrencyHistory = apps.get_model('api', 'CurrencyHistory')
+    CurrencyRateSnapshot = apps.get_model('api', 'CurrencyRateSnapshot')
+
+    latest = CurrencyHistory.objects.filter(currency=OuterRef('pk')).order_by('-timestamp')
+    rows = (
+        Currency.objects
+        .annotate(
+            rate=Subquery(latest.values('rate')[:1]),
+            previous_rate=Subquery(latest.values('rate')[1:2]),
+            timestamp=Subquery(latest.values('timestamp')[:1]),
+        )
+        .filter(rate__isnull=False)
+        .values('code', 'rate', 'previous_rate', 'timestamp')
+    )
+    CurrencyRateSnapshot.objects.bulk_create([
+        CurrencyRateSnapshot(
+            currency_id=row['code'],
+            rate=row['rate'],
+            previous_rate=row['previous_rate'],
+            timestamp=row['timestamp'],
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_currencyhistoryrollup_cryptopricerollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyRateSnapshot',
+            fields=[
+                ('currency', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='api.currency')),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('previous_rate', models.DecimalField(blank=True, decimal_places=10, max_digits=20, null=True)),
+                ('timestamp', models.DateTimeField(help_text='The timestamp of the latest rate')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Currency Rate Snapshot',
+                'verbose_name_plural': 'Currency Rate Snapshots',
+            },
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 16:17
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_rates(apps, schema_editor):
+    """Keep a single row per (currency, timestamp) before adding the constraint"""
+    CurrencyHistory = apps.get_model('api', 'CurrencyHistory')
+    duplicates = (
+        CurrencyHistory.objects
+        .values('currency', 'timestamp')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for row in list(duplicates):
+        rates = CurrencyHistory.objects.filter(currency=row['currency'], timestamp=row['timestamp'])
+        extra = list(rates.values_list('id', flat=True)[1:])
+        CurrencyHistory.objects.filter(id__in=extra).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_currencyratesnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_rates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='currencyhistory',
+            constraint=models.UniqueConstraint(fields=('currency', 'timestamp'), name='unique_currency_history_timestamp'),
+        ),
+        # The unique index covers (currency, timestamp) lookups
+        migrations.RemoveIndex(
+            model_name='currencyhistory',
+            name='api_currenc_currenc_5d2c95_idx',
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:15
+
+from django.db import migrations, models
+
+
+def backfill_normalized_numbers(apps, schema_editor):
+    """
+    Store the digits-only card number of every existing card.
+
+    Transfers find a card by its normalized number only, so two cards that
+    differ by spacing alone cannot both be kept: the migration stops and
+    lists them, to be merged or renumbered before it is run again.
+    """
+    Card = apps.get_model('api', 'Card')
+    by_number = {}
+    cards = []
+    for card in Card.objects.order_by('card_issue_date', 'id').only('id', 'card_number').iterator():
+        normalized = ''.join(ch for ch in card.card_number if ch.isdigit()) or None
+        if normalized is None:
+            continue
+        by_number.setdefault(normalized, []).append(card.pk)
+        card.card_number_normalized = normalized
+        cards.append(card)
+
+    duplicates = {number: ids for number, ids in by_number.items() if len(ids) > 1}
+    if duplicates:
+        listing = '; '.join(', '.join(str(pk) for pk in ids) for ids in duplicates.values())
+        raise RuntimeError(
+            f"{len(duplicates)} card numbers are stored more than once with different spacing. "
+            f"Merge or renumber these cards, then migrate again: {listing}"
+        )
+    Card.objects.bulk_update(cards, ['card_number_normalized'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_currencyhistory_unique_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='card_number_normalized',
+            field=models.CharField(editable=False, max_length=19, null=True),
+        ),
+        migrations.RunPython(backfill_normalized_numbers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='card',
+            name='card_number_normalized',
+            field=models.CharField(editable=False, max_length=19, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+def open_existing_balances(apps, schema_editor):
+    """Post the current balance of every card as its opening balance"""
+    Card = apps.get_model('api', 'Card')
+    LedgerPosting = apps.get_model('api', 'LedgerPosting')
+    postings = []
+    for card_id, balance in Card.objects.exclude(balance=0).values_list('id', 'balance').iterator():
+        journal_id = uuid.uuid4()
+        postings.append(LedgerPosting(journal_id=journal_id, kind='opening', account='card', card_id=card_id, amount=balance))
+        postings.append(LedgerPosting(journal_id=journal_id, kind='opening', account='opening_balances', amount=-balance))
+    LedgerPosting.objects.bulk_create(postings, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerPosting',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('journal_id', models.UUIDField(db_index=True, help_text='Postings of one movement share a journal')),
+                ('kind', models.CharField(choices=[('transfer', 'Transfer'), ('crypto_buy', 'Crypto buy'), ('crypto_sell', 'Crypto sell'), ('adjustment', 'Admin adjustment'), ('opening', 'Opening balance'), ('closing', 'Closing balance')], max_length=20)),
+                ('account', models.CharField(choices=[('card', 'Card'), ('crypto_settlement', 'Crypto settlement'), ('fees', 'Fees'), ('adjustments', 'Admin adjustments'), ('opening_balances', 'Opening and closing balances')], default='card', max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Positive credits the account, negative debits it', max_digits=15)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('card', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='postings', to='api.card')),
+                ('counterparty_card', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.card')),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='postings', to='api.transaction')),
+            ],
+            options={
+                'verbose_name': 'Ledger Posting',
+                'verbose_name_plural': 'Ledger Postings',
+                'indexes': [models.Index(fields=['card', 'id'], name='ledger_card_id_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_posting_id', models.BigIntegerField()),
+                ('as_of', models.DateTimeField(help_text='created_at of the last posting included')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('card', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='ledger_checkpoints', to='api.card')),
+            ],
+            options={
+                'verbose_name': 'Ledger Checkpoint',
+                'verbose_name_plural': 'Ledger Checkpoints',
+                'indexes': [models.Index(fields=['card', 'last_posting_id'], name='ledger_checkpoint_card_idx')],
+            },
+        ),
+        migrations.RunPython(open_existing_balances, migrations.RunPython.noop),
+    ]
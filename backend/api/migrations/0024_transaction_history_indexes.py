@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='transaction_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'transaction_type', '-timestamp', '-id'], name='transaction_user_type_idx'),
+        ),
+    ]
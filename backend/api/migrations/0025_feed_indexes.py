@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_transaction_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aichat',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='aichat_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cryptotransaction',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='cryptotx_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forumcomment',
+            index=models.Index(fields=['post', 'created_at', 'id'], name='forumcomment_post_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forumpost',
+            index=models.Index(fields=['-is_pinned', '-created_at', '-id'], name='forumpost_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='predictionpost',
+            index=models.Index(fields=['-created_at', '-id'], name='predictionpost_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:38
+
+from datetime import timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def build_rollups(apps, schema_editor):
+    """Roll up the existing transactions"""
+    Transaction = apps.get_model('api', 'Transaction')
+    TransactionMonthlyRollup = apps.get_model('api', 'TransactionMonthlyRollup')
+    rows = (
+        Transaction.objects
+        .annotate(month=TruncMonth('timestamp', output_field=models.DateField(), tzinfo=timezone.utc))
+        .values('user_id', 'month', 'transaction_type')
+        .annotate(count=Count('id'), total=Sum('amount'))
+        .order_by()
+    )
+    TransactionMonthlyRollup.objects.bulk_create(
+        (TransactionMonthlyRollup(**row) for row in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the UTC month')),
+                ('transaction_type', models.SmallIntegerField(choices=[(0, 'Expense'), (1, 'Income')])),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, help_text='Sum of the signed amounts', max_digits=17)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Transaction Monthly Rollup',
+                'verbose_name_plural': 'Transaction Monthly Rollups',
+                'ordering': ['-month'],
+                'unique_together': {('user', 'month', 'transaction_type')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_transactionmonthlyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditScore',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='credit_score_record', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('final_score', models.IntegerField()),
+                ('breakdown', models.JSONField(help_text='As returned by CreditLogicManager.get_detailed_credit_score')),
+                ('transaction_count', models.IntegerField(default=0, help_text='Input watermark: transactions scored')),
+                ('last_transaction_at', models.DateTimeField(blank=True, help_text='Input watermark: latest transaction scored', null=True)),
+                ('scored_on', models.DateField()),
+                ('computed_at', models.DateTimeField(help_text='When the inputs were read')),
+                ('dirty_at', models.DateTimeField(blank=True, help_text='Last write to the inputs', null=True)),
+            ],
+            options={
+                'verbose_name': 'Credit Score',
+                'verbose_name_plural': 'Credit Scores',
+            },
+        ),
+    ]
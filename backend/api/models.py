@@ -1,11 +1,15 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.contrib.auth.hashers import make_password, check_password
-from django.db import models
+from django.db import connections, models, router, transaction as db_transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import uuid
 import random
 import string
-from datetime import date, timedelta
+from datetime import date, timedelta, timezone as dt_timezone
+from decimal import Decimal
 
 class UserManager(BaseUserManager):
     """Define a model manager for User model with no username field."""
@@ -36,6 +40,13 @@ class UserManager(BaseUserManager):
 
         return self._create_user(phone_number, password, **extra_fields)
 
+    def adjust_total_balance(self, user_id, delta):
+        """Atomically add delta to a user's total_balance without reading it first."""
+        delta = Decimal(str(delta))
+        if not delta:
+            return 0
+        return self.filter(pk=user_id).update(total_balance=models.F('total_balance') + delta)
+
 
 class User(AbstractUser):
     username = None # We use phone_number instead
@@ -69,6 +80,16 @@ class User(AbstractUser):
         # The default card is the first one created.
         return self.cards.order_by('card_issue_date').first()
     
+    def adjust_total_balance(self, delta):
+        """
+        Apply a change of one of the user's card or deposit balances to
+        total_balance with a single UPDATE, instead of re-aggregating every
+        card and deposit like update_total_balance does.
+        """
+        delta = Decimal(str(delta))
+        User.objects.adjust_total_balance(self.pk, delta)
+        self.total_balance = Decimal(str(self.total_balance)) + delta
+
     def update_total_balance(self):
         """Update total balance based on all cards and active deposits"""
         from django.db.models import Sum
@@ -100,15 +121,141 @@ class Transaction(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     transaction_type = models.SmallIntegerField(choices=TRANSACTION_TYPES, default=0)
 
+    class Meta:
+        # Match the history ordering (-timestamp, -id), with and without
+        # the type filter, so every page is an index range scan
+        indexes = [
+            models.Index(fields=['user', '-timestamp', '-id'], name='transaction_user_time_idx'),
+            models.Index(fields=['user', 'transaction_type', '-timestamp', '-id'], name='transaction_user_type_idx'),
+        ]
+
     def __str__(self):
         return f'{self.title} ({self.get_transaction_type_display()}) - {self.amount}'
 
 
+class TransactionMonthlyRollup(models.Model):
+    """
+    Number and sum of a user's transactions of one type in one UTC month,
+    kept up to date as transactions are written so analytics read a few
+    rows instead of the whole history.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transaction_rollups')
+    month = models.DateField(help_text="First day of the UTC month")
+    transaction_type = models.SmallIntegerField(choices=Transaction.TRANSACTION_TYPES)
+    count = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=17, decimal_places=2, default=0, help_text="Sum of the signed amounts")
+
+    class Meta:
+        ordering = ['-month']
+        unique_together = ['user', 'month', 'transaction_type']
+        verbose_name = "Transaction Monthly Rollup"
+        verbose_name_plural = "Transaction Monthly Rollups"
+
+    def __str__(self):
+        return f"{self.user_id} {self.month:%Y-%m} {self.get_transaction_type_display()}: {self.count} / {self.total}"
+
+    @staticmethod
+    def _deltas(transactions):
+        """{(user_id, month, type): [count, total]} of saved transactions"""
+        deltas = {}
+        # A batch shares one timestamp: its month is computed once
+        months = {}
+        for record in transactions:
+            month = months.get(record.timestamp)
+            if month is None:
+                month = months[record.timestamp] = record.timestamp.astimezone(dt_timezone.utc).date().replace(day=1)
+            key = (record.user_id, month, record.transaction_type)
+            delta = deltas.setdefault(key, [0, Decimal('0')])
+            delta[0] += 1
+            delta[1] += Decimal(str(record.amount))
+        return deltas
+
+    @classmethod
+    def add(cls, transactions):
+        """
+        Count new transactions with an INSERT ... ON CONFLICT DO UPDATE that
+        increments existing rows, in key order so concurrent writers lock
+        the rows in the same order.
+        """
+        deltas = sorted(cls._deltas(transactions).items())
+        if not deltas:
+            return
+        db = connections[router.db_for_write(cls)]
+        qn = db.ops.quote_name
+        table = qn(cls._meta.db_table)
+        month_field = cls._meta.get_field('month')
+        months = {month: month_field.get_db_prep_value(month, db) for (_, month, _), _ in deltas}
+        # Five parameters per row, within the database's parameter limit
+        chunk_size = (db.features.max_query_params or 5000) // 5
+        with db.cursor() as cursor:
+            for start in range(0, len(deltas), chunk_size):
+                chunk = deltas[start:start + chunk_size]
+                params = []
+                for (user_id, month, transaction_type), (count, total) in chunk:
+                    params += [user_id, months[month], transaction_type, count, str(total)]
+                rows = ', '.join(['(%s, %s, %s, %s, CAST(%s AS NUMERIC))'] * len(chunk))
+                cursor.execute(
+                    f"INSERT INTO {table} (user_id, month, transaction_type, count, total) VALUES {rows} "
+                    f"ON CONFLICT (user_id, month, transaction_type) DO UPDATE SET "
+                    f"count = {table}.count + excluded.count, total = {table}.total + excluded.total",
+                    params,
+                )
+
+    @classmethod
+    def remove(cls, transactions):
+        """Uncount deleted transactions. Only updates: a user being deleted gets no new row"""
+        for (user_id, month, transaction_type), (count, total) in sorted(cls._deltas(transactions).items()):
+            cls.objects.filter(user_id=user_id, month=month, transaction_type=transaction_type).update(
+                count=models.F('count') - count,
+                total=models.F('total') - total,
+            )
+
+    @classmethod
+    def rebuild(cls, user_ids):
+        """
+        Recompute the rollups of some users from their transactions.
+
+        The users' rows are locked first, in the key order add() uses: an
+        add() already made to them commits, and is aggregated, before the
+        rebuild reads, and a later one waits and increments the rebuilt
+        rows, which are updated in place rather than deleted and inserted.
+        """
+        with db_transaction.atomic():
+            locked = (
+                cls.objects.select_for_update()
+                .filter(user_id__in=user_ids)
+                .order_by('user_id', 'month', 'transaction_type')
+                .values_list('pk', 'user_id', 'month', 'transaction_type')
+            )
+            existing = {tuple(key): pk for pk, *key in locked}
+            rows = (
+                Transaction.objects
+                .filter(user_id__in=user_ids)
+                .annotate(month=TruncMonth('timestamp', output_field=models.DateField(), tzinfo=dt_timezone.utc))
+                .values('user_id', 'month', 'transaction_type')
+                .annotate(count=Count('id'), total=Sum('amount'))
+                .order_by('user_id', 'month', 'transaction_type')
+            )
+            rollups = [cls(**row) for row in rows]
+            cls.objects.bulk_create(
+                rollups,
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['user', 'month', 'transaction_type'],
+                update_fields=['count', 'total'],
+            )
+            rebuilt = {(rollup.user_id, rollup.month, rollup.transaction_type) for rollup in rollups}
+            cls.objects.filter(pk__in=[pk for key, pk in existing.items() if key not in rebuilt]).delete()
+
+
 class Card(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cards')
     card_name = models.CharField(max_length=100)
     card_number = models.CharField(max_length=19, unique=True)
+    # Digits-only form of card_number, used to resolve transfer recipients
+    # whatever the spacing of the stored or the typed number
+    card_number_normalized = models.CharField(max_length=19, unique=True, null=True, editable=False)
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     card_expiry_date = models.DateField()
     card_issue_date = models.DateField(auto_now_add=True)
@@ -125,6 +272,17 @@ class Card(models.Model):
     def __str__(self):
         return f"{self.card_name} - {self.card_number[-4:]}"
 
+    def save(self, *args, **kwargs):
+        self.card_number_normalized = self.normalize_card_number(self.card_number)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'card_number' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'card_number_normalized'}
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def normalize_card_number(card_number):
+        return ''.join(ch for ch in card_number if ch.isdigit()) or None
+
     @staticmethod
     def generate_card_number():
         return ''.join(random.choices(string.digits, k=16))
@@ -152,6 +310,15 @@ class Deposit(models.Model):
     def __str__(self):
         return f"Deposit of {self.amount} for {self.user.phone_number}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The owner and amount counted in total_balance, to apply a change on save
+        loaded = dict(zip(field_names, values))
+        if 'user_id' in loaded and 'amount' in loaded:
+            instance._counted = (loaded['user_id'], loaded['amount'])
+        return instance
+
 
 class Loan(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -220,6 +387,47 @@ class Application(models.Model):
         return f"Application for {self.get_application_type_display()} for {self.user.phone_number} - {self.get_status_display()}"
 
 
+class CreditScore(models.Model):
+    """
+    The last computed credit score of a user and its breakdown, read by
+    primary key instead of being recomputed on every admin view.
+
+    Writes to the user's transactions, cards, loans and mortgages stamp
+    dirty_at once they commit, and the record is recomputed when dirty_at
+    is later than computed_at, the time its inputs were read. A record
+    scored on an earlier day is also recomputed: account age, the 30-day
+    activity window and overdue loans move with the date.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='credit_score_record')
+    final_score = models.IntegerField()
+    breakdown = models.JSONField(help_text="As returned by CreditLogicManager.get_detailed_credit_score")
+    transaction_count = models.IntegerField(default=0, help_text="Input watermark: transactions scored")
+    last_transaction_at = models.DateTimeField(null=True, blank=True, help_text="Input watermark: latest transaction scored")
+    scored_on = models.DateField()
+    computed_at = models.DateTimeField(help_text="When the inputs were read")
+    dirty_at = models.DateTimeField(null=True, blank=True, help_text="Last write to the inputs")
+
+    class Meta:
+        verbose_name = "Credit Score"
+        verbose_name_plural = "Credit Scores"
+
+    def __str__(self):
+        return f"{self.user_id}: {self.final_score}"
+
+    @property
+    def is_dirty(self):
+        return self.dirty_at is not None and self.dirty_at >= self.computed_at
+
+    def is_current(self, today=None):
+        return not self.is_dirty and self.scored_on == (today or timezone.now().date())
+
+    @classmethod
+    def mark_dirty(cls, user_ids):
+        """Stamp dirty_at on the records of some users, once the current transaction commits"""
+        user_ids = set(user_ids)
+        db_transaction.on_commit(lambda: cls.objects.filter(pk__in=user_ids).update(dirty_at=timezone.now()))
+
+
 class Currency(models.Model):
     code = models.CharField(max_length=3, primary_key=True, help_text="ISO 4217 currency code")
     name = models.CharField(max_length=50)
@@ -244,8 +452,9 @@ class CurrencyHistory(models.Model):
         verbose_name = "Currency History"
         verbose_name_plural = "Currency History"
         ordering = ['-timestamp']
-        indexes = [
-            models.Index(fields=['currency', 'timestamp']),
+        # One rate per currency and moment, also serves the history lookups
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'timestamp'], name='unique_currency_history_timestamp'),
         ]
 
     def __str__(self):
@@ -268,6 +477,9 @@ class ForumPost(models.Model):
 
     class Meta:
         ordering = ['-is_pinned', '-created_at']
+        indexes = [
+            models.Index(fields=['-is_pinned', '-created_at', '-id'], name='forumpost_feed_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -283,6 +495,9 @@ class ForumComment(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='forumcomment_post_idx'),
+        ]
 
     def __str__(self):
         return f"Comment by {self.author.get_full_name()} on {self.post.title}"
@@ -333,6 +548,9 @@ class AIChat(models.Model):
     class Meta:
         ordering = ['-updated_at']
         verbose_name = "AI Chat"
+        indexes = [
+            models.Index(fields=['user', '-updated_at', '-id'], name='aichat_user_updated_idx'),
+        ]
         verbose_name_plural = "AI Chats"
 
     def __str__(self):
@@ -342,9 +560,14 @@ class AIChat(models.Model):
         """Generate title from first user message if not set"""
         if self.title:
             return self.title
-        first_message = self.messages.filter(role='user').first()
-        if first_message:
-            return first_message.content[:50] + ('...' if len(first_message.content) > 50 else '')
+        if hasattr(self, 'first_user_message'):
+            # Annotated by AIChatViewSet's list
+            content = self.first_user_message
+        else:
+            first_message = self.messages.filter(role='user').first()
+            content = first_message.content if first_message else None
+        if content:
+            return content[:50] + ('...' if len(content) > 50 else '')
         return "New Chat"
 
 
@@ -400,6 +623,9 @@ class PredictionPost(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Prediction Post"
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='predictionpost_feed_idx'),
+        ]
         verbose_name_plural = "Prediction Posts"
 
     def __str__(self):
@@ -542,6 +768,9 @@ class CryptoTransaction(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Crypto Transaction"
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='cryptotx_user_time_idx'),
+        ]
         verbose_name_plural = "Crypto Transactions"
 
     def __str__(self):
@@ -576,10 +805,287 @@ class CryptoPriceHistory(models.Model):
         return f"{self.cryptocurrency.symbol} - ${self.price_usd} at {self.timestamp}"
 
 
+# Pre-aggregated OHLC candles, maintained by RollupService
+ROLLUP_RESOLUTIONS = [
+    ('hour', 'Hour'),
+    ('day', 'Day'),
+    ('month', 'Month'),
+]
+
+
+class CurrencyHistoryRollup(models.Model):
+    """OHLC candle of CurrencyHistory ticks for one bucket"""
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='rollups')
+    resolution = models.CharField(max_length=5, choices=ROLLUP_RESOLUTIONS)
+    bucket_start = models.DateTimeField(help_text="UTC start of the hour/day/month")
+    open = models.DecimalField(max_digits=20, decimal_places=10)
+    high = models.DecimalField(max_digits=20, decimal_places=10)
+    low = models.DecimalField(max_digits=20, decimal_places=10)
+    close = models.DecimalField(max_digits=20, decimal_places=10)
+    ticks = models.IntegerField(default=0, help_text="Number of raw ticks in the bucket")
+
+    class Meta:
+        ordering = ['-bucket_start']
+        unique_together = ['currency', 'resolution', 'bucket_start']
+        verbose_name = "Currency History Rollup"
+        verbose_name_plural = "Currency History Rollups"
+
+    def __str__(self):
+        return f"{self.currency_id} {self.resolution} {self.bucket_start}: {self.close}"
+
+
+class CryptoPriceRollup(models.Model):
+    """OHLC candle of CryptoPriceHistory ticks for one bucket"""
+    cryptocurrency = models.ForeignKey(CryptoCurrency, on_delete=models.CASCADE, related_name='price_rollups')
+    resolution = models.CharField(max_length=5, choices=ROLLUP_RESOLUTIONS)
+    bucket_start = models.DateTimeField(help_text="UTC start of the hour/day/month")
+    open = models.DecimalField(max_digits=20, decimal_places=8)
+    high = models.DecimalField(max_digits=20, decimal_places=8)
+    low = models.DecimalField(max_digits=20, decimal_places=8)
+    close = models.DecimalField(max_digits=20, decimal_places=8)
+    # Market data of the last tick in the bucket
+    market_cap = models.BigIntegerField(default=0)
+    volume_24h = models.BigIntegerField(default=0)
+    ticks = models.IntegerField(default=0, help_text="Number of raw ticks in the bucket")
+
+    class Meta:
+        ordering = ['-bucket_start']
+        unique_together = ['cryptocurrency', 'resolution', 'bucket_start']
+        verbose_name = "Crypto Price Rollup"
+        verbose_name_plural = "Crypto Price Rollups"
+
+    def __str__(self):
+        return f"{self.cryptocurrency_id} {self.resolution} {self.bucket_start}: ${self.close}"
+
+
+class CurrencyRateSnapshot(models.Model):
+    """Latest two rates of a currency, refreshed whenever new rates are ingested"""
+    currency = models.OneToOneField(Currency, on_delete=models.CASCADE, primary_key=True, related_name='snapshot')
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+    previous_rate = models.DecimalField(max_digits=20, decimal_places=10, null=True, blank=True)
+    timestamp = models.DateTimeField(help_text="The timestamp of the latest rate")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Currency Rate Snapshot"
+        verbose_name_plural = "Currency Rate Snapshots"
+
+    @property
+    def change_percent(self):
+        if not self.previous_rate:
+            return 0.0
+        change = ((self.rate - self.previous_rate) / self.previous_rate) * 100
+        return round(float(change), 4)
+
+    def __str__(self):
+        return f"{self.currency_id}: {self.rate} at {self.timestamp}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied Idempotency-Key and the response of the first request
+    made with it, replayed when the client retries the same request.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of the method, path and body of the request")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Empty while the request is in progress")
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Idempotency Key"
+        verbose_name_plural = "Idempotency Keys"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.endpoint})"
+
+
+class LedgerPosting(models.Model):
+    """
+    One leg of an append-only double-entry journal. Every movement of money
+    on a card is a journal whose postings sum to zero: the card leg and its
+    counterpart (another card, or a bank account such as fees). Card.balance
+    is a cached projection of the card's postings.
+    """
+    ACCOUNT_CARD = 'card'
+    ACCOUNTS = [
+        (ACCOUNT_CARD, 'Card'),
+        ('crypto_settlement', 'Crypto settlement'),
+        ('fees', 'Fees'),
+        ('adjustments', 'Admin adjustments'),
+        ('opening_balances', 'Opening and closing balances'),
+    ]
+    KINDS = [
+        ('transfer', 'Transfer'),
+        ('crypto_buy', 'Crypto buy'),
+        ('crypto_sell', 'Crypto sell'),
+        ('adjustment', 'Admin adjustment'),
+        ('opening', 'Opening balance'),
+        ('closing', 'Closing balance'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    journal_id = models.UUIDField(db_index=True, help_text="Postings of one movement share a journal")
+    kind = models.CharField(max_length=20, choices=KINDS)
+    account = models.CharField(max_length=20, choices=ACCOUNTS, default=ACCOUNT_CARD)
+    # No database constraint: postings outlive deleted cards. Lookups by
+    # card use the (card, id) index below
+    card = models.ForeignKey(Card, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, blank=True, related_name='postings')
+    counterparty_card = models.ForeignKey(Card, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+')
+    transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='postings')
+    amount = models.DecimalField(max_digits=15, decimal_places=2, help_text="Positive credits the account, negative debits it")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Ledger Posting"
+        verbose_name_plural = "Ledger Postings"
+        indexes = [
+            models.Index(fields=['card', 'id'], name='ledger_card_id_idx'),
+        ]
+
+    def __str__(self):
+        target = self.card_id if self.account == self.ACCOUNT_CARD else self.account
+        return f"{self.kind} {target}: {self.amount}"
+
+    @classmethod
+    def card_leg(cls, card_id, amount, counterparty_card_id=None, transaction=None):
+        return cls(account=cls.ACCOUNT_CARD, card_id=card_id, amount=amount,
+                   counterparty_card_id=counterparty_card_id, transaction=transaction)
+
+    @classmethod
+    def account_leg(cls, account, amount):
+        return cls(account=account, amount=amount)
+
+    @classmethod
+    def record(cls, kind, *journals):
+        """
+        Append journals (lists of unsaved legs) with one INSERT. Raises
+        ValueError when a journal does not balance.
+        """
+        postings = []
+        for legs in journals:
+            if sum(Decimal(str(leg.amount)) for leg in legs) != 0:
+                raise ValueError(f"Unbalanced {kind} journal: {[leg.amount for leg in legs]}")
+            journal_id = uuid.uuid4()
+            for leg in legs:
+                leg.journal_id = journal_id
+                leg.kind = kind
+                postings.append(leg)
+        return cls.objects.bulk_create(postings, batch_size=1000)
+
+
+class LedgerCheckpoint(models.Model):
+    """
+    Balance of a card after all its postings up to last_posting_id, so a
+    balance is one checkpoint plus the postings made since.
+    """
+    card = models.ForeignKey(Card, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='ledger_checkpoints')
+    last_posting_id = models.BigIntegerField()
+    as_of = models.DateTimeField(help_text="created_at of the last posting included")
+    balance = models.DecimalField(max_digits=15, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Ledger Checkpoint"
+        verbose_name_plural = "Ledger Checkpoints"
+        indexes = [
+            models.Index(fields=['card', 'last_posting_id'], name='ledger_checkpoint_card_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.card_id} @ {self.last_posting_id}: {self.balance}"
+
+
 # Django signals for automatic counter updates
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+@receiver(post_save, sender=Card)
+def add_card_to_total_balance(sender, instance, created, **kwargs):
+    """Count the opening balance of a new card in its owner's total balance and the ledger"""
+    if created:
+        User.objects.adjust_total_balance(instance.owner_id, instance.balance)
+        if instance.balance:
+            LedgerPosting.record('opening', [
+                LedgerPosting.card_leg(instance.id, instance.balance),
+                LedgerPosting.account_leg('opening_balances', -Decimal(str(instance.balance))),
+            ])
+
+@receiver(post_delete, sender=Card)
+def remove_card_from_total_balance(sender, instance, **kwargs):
+    """Remove the balance of a deleted card from its owner's total balance and close it in the ledger"""
+    User.objects.adjust_total_balance(instance.owner_id, -instance.balance)
+    if instance.balance:
+        LedgerPosting.record('closing', [
+            LedgerPosting.card_leg(instance.id, -Decimal(str(instance.balance))),
+            LedgerPosting.account_leg('opening_balances', instance.balance),
+        ])
+
+@receiver(post_save, sender=Transaction)
+def add_transaction_to_rollup(sender, instance, created, **kwargs):
+    """Count a transaction in its monthly rollup (bulk_create callers call add() themselves)"""
+    if created:
+        TransactionMonthlyRollup.add([instance])
+    else:
+        # The previous month, type and amount are unknown
+        TransactionMonthlyRollup.rebuild([instance.user_id])
+
+@receiver(post_delete, sender=Transaction)
+def remove_transaction_from_rollup(sender, instance, **kwargs):
+    """Uncount a deleted transaction from its monthly rollup"""
+    TransactionMonthlyRollup.remove([instance])
+
+@receiver(post_save, sender=Deposit)
+def add_deposit_to_total_balance(sender, instance, created, **kwargs):
+    """Count a new deposit, or the new amount or owner of a saved one, in the owners' total balance"""
+    counted = getattr(instance, '_counted', None)
+    current = (instance.user_id, Decimal(str(instance.amount)))
+    if created:
+        User.objects.adjust_total_balance(*current)
+    elif counted is not None and counted != current:
+        user_id, amount = counted
+        User.objects.adjust_total_balance(user_id, -amount)
+        User.objects.adjust_total_balance(*current)
+    instance._counted = current
+
+@receiver(post_delete, sender=Deposit)
+def remove_deposit_from_total_balance(sender, instance, **kwargs):
+    """Remove a deleted deposit from its owner's total balance"""
+    User.objects.adjust_total_balance(instance.user_id, -instance.amount)
+
+def invalidate_user_analytics(sender, instance, **kwargs):
+    """Drop the cached analytics of the owner of a changed product"""
+    # Imported here: the services package imports the models
+    from .services.analytics_cache_service import AnalyticsSnapshotService
+    AnalyticsSnapshotService().invalidate([instance.owner_id if sender is Card else instance.user_id])
+
+for analytics_model in (Card, Transaction, Loan, Deposit, Mortgage, CryptoWallet):
+    post_save.connect(invalidate_user_analytics, sender=analytics_model, dispatch_uid=f'analytics_save_{analytics_model.__name__}')
+    post_delete.connect(invalidate_user_analytics, sender=analytics_model, dispatch_uid=f'analytics_delete_{analytics_model.__name__}')
+
+def mark_credit_score_dirty(sender, instance, **kwargs):
+    """Have the stored credit score of the owner of a changed scoring input recomputed"""
+    CreditScore.mark_dirty([instance.owner_id if sender is Card else instance.user_id])
+
+for scoring_model in (Card, Transaction, Loan, Mortgage):
+    post_save.connect(mark_credit_score_dirty, sender=scoring_model, dispatch_uid=f'credit_score_save_{scoring_model.__name__}')
+    post_delete.connect(mark_credit_score_dirty, sender=scoring_model, dispatch_uid=f'credit_score_delete_{scoring_model.__name__}')
+
+@receiver(post_save, sender=CurrencyHistory)
+@receiver(post_delete, sender=CurrencyHistory)
+def refresh_currency_snapshot(sender, instance, **kwargs):
+    """Recompute the snapshot of a currency whose history changed, once committed"""
+    # Imported here: the services package imports the models
+    from .services.snapshot_service import CurrencySnapshotService
+    code = instance.currency_id
+    db_transaction.on_commit(lambda: CurrencySnapshotService().refresh(codes=[code]))
+
 @receiver(post_save, sender=ForumComment)
 def update_forum_comment_count_on_create(sender, instance, created, **kwargs):
     """Update comment count when a new comment is created"""
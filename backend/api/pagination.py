@@ -0,0 +1,198 @@
+"""
+Pagination classes for list endpoints
+"""
+import base64
+import json
+import logging
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Below this many rows by the planner's estimate the exact count is cheap
+# enough to run
+EXACT_COUNT_THRESHOLD = 10000
+
+
+def estimate_count(queryset):
+    """
+    Row count of a queryset as estimated by the PostgreSQL planner, or None
+    on other databases. Costs one EXPLAIN instead of a scan of every
+    matching row.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+    except DatabaseError:
+        logger.exception("Could not estimate the row count")
+        return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a unique ordering, e.g. ('-timestamp', '-id').
+
+    The cursor holds the ordering values of the last row of the page, and the
+    next page is read with a WHERE on those values instead of an OFFSET. With
+    an index matching the filters and the ordering, the page at row 100 000
+    costs the same index range scan as the first one.
+
+    Unlike DRF's CursorPagination, which keys on the first ordering field and
+    skips ties with an offset, every ordering field is part of the key, so the
+    last field must make the ordering unique. All fields must sort in the same
+    direction. The view sets `ordering`.
+    """
+    page_size = DEFAULT_PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = tuple(getattr(view, 'ordering', None) or ('-pk',))
+        self.descending = self.ordering[0].startswith('-')
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(cursor))
+
+        # One row more than the page tells whether there is a next page
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def after(self, cursor):
+        """
+        Rows after the cursor: for ('-timestamp', '-id') that is
+        timestamp <= t AND (timestamp < t OR (timestamp = t AND id < i)).
+        The leading bound on the first field is what lets the database start
+        the index scan at the cursor instead of filtering the whole range.
+        """
+        lookup = 'lt' if self.descending else 'gt'
+        condition = None
+        for name, value in reversed(list(zip(self.fields, cursor))):
+            strict = Q(**{f'{name}__{lookup}': value})
+            condition = strict if condition is None else strict | (Q(**{name: value}) & condition)
+        first_bound = Q(**{f'{self.fields[0]}__{lookup}e': cursor[0]})
+        return first_bound & condition
+
+    def encode_cursor(self, row):
+        values = [getattr(row, name) for name in self.fields]
+        payload = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            fields = [model._meta.pk if name == 'pk' else model._meta.get_field(name) for name in self.fields]
+            return [field.to_python(value) for field, value in zip(fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class EstimatedCountPagination(LimitOffsetPagination):
+    """
+    ?limit=&offset= pagination for admin lists, the project default.
+
+    The count comes from the planner's estimate once that estimate is past
+    EXACT_COUNT_THRESHOLD, so a page of a large table does not pay for a
+    COUNT(*) over all of it; `count_is_estimate` tells the client which one
+    it got. Whether there is a next page is read from the rows themselves,
+    as an estimate may fall short of the real count. Querysets without an
+    ordering are ordered by primary key so the pages do not overlap.
+    """
+    default_limit = DEFAULT_PAGE_SIZE
+    max_limit = MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+
+        self.request = request
+        self.offset = self.get_offset(request)
+        self.count = self.get_count(queryset)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_count(self, queryset):
+        estimate = estimate_count(queryset)
+        self.count_is_estimate = estimate is not None and estimate >= EXACT_COUNT_THRESHOLD
+        if self.count_is_estimate:
+            return estimate
+        return queryset.count()
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['count_is_estimate'] = self.count_is_estimate
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_estimate'] = {'type': 'boolean'}
+        return response_schema
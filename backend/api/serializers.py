@@ -1,9 +1,10 @@
 from django.contrib.auth import authenticate, get_user_model
 from rest_framework import serializers
-from .models import User, Transaction, Card, Deposit, Loan, Mortgage, Application, Currency, CurrencyHistory, ForumComment, ForumPost, Terminal, AIChat, AIChatMessage, PredictionPost, PredictionComment, PredictionLike, CryptoCurrency, CryptoWallet, CryptoTransaction, CryptoPriceHistory
+from .models import User, Transaction, Card, Deposit, Loan, Mortgage, Application, Currency, CurrencyHistory, ForumComment, ForumPost, Terminal, AIChat, AIChatMessage, PredictionPost, PredictionComment, PredictionLike, CryptoCurrency, CryptoWallet, CryptoTransaction, CryptoPriceHistory, CryptoPriceRollup
 from decimal import Decimal
 from datetime import datetime, timedelta
 from django.utils.translation import gettext_lazy as _
+from .services.snapshot_service import CurrencySnapshotService
 
 User = get_user_model()
 
@@ -13,7 +14,21 @@ class CurrencyHistorySerializer(serializers.ModelSerializer):
         fields = ['rate', 'timestamp']
 
 
+class CurrencyListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # One query for the sparklines of the whole page instead of one per currency
+        currencies = list(data.all() if hasattr(data, 'all') else data)
+        self.context['sparklines'] = CurrencySnapshotService().sparklines([c.code for c in currencies])
+        return super().to_representation(currencies)
+
+
 class CurrencySerializer(serializers.ModelSerializer):
+    """
+    Expects currencies with select_related('snapshot') and the latest_rate
+    annotation of CurrencyViewSet. Rate and change come from the snapshot, or
+    the latest tick before the first snapshot; the 30-day history is batched
+    by CurrencyListSerializer.
+    """
     history = serializers.SerializerMethodField()
     change_percent = serializers.SerializerMethodField()
     rate = serializers.SerializerMethodField()
@@ -21,36 +36,20 @@ class CurrencySerializer(serializers.ModelSerializer):
     class Meta:
         model = Currency
         fields = ['code', 'name', 'flag_emoji', 'change_percent', 'rate', 'history']
+        list_serializer_class = CurrencyListSerializer
 
     def get_history(self, obj):
-        # Limit history to the last 30 days for performance
-        thirty_days_ago = serializers.DateTimeField().to_representation(
-            serializers.DateTimeField().to_internal_value(datetime.now()) - timedelta(days=30)
-        )
-        history_qs = obj.history.filter(timestamp__gte=thirty_days_ago).order_by('timestamp')
-        return CurrencyHistorySerializer(history_qs, many=True).data
+        sparklines = self.context.get('sparklines')
+        if sparklines is None:
+            sparklines = CurrencySnapshotService().sparklines([obj.code])
+        return CurrencyHistorySerializer(sparklines.get(obj.code, []), many=True).data
 
     def get_change_percent(self, obj):
-        # Get the last two history entries to calculate the percentage change
-        latest_two = obj.history.order_by('-timestamp')[:2]
-        if len(latest_two) < 2:
-            return 0.0
-        
-        latest_rate = latest_two[0].rate
-        previous_rate = latest_two[1].rate
+        snapshot = getattr(obj, 'snapshot', None)
+        return snapshot.change_percent if snapshot else 0.0
 
-        if previous_rate == 0:
-            return 0.0
-
-        change = ((latest_rate - previous_rate) / previous_rate) * 100
-        return round(float(change), 4)
-    
     def get_rate(self, obj):
-        # Get the latest rate for this currency
-        latest_history = obj.history.order_by('-timestamp').first()
-        if latest_history:
-            return float(latest_history.rate)
-        return 0.0
+        return float(obj.latest_rate) if obj.latest_rate is not None else 0.0
 
 class AuthTokenSerializer(serializers.Serializer):
     phone_number = serializers.CharField(label=_("Phone Number"))
@@ -180,11 +179,13 @@ class AdminApplicationSerializer(serializers.ModelSerializer):
     def get_credit_score(self, obj):
         """Получить кредитный рейтинг пользователя"""
         try:
-            # Импортируем CreditLogicManager из правильного места
-            from .credit_logic import CreditLogicManager
-            credit_manager = CreditLogicManager()
-            score = credit_manager.calculate_credit_score(obj.user)
-            return score
+            # The list view reads the stored scores of the whole page at once
+            credit_scores = self.context.get('credit_scores')
+            if credit_scores is not None and obj.user_id in credit_scores:
+                return credit_scores[obj.user_id]
+            # Импортируем CreditScoreService из правильного места
+            from .services.credit_score_service import CreditScoreService
+            return CreditScoreService().breakdown(obj.user)['final_score']
         except ImportError:
             return "N/A"
         except AttributeError:
@@ -216,6 +217,22 @@ class TransferSerializer(serializers.Serializer):
             raise serializers.ValidationError("Сумма перевода должна быть положительной.")
         return value
 
+class BatchTransferItemSerializer(serializers.Serializer):
+    recipient = serializers.CharField(max_length=100, help_text="Card number or phone number")
+    amount = serializers.DecimalField(max_digits=15, decimal_places=2)
+    comment = serializers.CharField(max_length=500, required=False, allow_blank=True)
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Сумма перевода должна быть положительной.")
+        return value
+
+class BatchTransferSerializer(serializers.Serializer):
+    MAX_TRANSFERS = 5000
+
+    source_card_id = serializers.UUIDField()
+    transfers = BatchTransferItemSerializer(many=True, allow_empty=False, max_length=MAX_TRANSFERS)
+
 class ForumCommentSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
 
@@ -246,6 +263,9 @@ class ForumPostSerializer(serializers.ModelSerializer):
         read_only_fields = ['author', 'likes_count', 'comments_count']
 
     def get_is_liked(self, obj):
+        if hasattr(obj, 'liked_by_user'):
+            # Annotated by the viewset's list and retrieve
+            return obj.liked_by_user
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.likes.filter(user=request.user).exists()
@@ -282,7 +302,7 @@ class AIChatSerializer(serializers.ModelSerializer):
 
 class AIChatListSerializer(serializers.ModelSerializer):
     """Simplified serializer for chat list (without messages)"""
-    messages_count = serializers.IntegerField(source='messages.count', read_only=True)
+    messages_count = serializers.SerializerMethodField()
     last_message = serializers.SerializerMethodField()
     title = serializers.SerializerMethodField()
 
@@ -290,15 +310,27 @@ class AIChatListSerializer(serializers.ModelSerializer):
         model = AIChat
         fields = ['id', 'title', 'created_at', 'updated_at', 'messages_count', 'last_message']
 
+    def get_messages_count(self, obj):
+        if hasattr(obj, 'messages_total'):
+            # Annotated by AIChatViewSet's list
+            return obj.messages_total
+        return obj.messages.count()
+
     def get_last_message(self, obj):
-        last_msg = obj.messages.order_by('-created_at').first()
-        if last_msg:
-            return {
-                'role': last_msg.role,
-                'content': last_msg.content[:100] + ('...' if len(last_msg.content) > 100 else ''),
-                'created_at': last_msg.created_at
-            }
-        return None
+        if hasattr(obj, 'last_message_at'):
+            if obj.last_message_at is None:
+                return None
+            role, content, created_at = obj.last_message_role, obj.last_message_content, obj.last_message_at
+        else:
+            last_msg = obj.messages.order_by('-created_at').first()
+            if not last_msg:
+                return None
+            role, content, created_at = last_msg.role, last_msg.content, last_msg.created_at
+        return {
+            'role': role,
+            'content': content[:100] + ('...' if len(content) > 100 else ''),
+            'created_at': created_at
+        }
 
     def get_title(self, obj):
         return obj.get_title()
@@ -345,6 +377,9 @@ class PredictionPostSerializer(serializers.ModelSerializer):
         read_only_fields = ['author', 'likes_count', 'comments_count']
 
     def get_is_liked(self, obj):
+        if hasattr(obj, 'liked_by_user'):
+            # Annotated by the viewset's list and retrieve
+            return obj.liked_by_user
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.likes.filter(user=request.user).exists()
@@ -525,6 +560,16 @@ class CryptoPriceHistorySerializer(serializers.ModelSerializer):
         fields = ['price_usd', 'market_cap', 'volume_24h', 'timestamp']
 
 
+class CryptoPriceRollupSerializer(serializers.ModelSerializer):
+    """Candle in the same shape as CryptoPriceHistorySerializer plus OHLC"""
+    price_usd = serializers.DecimalField(source='close', max_digits=20, decimal_places=8, read_only=True)
+    timestamp = serializers.DateTimeField(source='bucket_start', read_only=True)
+
+    class Meta:
+        model = CryptoPriceRollup
+        fields = ['price_usd', 'market_cap', 'volume_24h', 'timestamp', 'open', 'high', 'low']
+
+
 class CryptoPortfolioSerializer(serializers.Serializer):
     """Serializer for user's crypto portfolio summary"""
     total_balance_usd = serializers.DecimalField(max_digits=15, decimal_places=2)
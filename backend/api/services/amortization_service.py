@@ -0,0 +1,146 @@
+"""
+Month-by-month amortization schedules of annuity loans and mortgages
+"""
+import calendar
+import logging
+import math
+from datetime import date
+from decimal import Decimal
+import numpy as np
+from ..credit_logic import CreditLogicManager
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('reduce_term', 'reduce_payment')
+# Balances below half a cent count as repaid
+PAID_OFF = 0.005
+COLUMNS = ('month', 'payment', 'extra', 'interest', 'principal', 'balance')
+
+
+def add_months(start, months):
+    """The same day months later, or the last day of a shorter month"""
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+
+class AmortizationService:
+    """
+    Builds annuity schedules with NumPy.
+
+    Between two early repayments the balance after k more months follows
+    the closed form B_k = B_0 (1+r)^k - A ((1+r)^k - 1) / r, so every
+    month of such a stretch is computed in one vector operation: a
+    schedule costs one pass per lump sum rather than a Python iteration
+    per month.
+
+    Early repayments are a fixed extra amount every month, which shortens
+    the term, and lump sums paid with the payment of a given month. After
+    a lump sum, reduce_term keeps the payment and ends the loan sooner;
+    reduce_payment keeps the end date and recomputes a lower payment.
+    """
+
+    def __init__(self):
+        self.credit_logic_manager = CreditLogicManager()
+
+    def annuity_payment(self, principal, annual_rate, term_months):
+        """The monthly payment, rounded to the cent like CreditLogicManager"""
+        payment = self.credit_logic_manager.calculate_monthly_payment(
+            Decimal(str(principal)), Decimal(str(annual_rate)), term_months,
+        )
+        return float(payment)
+
+    def schedule(self, principal, annual_rate, term_months, extra_monthly=0, lump_sums=None,
+                 strategy='reduce_term', start_date=None):
+        """
+        The schedule as columns of equal length, one row per month: the
+        scheduled payment, the extra repaid, the interest, the principal
+        (payment and extra less interest) and the balance left.
+
+        lump_sums: {month number, from 1: amount}. start_date: issue date
+        of the loan, to date the last payment.
+        """
+        principal = float(principal)
+        annual_rate = float(annual_rate)
+        extra_monthly = float(extra_monthly)
+        lump_sums = {int(month): float(amount) for month, amount in (lump_sums or {}).items()}
+        if not all(math.isfinite(value) for value in (principal, annual_rate, extra_monthly, *lump_sums.values())):
+            raise ValueError("amounts and rate must be finite numbers")
+        if principal <= 0 or term_months <= 0 or annual_rate < 0 or extra_monthly < 0:
+            raise ValueError("principal and term must be positive, rate and extra payments not negative")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {', '.join(STRATEGIES)}")
+        if any(month < 1 or amount < 0 for month, amount in lump_sums.items()):
+            raise ValueError("lump sums need a month from 1 and an amount not negative")
+
+        rate = annual_rate / 100 / 12
+        payment = self.annuity_payment(principal, annual_rate, term_months)
+        monthly_payment = payment
+        balance = principal
+        month = 0
+        parts = []
+        breaks = sorted(m for m in lump_sums if m < term_months)
+
+        while balance > PAID_OFF and month < term_months:
+            end = next((m for m in breaks if m > month), term_months)
+            k = np.arange(1, end - month + 1)
+            paid = payment + extra_monthly
+            if rate:
+                # An overflow is reported below, as a ValueError
+                with np.errstate(over='ignore', invalid='ignore'):
+                    growth = (1 + rate) ** k
+                    balances = balance * growth - paid * (growth - 1) / rate
+            else:
+                balances = balance - paid * k
+            if not np.isfinite(balances).all():
+                raise ValueError("the balance overflows: principal or rate too large")
+
+            # The last payment clears the balance: on payoff, or at the
+            # end of the term whatever the cent rounding of the payment left
+            repaid = np.flatnonzero(balances <= PAID_OFF)
+            last = repaid[0] if repaid.size else (len(k) - 1 if end == term_months else None)
+            if last is not None:
+                k, balances = k[:last + 1], balances[:last + 1]
+
+            opening = np.concatenate(([balance], balances[:-1]))
+            interest = opening * rate
+            payments = np.full(len(k), payment)
+            extras = np.full(len(k), extra_monthly)
+            if last is not None:
+                payments[-1] = opening[-1] + interest[-1]
+                extras[-1] = 0.0
+                balances[-1] = 0.0
+
+            month += len(k)
+            balance = balances[-1]
+            if balance > PAID_OFF and month in lump_sums:
+                lump = min(lump_sums[month], balance)
+                extras[-1] += lump
+                balance = balances[-1] = balance - lump
+                if strategy == 'reduce_payment' and balance > PAID_OFF:
+                    payment = self.annuity_payment(balance, annual_rate, term_months - month)
+            parts.append((month - len(k) + k, payments, extras, interest, opening - balances, balances))
+
+        columns = {
+            name: np.concatenate([part[i] for part in parts])
+            for i, name in enumerate(COLUMNS)
+        }
+        return self._summary(columns, monthly_payment, strategy, term_months, start_date)
+
+    def _summary(self, columns, monthly_payment, strategy, term_months, start_date):
+        months = len(columns['month'])
+        total_interest = float(columns['interest'].sum())
+        total_paid = float(columns['payment'].sum() + columns['extra'].sum())
+        return {
+            'monthly_payment': round(monthly_payment, 2),
+            'strategy': strategy,
+            'term_months': term_months,
+            'months': months,
+            'payoff_date': add_months(start_date, months).isoformat() if start_date else None,
+            'total_interest': round(total_interest, 2),
+            'total_paid': round(total_paid, 2),
+            'columns': {
+                name: column.tolist() if name == 'month' else np.round(column, 2).tolist()
+                for name, column in columns.items()
+            },
+        }
@@ -0,0 +1,112 @@
+"""
+Per-user cache of the /api/analytics/ payload
+"""
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from ..models import CryptoWallet
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'analytics'
+HITS_KEY = f'{KEY_PREFIX}:stats:hits'
+MISSES_KEY = f'{KEY_PREFIX}:stats:misses'
+
+
+def _version_key(user_id):
+    return f'{KEY_PREFIX}:version:user:{user_id}'
+
+
+class AnalyticsSnapshotService:
+    """
+    Caches the analytics payload of each user under a versioned key.
+
+    The key holds a version per user. A write to the user's cards,
+    transactions, loans, deposits, mortgages or wallets bumps the user's
+    version once the write commits, and so does a price refresh of a
+    cryptocurrency the user has a wallet of: the snapshots of users without
+    crypto survive price refreshes. The key also holds the month, which the
+    payload's month-over-month figures depend on. A snapshot built from older data
+    therefore sits under a key that is never read again and simply expires.
+
+    A missing version starts from the current time in nanoseconds rather
+    than from 1, so an evicted version never comes back to the number of an
+    old snapshot still in the cache.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or settings.ANALYTICS_SNAPSHOT_TTL_SECONDS
+
+    def snapshot_key(self, user_id):
+        version_key = _version_key(user_id)
+        user_version = cache.get(version_key) or self._start_version(version_key)
+        # The payload compares the current month with the last one
+        month = timezone.now().strftime('%Y%m')
+        return f'{KEY_PREFIX}:snapshot:{user_id}:{month}:{user_version}'
+
+    def get_or_build(self, user_id, build):
+        """
+        Return (payload, hit): the cached snapshot of the user, or build()'s
+        result, cached for the next request.
+        """
+        key = self.snapshot_key(user_id)
+        payload = cache.get(key)
+        if payload is not None:
+            self._count(HITS_KEY)
+            return payload, True
+
+        self._count(MISSES_KEY)
+        payload = build()
+        cache.set(key, payload, self.ttl)
+        return payload, False
+
+    def invalidate(self, user_ids):
+        """Bump the version of some users, once the current transaction commits"""
+        user_ids = set(user_ids)
+        transaction.on_commit(lambda: self._bump([_version_key(user_id) for user_id in user_ids]))
+
+    def invalidate_prices(self, cryptocurrency_ids):
+        """
+        Bump the version of the users with a wallet of one of some repriced
+        cryptocurrencies, whose snapshots show its price
+        """
+        holders = (
+            CryptoWallet.objects.filter(cryptocurrency_id__in=cryptocurrency_ids)
+            .values_list('user_id', flat=True).distinct()
+        )
+        self.invalidate(holders)
+
+    def stats(self):
+        counts = cache.get_many([HITS_KEY, MISSES_KEY])
+        hits = counts.get(HITS_KEY, 0)
+        misses = counts.get(MISSES_KEY, 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+
+    def reset_stats(self):
+        cache.delete_many([HITS_KEY, MISSES_KEY])
+
+    def _start_version(self, key):
+        version = time.time_ns()
+        cache.add(key, version, None)
+        # Another request may have added it first
+        return cache.get(key) or version
+
+    def _bump(self, keys):
+        # One round trip for any number of users: a deleted version restarts
+        # from the current time, above every version it ever had
+        cache.delete_many(keys)
+
+    def _count(self, key):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 0, None)
+            cache.incr(key)
@@ -6,11 +6,16 @@ import logging
 from decimal import Decimal
 from datetime import datetime, timezone
 from django.conf import settings
+from django.db import transaction as db_transaction
 from django.utils import timezone as django_timezone
-from ..models import CryptoCurrency, CryptoWallet, CryptoTransaction, CryptoPriceHistory, User, Card
+from ..models import CryptoCurrency, CryptoWallet, CryptoTransaction, CryptoPriceHistory, User, Card, LedgerPosting
+from .rollup_service import RollupService
+from .analytics_cache_service import AnalyticsSnapshotService
 
 logger = logging.getLogger(__name__)
 
+CENTS = Decimal('0.01')
+
 
 class CoinGeckoService:
     """Service for interacting with CoinGecko API"""
@@ -151,7 +156,7 @@ class CryptoService:
         coin_ids = [crypto.id for crypto in active_cryptos]
         prices_data = self.coingecko.get_coin_prices(coin_ids)
         
-        updated_count = 0
+        updated_ids = []
         for crypto in active_cryptos:
             if crypto.id in prices_data:
                 price_info = prices_data[crypto.id]
@@ -170,9 +175,18 @@ class CryptoService:
                     timestamp=crypto.last_updated
                 )
                 
-                updated_count += 1
+                updated_ids.append(crypto.id)
                 logger.info(f"Updated price for {crypto.symbol}: ${crypto.current_price_usd}")
         
+        # Portfolio values in the holders' cached analytics are now out of date
+        if updated_ids:
+            AnalyticsSnapshotService().invalidate_prices(updated_ids)
+
+        # Roll the new ticks up into hourly/daily/monthly candles
+        if updated_ids:
+            RollupService().refresh('crypto', asset_ids=updated_ids)
+
+        updated_count = len(updated_ids)
         logger.info(f"Updated prices for {updated_count} cryptocurrencies")
         return updated_count
     
@@ -219,7 +233,7 @@ class CryptoService:
             raise ValueError("Invalid cryptocurrency price")
         
         crypto_amount = usd_amount / cryptocurrency.current_price_usd
-        fee_amount = usd_amount * Decimal('0.01')  # 1% fee
+        fee_amount = (usd_amount * Decimal('0.01')).quantize(CENTS)  # 1% fee
         total_amount = usd_amount + fee_amount
         
         if user_card.balance < total_amount:
@@ -242,19 +256,32 @@ class CryptoService:
         
         # Process transaction
         try:
-            # Deduct from card
-            user_card.balance -= total_amount
-            user_card.save()
-            
-            # Add to crypto wallet
-            wallet.balance += crypto_amount
-            wallet.save()
-            
-            # Update transaction
-            transaction.status = 'completed'
-            transaction.completed_at = django_timezone.now()
-            transaction.transaction_hash = transaction.generate_transaction_hash()
-            transaction.save()
+            with db_transaction.atomic():
+                # Lock the card and the wallet: concurrent payments wait instead of overwriting the balances
+                user_card = Card.objects.select_for_update().get(pk=user_card.pk)
+                wallet = CryptoWallet.objects.select_for_update().get(pk=wallet.pk)
+                if user_card.balance < total_amount:
+                    raise ValueError("Insufficient funds including fees")
+
+                # Deduct from card
+                user_card.balance -= total_amount
+                user_card.save(update_fields=['balance'])
+                user.adjust_total_balance(-total_amount)
+                LedgerPosting.record('crypto_buy', [
+                    LedgerPosting.card_leg(user_card.id, -total_amount),
+                    LedgerPosting.account_leg('crypto_settlement', usd_amount),
+                    LedgerPosting.account_leg('fees', fee_amount),
+                ])
+
+                # Add to crypto wallet
+                wallet.balance += crypto_amount
+                wallet.save(update_fields=['balance', 'updated_at'])
+
+                # Update transaction
+                transaction.status = 'completed'
+                transaction.completed_at = django_timezone.now()
+                transaction.transaction_hash = transaction.generate_transaction_hash()
+                transaction.save()
             
             logger.info(f"Buy transaction completed: {user.phone_number} bought {crypto_amount} {cryptocurrency.symbol}")
             return transaction
@@ -286,8 +313,9 @@ class CryptoService:
         if cryptocurrency.current_price_usd <= 0:
             raise ValueError("Invalid cryptocurrency price")
         
-        usd_amount = crypto_amount * cryptocurrency.current_price_usd
-        fee_amount = usd_amount * Decimal('0.01')  # 1% fee
+        # Amounts are rounded to cents as stored, so the ledger legs balance
+        usd_amount = (crypto_amount * cryptocurrency.current_price_usd).quantize(CENTS)
+        fee_amount = (usd_amount * Decimal('0.01')).quantize(CENTS)  # 1% fee
         net_usd_amount = usd_amount - fee_amount
         
         # Create transaction
@@ -304,19 +332,32 @@ class CryptoService:
         
         # Process transaction
         try:
-            # Deduct from crypto wallet
-            wallet.balance -= crypto_amount
-            wallet.save()
-            
-            # Add to card
-            user_card.balance += net_usd_amount
-            user_card.save()
-            
-            # Update transaction
-            transaction.status = 'completed'
-            transaction.completed_at = django_timezone.now()
-            transaction.transaction_hash = transaction.generate_transaction_hash()
-            transaction.save()
+            with db_transaction.atomic():
+                # Locked in the same order as buying: card, then wallet
+                user_card = Card.objects.select_for_update().get(pk=user_card.pk)
+                wallet = CryptoWallet.objects.select_for_update().get(pk=wallet.pk)
+                if wallet.balance < crypto_amount:
+                    raise ValueError("Insufficient crypto balance")
+
+                # Deduct from crypto wallet
+                wallet.balance -= crypto_amount
+                wallet.save(update_fields=['balance', 'updated_at'])
+
+                # Add to card
+                user_card.balance += net_usd_amount
+                user_card.save(update_fields=['balance'])
+                user.adjust_total_balance(net_usd_amount)
+                LedgerPosting.record('crypto_sell', [
+                    LedgerPosting.card_leg(user_card.id, net_usd_amount),
+                    LedgerPosting.account_leg('fees', fee_amount),
+                    LedgerPosting.account_leg('crypto_settlement', -(net_usd_amount + fee_amount)),
+                ])
+
+                # Update transaction
+                transaction.status = 'completed'
+                transaction.completed_at = django_timezone.now()
+                transaction.transaction_hash = transaction.generate_transaction_hash()
+                transaction.save()
             
             logger.info(f"Sell transaction completed: {user.phone_number} sold {crypto_amount} {cryptocurrency.symbol}")
             return transaction
@@ -2,9 +2,12 @@ import requests
 from datetime import datetime
 from decimal import Decimal
 from django.conf import settings
+from django.db import transaction
 from django.utils.timezone import make_aware
 
 from api.models import Currency, CurrencyHistory
+from api.services.rollup_service import RollupService
+from api.services.snapshot_service import CurrencySnapshotService
 
 # The API key is now fetched from Django settings
 BASE_URL = "https://v6.exchangerate-api.com/v6"
@@ -39,31 +42,50 @@ class CurrencyAPIService:
             print("Failed to fetch valid currency data.")
             return
 
-        # The API returns rates for 1 RUB. We need to find how much 1 unit of foreign currency costs in RUB.
-        # So we need to calculate 1 / rate.
-        rates = data.get("conversion_rates", {})
         timestamp_utc = datetime.utcfromtimestamp(data.get("time_last_update_unix"))
         aware_timestamp = make_aware(timestamp_utc)
 
-        target_currencies = Currency.objects.exclude(code="RUB").values_list('code', flat=True)
+        created = service.ingest_rates(data.get("conversion_rates", {}), aware_timestamp)
+        print(f"Successfully updated currency history ({created} new rates).")
 
-        for currency_code in target_currencies:
-            if currency_code in rates:
-                try:
-                    currency = Currency.objects.get(code=currency_code)
-                    # The rate from API is how many `currency_code` you get for 1 RUB.
-                    # We want to store how many RUB you need for 1 `currency_code`.
-                    rate = Decimal(1.0) / Decimal(rates[currency_code])
+    def ingest_rates(self, rates, timestamp, base_currency="RUB"):
+        """
+        Stores one API snapshot of `rates` (units of currency per 1 RUB).
+
+        All currencies are resolved with one query and written with one
+        bulk_create in a single transaction. Rows already stored for the same
+        (currency, timestamp) are skipped, so ingesting a snapshot twice is a
+        no-op. Returns the number of new rows.
+        """
+        codes = (
+            Currency.objects.exclude(code=base_currency)
+            .filter(code__in=list(rates))
+            .values_list('code', flat=True)
+        )
+
+        history = []
+        for code in codes:
+            if not rates[code]:
+                print(f"Skipping {code}: zero rate in the API response")
+                continue
+            # We store how many RUB you need for 1 unit of the currency
+            history.append(CurrencyHistory(
+                currency_id=code,
+                base_currency=base_currency,
+                rate=Decimal(1) / Decimal(str(rates[code])),
+                timestamp=timestamp,
+            ))
+        if not history:
+            return 0
+
+        updated_codes = [row.currency_id for row in history]
+        with transaction.atomic():
+            before = CurrencyHistory.objects.filter(currency__in=updated_codes, timestamp=timestamp).count()
+            CurrencyHistory.objects.bulk_create(history, ignore_conflicts=True)
+            created = CurrencyHistory.objects.filter(currency__in=updated_codes, timestamp=timestamp).count() - before
 
-                    CurrencyHistory.objects.create(
-                        currency=currency,
-                        base_currency="RUB",
-                        rate=rate,
-                        timestamp=aware_timestamp
-                    )
-                except Currency.DoesNotExist:
-                    print(f"Currency with code {currency_code} not found in the database.")
-                except Exception as e:
-                    print(f"Error processing currency {currency_code}: {e}")
-        
-        print("Successfully updated currency history.") 
\ No newline at end of file
+        if created:
+            # Roll the new ticks up into hourly/daily/monthly candles
+            RollupService().refresh('currency', asset_ids=updated_codes)
+            CurrencySnapshotService().refresh(codes=updated_codes)
+        return created
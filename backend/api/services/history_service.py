@@ -0,0 +1,199 @@
+"""
+Bucketed currency history for chart endpoints
+"""
+import logging
+from datetime import timedelta
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from ..models import Currency, CurrencyHistory, CurrencyHistoryRollup
+from .rollup_service import floor_day
+
+logger = logging.getLogger(__name__)
+
+WEEKDAY_LABELS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+MONTH_LABELS = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн',
+                'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
+
+# window  - how far back the chart looks
+# buckets - number of points returned
+# width   - size of a single bucket
+# pick    - which tick represents a bucket ('first' or 'last')
+PERIODS = {
+    'day': {
+        'window': timedelta(hours=24),
+        'buckets': 24,
+        'width': timedelta(hours=1),
+        'pick': 'first',
+        'label': lambda index, start: start.strftime('%H:00'),
+    },
+    'week': {
+        'window': timedelta(days=7),
+        'buckets': 7,
+        'width': timedelta(days=1),
+        'pick': 'last',
+        'label': lambda index, start: WEEKDAY_LABELS[start.weekday()],
+    },
+    'month': {
+        'window': timedelta(days=30),
+        'buckets': 30,
+        'width': timedelta(days=1),
+        'pick': 'last',
+        'label': lambda index, start: str(index + 1),
+    },
+    'year': {
+        'window': timedelta(days=365),
+        'buckets': 12,
+        'width': timedelta(days=30),
+        'pick': 'last',
+        'label': lambda index, start: MONTH_LABELS[start.month - 1],
+    },
+}
+
+
+class CurrencyHistoryService:
+    """
+    Builds chart points for a currency with a single query per request.
+
+    Small windows are streamed once and bucketed in memory. Large windows are
+    resolved by the database in a single statement that returns only the
+    edge ticks of every bucket, so neither the work nor the amount of data
+    leaving the database depends on the tick rate. The yearly chart reads
+    daily candles maintained by RollupService, its bucket edges snap to UTC
+    days.
+    Empty buckets are forward-filled with the last rate seen inside the window
+    (or 0 when nothing has been seen yet).
+    """
+
+    STRATEGY_MEMORY = 'memory'
+    STRATEGY_AGGREGATE = 'aggregate'
+    STRATEGY_ROLLUP = 'rollup'
+
+    # Windows longer than this are resolved by the database. Streaming a day of
+    # ticks is cheaper than 48 seeks, from a week on the seeks win.
+    AGGREGATE_MIN_WINDOW = timedelta(days=1)
+    # Windows longer than this are served from daily candles
+    ROLLUP_MIN_WINDOW = timedelta(days=31)
+    ITERATOR_CHUNK_SIZE = 5000
+
+    def get_points(self, currency, period, now=None, strategy=None):
+        """Return the list of {'timestamp', 'rate'} points for the period"""
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}'")
+
+        spec = PERIODS[period]
+        now = now or timezone.now()
+        start = now - spec['window']
+        bounds = [start + spec['width'] * i for i in range(spec['buckets'] + 1)]
+
+        if strategy is None:
+            strategy = self.choose_strategy(period)
+
+        if strategy == self.STRATEGY_ROLLUP:
+            edges = self._rollup_edges(currency, bounds)
+            if not edges:
+                # Candles have not been built yet
+                strategy = self.STRATEGY_AGGREGATE
+        if strategy == self.STRATEGY_AGGREGATE:
+            edges = self._aggregate_edges(currency, bounds, spec['pick'])
+        elif strategy == self.STRATEGY_MEMORY:
+            edges = self._memory_edges(currency, bounds)
+
+        return self._fill(spec, bounds, edges)
+
+    def choose_strategy(self, period):
+        if PERIODS[period]['window'] > self.ROLLUP_MIN_WINDOW:
+            return self.STRATEGY_ROLLUP
+        if PERIODS[period]['window'] > self.AGGREGATE_MIN_WINDOW:
+            return self.STRATEGY_AGGREGATE
+        return self.STRATEGY_MEMORY
+
+    def _memory_edges(self, currency, bounds):
+        """Stream the window once and collect (first, last) rate per bucket"""
+        edges = {}
+        ticks = (
+            CurrencyHistory.objects
+            .filter(currency=currency, timestamp__gte=bounds[0], timestamp__lt=bounds[-1])
+            .order_by('timestamp')
+            .values_list('timestamp', 'rate')
+            .iterator(chunk_size=self.ITERATOR_CHUNK_SIZE)
+        )
+
+        index = 0
+        for timestamp, rate in ticks:
+            while timestamp >= bounds[index + 1]:
+                index += 1
+            if index in edges:
+                edges[index][1] = rate
+            else:
+                edges[index] = [rate, rate]
+        return edges
+
+    def _aggregate_edges(self, currency, bounds, pick):
+        """
+        Resolve every bucket inside one statement.
+
+        Each bucket becomes a correlated subquery ordered by timestamp with
+        LIMIT 1, which the (currency, timestamp) index answers with a single
+        seek. The cost therefore depends on the number of buckets, not on how
+        many ticks the window holds.
+        """
+        annotations = {}
+        for i in range(len(bounds) - 1):
+            bucket = CurrencyHistory.objects.filter(
+                currency=OuterRef('pk'),
+                timestamp__gte=bounds[i],
+                timestamp__lt=bounds[i + 1],
+            )
+            annotations[f'last_{i}'] = Subquery(bucket.order_by('-timestamp').values('rate')[:1])
+            if pick == 'first':
+                annotations[f'first_{i}'] = Subquery(bucket.order_by('timestamp').values('rate')[:1])
+
+        row = Currency.objects.filter(pk=currency.pk).values(**annotations).first() or {}
+
+        edges = {}
+        for i in range(len(bounds) - 1):
+            last = row.get(f'last_{i}')
+            if last is not None:
+                edges[i] = [row.get(f'first_{i}', last), last]
+        return edges
+
+    def _rollup_edges(self, currency, bounds):
+        """Collect (open, close) per bucket from daily candles"""
+        candles = (
+            CurrencyHistoryRollup.objects
+            .filter(
+                currency=currency,
+                resolution='day',
+                bucket_start__gte=floor_day(bounds[0]),
+                bucket_start__lt=bounds[-1],
+            )
+            .order_by('bucket_start')
+            .values_list('bucket_start', 'open', 'close')
+        )
+
+        edges = {}
+        index = 0
+        for bucket_start, open_rate, close_rate in candles:
+            while bucket_start >= bounds[index + 1]:
+                index += 1
+            if index in edges:
+                edges[index][1] = close_rate
+            else:
+                edges[index] = [open_rate, close_rate]
+        return edges
+
+    def _fill(self, spec, bounds, edges):
+        points = []
+        carry = None
+        for i in range(spec['buckets']):
+            edge = edges.get(i)
+            if edge:
+                rate = edge[0] if spec['pick'] == 'first' else edge[1]
+                carry = edge[1]
+            else:
+                rate = carry
+            points.append({
+                'timestamp': spec['label'](i, bounds[i]),
+                'rate': float(rate) if rate is not None else 0,
+            })
+        return points
@@ -0,0 +1,128 @@
+"""
+Idempotency-Key handling for money-moving endpoints
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from ..models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyService:
+    """
+    Runs a request at most once per (user, Idempotency-Key).
+
+    The first request inserts the key, runs the handler and stores its
+    response in the same transaction. A retry costs one lookup on the
+    (user, key) unique index and gets the stored response back without the
+    handler running, so no card row is read or locked. A concurrent retry
+    waits on the unique index until the first request commits, then
+    replays its response. Server errors are not stored, so the client can
+    retry them.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+
+    @staticmethod
+    def fingerprint(request):
+        data = request.data
+        if hasattr(data, 'dict'):
+            data = data.dict()
+        payload = json.dumps(data, sort_keys=True, default=str)
+        return hashlib.sha256(f"{request.method} {request.path}\n{payload}".encode()).hexdigest()
+
+    def run(self, request, handler):
+        """
+        Call handler() unless the request's Idempotency-Key was already used,
+        in which case the stored response is returned instead.
+        """
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return handler()
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fingerprint = self.fingerprint(request)
+        now = timezone.now()
+        record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if record is not None and record.expires_at > now:
+            return self.replay(record, fingerprint)
+
+        with transaction.atomic():
+            if record is not None:
+                IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user,
+                        key=key,
+                        endpoint=request.path,
+                        fingerprint=fingerprint,
+                        expires_at=now + self.ttl,
+                    )
+            except IntegrityError:
+                # A concurrent request with the same key won the race
+                record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+                if record is None:
+                    # ...and failed with a server error, the client may retry
+                    return Response(
+                        {'error': 'A request with this Idempotency-Key is still in progress.'},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                return self.replay(record, fingerprint)
+
+            response = handler()
+            if response.status_code >= 500:
+                record.delete()
+                return response
+
+            record.status_code = response.status_code
+            record.response_body = json.loads(JSONRenderer().render(response.data) or 'null')
+            record.save(update_fields=['status_code', 'response_body'])
+        return response
+
+    def replay(self, record, fingerprint):
+        if record.fingerprint != fingerprint:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} was already used with a different request.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if record.status_code is None:
+            return Response(
+                {'error': 'A request with this Idempotency-Key is still in progress.'},
+                status=status.HTTP_409_CONFLICT
+            )
+        logger.info(f"Replaying response for Idempotency-Key {record.key} on {record.endpoint}")
+        response = Response(record.response_body, status=record.status_code)
+        response[REPLAYED_HEADER] = 'true'
+        return response
+
+    def purge_expired(self):
+        """Delete expired keys. Returns the number of keys deleted."""
+        deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+def idempotent(view_method):
+    """Decorate a view's post/create method to honour the Idempotency-Key header"""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        return IdempotencyService().run(request, lambda: view_method(self, request, *args, **kwargs))
+    return wrapper
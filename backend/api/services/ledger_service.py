@@ -0,0 +1,119 @@
+"""
+Balances, checkpoints and audits over the double-entry ledger
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from ..models import Card, LedgerPosting, LedgerCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# Postings younger than this are left out of a checkpoint: ids are handed out
+# before commit, so a recent id may still belong to an open transaction
+CHECKPOINT_LAG = timedelta(minutes=5)
+
+
+class LedgerService:
+    """
+    Reads card balances from LedgerPosting. A balance is the latest
+    LedgerCheckpoint of the card plus the postings made after it, a short
+    range scan on the (card, id) index. checkpoint() is run periodically so
+    that range stays short.
+    """
+
+    def balance_at(self, card_id, at=None):
+        """Balance of a card after every posting made up to `at` (now when None)"""
+        checkpoints = LedgerCheckpoint.objects.filter(card_id=card_id)
+        postings = LedgerPosting.objects.filter(card_id=card_id)
+        if at is not None:
+            checkpoints = checkpoints.filter(as_of__lte=at)
+            postings = postings.filter(created_at__lte=at)
+
+        checkpoint = checkpoints.order_by('-last_posting_id').first()
+        balance = Decimal('0')
+        if checkpoint is not None:
+            balance = checkpoint.balance
+            postings = postings.filter(id__gt=checkpoint.last_posting_id)
+        return balance + (postings.aggregate(total=Sum('amount'))['total'] or 0)
+
+    def balances(self, card_ids=None):
+        """Current ledger balance of many cards with two queries: {card_id: balance}"""
+        postings = LedgerPosting.objects.filter(account=LedgerPosting.ACCOUNT_CARD)
+        if card_ids is not None:
+            postings = postings.filter(card_id__in=card_ids)
+        result = self.balances_at_checkpoint(card_ids)
+        for row in self._postings_since_checkpoint(postings).annotate(total=Sum('amount')):
+            result[row['card_id']] = result.get(row['card_id'], 0) + row['total']
+        return result
+
+    def _postings_since_checkpoint(self, postings):
+        """Postings after the latest checkpoint of their card, grouped by card"""
+        checkpoints = LedgerCheckpoint.objects.filter(card_id=OuterRef('card_id')).order_by('-last_posting_id')
+        return (
+            postings
+            .annotate(checkpoint_id=Coalesce(Subquery(checkpoints.values('last_posting_id')[:1]), Value(0)))
+            .filter(id__gt=F('checkpoint_id'))
+            .values('card_id')
+            .order_by()
+        )
+
+    def checkpoint(self, now=None):
+        """
+        Checkpoint every card with postings since its last checkpoint, up to
+        the last posting older than CHECKPOINT_LAG.
+        Returns the number of checkpoints written.
+        """
+        settled = (now or timezone.now()) - CHECKPOINT_LAG
+        with transaction.atomic():
+            watermark = LedgerPosting.objects.filter(created_at__lte=settled).aggregate(last=Max('id'))['last']
+            if watermark is None:
+                return 0
+            postings = LedgerPosting.objects.filter(account=LedgerPosting.ACCOUNT_CARD, id__lte=watermark)
+            moved = list(
+                self._postings_since_checkpoint(postings)
+                .annotate(delta=Sum('amount'), last_posting_id=Max('id'), as_of=Max('created_at'))
+            )
+            previous = self.balances_at_checkpoint([row['card_id'] for row in moved])
+            LedgerCheckpoint.objects.bulk_create([
+                LedgerCheckpoint(
+                    card_id=row['card_id'],
+                    last_posting_id=row['last_posting_id'],
+                    as_of=row['as_of'],
+                    balance=previous.get(row['card_id'], 0) + row['delta'],
+                )
+                for row in moved
+            ], batch_size=1000)
+        logger.info(f"Wrote {len(moved)} ledger checkpoints up to posting {watermark}")
+        return len(moved)
+
+    def balances_at_checkpoint(self, card_ids=None):
+        """
+        Balance of the latest checkpoint of each card: {card_id: balance}.
+        Older checkpoints are left in the database, each found by an index
+        lookup on (card, last_posting_id).
+        """
+        newest = LedgerCheckpoint.objects.filter(card_id=OuterRef('card_id')).order_by('-last_posting_id')
+        latest = LedgerCheckpoint.objects.filter(last_posting_id=Subquery(newest.values('last_posting_id')[:1]))
+        if card_ids is not None:
+            latest = latest.filter(card_id__in=card_ids)
+        return dict(latest.values_list('card_id', 'balance'))
+
+    def discrepancies(self, card_ids=None):
+        """
+        Cards whose cached Card.balance differs from the ledger.
+        Returns [(card_id, card_balance, ledger_balance)].
+        """
+        ledger = self.balances(card_ids)
+        cards = Card.objects.all()
+        if card_ids is not None:
+            cards = cards.filter(id__in=card_ids)
+        return [
+            (card_id, balance, ledger.get(card_id, Decimal('0')))
+            for card_id, balance in cards.values_list('id', 'balance')
+            if balance != ledger.get(card_id, Decimal('0'))
+        ]
+
@@ -0,0 +1,149 @@
+"""
+Monthly range partitioning of the raw price-history tables (PostgreSQL only)
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+from django.db import connection, transaction
+from django.utils import timezone
+from .rollup_service import floor_month, next_month
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionService:
+    """
+    Converts a tick table into a table partitioned by month of `timestamp`
+    and maintains its partitions.
+
+    Partitions are named <table>_pYYYYMM. Dropping a whole month is a cheap
+    catalog operation, and the (asset, timestamp) indexes stay as small as a
+    single month. Rows outside the created months land in <table>_default.
+    """
+
+    DEFAULT_SUFFIX = '_default'
+
+    def is_supported(self):
+        return connection.vendor == 'postgresql'
+
+    def is_partitioned(self, model):
+        if not self.is_supported():
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = %s",
+                [model._meta.db_table],
+            )
+            return cursor.fetchone() is not None
+
+    def partitions(self, model):
+        """Return [(name, month_start)] of the monthly partitions, oldest first"""
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.relname = %s",
+                [table],
+            )
+            names = [row[0] for row in cursor.fetchall()]
+
+        months = []
+        for name in names:
+            suffix = name[len(table):]
+            if suffix.startswith('_p') and len(suffix) == 8:
+                month = datetime.strptime(suffix[2:], '%Y%m').replace(tzinfo=dt_timezone.utc)
+                months.append((name, month))
+        return sorted(months, key=lambda item: item[1])
+
+    def horizon(self, months_ahead):
+        """Start of the month `months_ahead` months after the current one ends"""
+        end = next_month(timezone.now())
+        for _ in range(months_ahead):
+            end = next_month(end)
+        return end
+
+    def ensure_partitions(self, model, start, end):
+        """Create the monthly partitions covering [start, end)"""
+        table = model._meta.db_table
+        created = 0
+        month = floor_month(start)
+        with connection.cursor() as cursor:
+            while month < end:
+                name = f"{table}_p{month:%Y%m}"
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+                    f"FOR VALUES FROM (%s) TO (%s)",
+                    [month, next_month(month)],
+                )
+                created += 1
+                month = next_month(month)
+        return created
+
+    def drop_partitions_before(self, model, cutoff):
+        """Drop the monthly partitions that end before cutoff, returns the number of rows dropped"""
+        dropped_rows = 0
+        table = model._meta.db_table
+        for name, month in self.partitions(model):
+            if next_month(month) > cutoff:
+                break
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM "{name}"')
+                dropped_rows += cursor.fetchone()[0]
+                cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+                cursor.execute(f'DROP TABLE "{name}"')
+            logger.info(f"Dropped partition {name}")
+        return dropped_rows
+
+    def convert(self, model, months_ahead=2):
+        """
+        Rebuild the table as a partitioned one and copy the rows over.
+
+        Runs in one transaction and holds an exclusive lock on the table while
+        the rows are copied, so it is meant as a one-off maintenance step.
+        The primary key becomes (id, timestamp) because PostgreSQL requires
+        the partition key in every unique constraint.
+        """
+        if not self.is_supported():
+            raise ValueError('Partitioning requires PostgreSQL')
+        if self.is_partitioned(model):
+            return False
+
+        table = model._meta.db_table
+        legacy = f"{table}_unpartitioned"
+        asset_field = next(field for field in model._meta.fields if field.is_relation)
+        target = asset_field.related_model._meta
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+                cursor.execute(
+                    f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) '
+                    f'PARTITION BY RANGE ("timestamp")'
+                )
+                cursor.execute(f'SELECT MIN("timestamp") FROM "{legacy}"')
+                first = cursor.fetchone()[0] or timezone.now()
+                cursor.execute(f'CREATE TABLE "{table}{self.DEFAULT_SUFFIX}" PARTITION OF "{table}" DEFAULT')
+
+            self.ensure_partitions(model, first, self.horizon(months_ahead))
+
+            with connection.cursor() as cursor:
+                cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{legacy}"')
+                cursor.execute(f'DROP TABLE "{legacy}"')
+                cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY ("id", "timestamp")')
+                cursor.execute(
+                    f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_{asset_field.column}_fk" '
+                    f'FOREIGN KEY ("{asset_field.column}") '
+                    f'REFERENCES "{target.db_table}" ("{target.pk.column}") DEFERRABLE INITIALLY DEFERRED'
+                )
+
+            # Recreate the model's own indexes and constraints under their Django names
+            with connection.schema_editor(atomic=False) as editor:
+                for constraint in model._meta.constraints:
+                    editor.add_constraint(model, constraint)
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+
+        logger.info(f"Partitioned {table} by month starting {first:%Y-%m}")
+        return True
@@ -0,0 +1,110 @@
+"""
+Retention policy for the raw price-history tables
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from .partition_service import PartitionService
+from .rollup_service import RollupService, SOURCES, floor_hour
+
+logger = logging.getLogger(__name__)
+
+# Day/week/month charts and the currency list sparkline read raw ticks of the
+# last 30 days, so they must never be pruned
+RETENTION_MIN_DAYS = 31
+
+
+class RetentionService:
+    """
+    Compacts raw ticks older than the retention period into candles and
+    deletes them.
+
+    Candles are brought up to date first and a tick is only deleted when it
+    lies before both the cutoff and the last hourly candle of its asset, so
+    nothing is lost that is not already represented by a candle. On
+    partitioned tables whole months are dropped; the remainder is deleted
+    in small batches, each in its own short transaction, so the table is
+    never locked for long.
+    """
+
+    BATCH_SIZE = 5000
+    # Monthly partitions created ahead of time so new ticks never land in
+    # the default partition
+    PARTITION_MONTHS_AHEAD = 2
+
+    def __init__(self, days=None, batch_size=None):
+        self.days = days if days is not None else settings.PRICE_HISTORY_RETENTION_DAYS
+        if self.days < RETENTION_MIN_DAYS:
+            raise ValueError(f"Retention must be at least {RETENTION_MIN_DAYS} days, got {self.days}")
+        self.batch_size = batch_size or self.BATCH_SIZE
+
+    def cutoff(self, now=None):
+        return floor_hour((now or timezone.now()) - timedelta(days=self.days))
+
+    def apply(self, source, now=None, dry_run=False):
+        """
+        Apply the policy to one source ('currency' or 'crypto').
+        Returns {'deleted': rows, 'dropped': rows removed with whole partitions}.
+        """
+        config = SOURCES[source]
+        tick_model = config['tick_model']
+        asset_field = config['asset_field']
+        cutoff = self.cutoff(now)
+
+        if not dry_run:
+            RollupService().refresh(source)
+        watermarks = dict(
+            config['rollup_model'].objects
+            .filter(resolution='hour')
+            .values_list(asset_field)
+            .annotate(last=Max('bucket_start'))
+        )
+
+        dropped = 0
+        partitions = PartitionService()
+        if not dry_run and partitions.is_partitioned(tick_model):
+            partitions.ensure_partitions(tick_model, timezone.now(), partitions.horizon(self.PARTITION_MONTHS_AHEAD))
+            if self._all_rolled_up(config, watermarks, cutoff):
+                dropped = partitions.drop_partitions_before(tick_model, cutoff)
+
+        deleted = 0
+        for asset_id, watermark in watermarks.items():
+            expired = tick_model.objects.filter(
+                timestamp__lt=min(cutoff, watermark), **{asset_field: asset_id}
+            )
+            if dry_run:
+                deleted += expired.count()
+            else:
+                deleted += self._delete_in_batches(expired)
+
+        logger.info(f"Retention for {source}: deleted {deleted} ticks, dropped {dropped} with partitions")
+        return {'deleted': deleted, 'dropped': dropped}
+
+    def apply_all(self, now=None, dry_run=False):
+        return {source: self.apply(source, now=now, dry_run=dry_run) for source in SOURCES}
+
+    def _all_rolled_up(self, config, watermarks, cutoff):
+        """True when every asset with expired ticks has candles"""
+        for asset_id in config['asset_model'].objects.values_list('pk', flat=True):
+            if asset_id in watermarks:
+                continue
+            if config['tick_model'].objects.filter(
+                timestamp__lt=cutoff, **{config['asset_field']: asset_id}
+            ).exists():
+                return False
+        return True
+
+    def _delete_in_batches(self, queryset):
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(queryset.order_by('timestamp').values_list('pk', flat=True)[:self.batch_size])
+                if not ids:
+                    break
+                # Keeping the timestamp filter lets PostgreSQL prune partitions
+                count, _ = queryset.filter(pk__in=ids).delete()
+                deleted += count
+        return deleted
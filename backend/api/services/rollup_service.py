@@ -0,0 +1,195 @@
+"""
+Incremental OHLC rollups of the raw price-history tables
+"""
+import logging
+from datetime import timedelta
+from django.db.models import Max
+from ..models import (
+    Currency, CurrencyHistory, CurrencyHistoryRollup,
+    CryptoCurrency, CryptoPriceHistory, CryptoPriceRollup,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(value):
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def floor_month(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(value):
+    return floor_month(floor_month(value) + timedelta(days=32))
+
+
+# asset_field  - FK from the tick/rollup model to the asset
+# price_field  - tick column the candle is built from
+# extra_fields - tick columns copied from the last tick of the bucket
+SOURCES = {
+    'currency': {
+        'asset_model': Currency,
+        'tick_model': CurrencyHistory,
+        'rollup_model': CurrencyHistoryRollup,
+        'asset_field': 'currency',
+        'price_field': 'rate',
+        'extra_fields': [],
+    },
+    'crypto': {
+        'asset_model': CryptoCurrency,
+        'tick_model': CryptoPriceHistory,
+        'rollup_model': CryptoPriceRollup,
+        'asset_field': 'cryptocurrency',
+        'price_field': 'price_usd',
+        'extra_fields': ['market_cap', 'volume_24h'],
+    },
+}
+
+
+class RollupService:
+    """
+    Keeps hourly, daily and monthly candles in sync with the raw ticks.
+
+    A refresh only rebuilds the buckets touched by new ticks: hourly candles
+    are rebuilt from the last rolled-up hour of every asset onwards, daily
+    candles are re-merged from the hourly candles of the touched days and
+    monthly candles from the daily candles of the touched months.
+    """
+
+    ITERATOR_CHUNK_SIZE = 10000
+    BATCH_SIZE = 1000
+
+    def refresh(self, source, asset_ids=None, since=None, full=False):
+        """
+        Roll up new ticks of one source ('currency' or 'crypto').
+
+        since - rebuild from this moment even if it is older than the
+                watermark (use after backfilling old ticks)
+        full  - rebuild every candle from the first tick
+        Returns the number of candles written.
+        """
+        config = SOURCES[source]
+        asset_ids = list(asset_ids) if asset_ids is not None else list(
+            config['asset_model'].objects.values_list('pk', flat=True)
+        )
+
+        watermarks = {}
+        if not full and since is None:
+            watermarks = dict(
+                config['rollup_model'].objects
+                .filter(resolution='hour', **{f"{config['asset_field']}__in": asset_ids})
+                .values_list(config['asset_field'])
+                .annotate(last=Max('bucket_start'))
+            )
+
+        written = 0
+        for asset_id in asset_ids:
+            start = None if full else (since or watermarks.get(asset_id))
+            written += self._refresh_asset(config, asset_id, start)
+
+        logger.info(f"Refreshed {written} {source} candles for {len(asset_ids)} assets")
+        return written
+
+    def refresh_all(self, since=None, full=False):
+        return sum(self.refresh(source, since=since, full=full) for source in SOURCES)
+
+    def _refresh_asset(self, config, asset_id, start):
+        hours = self._hourly_candles(config, asset_id, start)
+        if not hours:
+            return 0
+        self._save(config, asset_id, 'hour', hours)
+
+        first_day = floor_day(hours[0]['bucket_start'])
+        last_day = floor_day(hours[-1]['bucket_start'])
+        days = self._merge(
+            self._candles(config, asset_id, 'hour', first_day, last_day + timedelta(days=1)),
+            floor_day,
+        )
+        self._save(config, asset_id, 'day', days)
+
+        first_month = floor_month(first_day)
+        months = self._merge(
+            self._candles(config, asset_id, 'day', first_month, next_month(last_day)),
+            floor_month,
+        )
+        self._save(config, asset_id, 'month', months)
+
+        return len(hours) + len(days) + len(months)
+
+    def _hourly_candles(self, config, asset_id, start):
+        ticks = config['tick_model'].objects.filter(**{config['asset_field']: asset_id})
+        if start is not None:
+            ticks = ticks.filter(timestamp__gte=floor_hour(start))
+        ticks = (
+            ticks.order_by('timestamp')
+            .values_list('timestamp', config['price_field'], *config['extra_fields'])
+            .iterator(chunk_size=self.ITERATOR_CHUNK_SIZE)
+        )
+
+        candles = []
+        current = None
+        for timestamp, price, *extras in ticks:
+            bucket = floor_hour(timestamp)
+            if current is None or current['bucket_start'] != bucket:
+                current = {
+                    'bucket_start': bucket,
+                    'open': price, 'high': price, 'low': price,
+                    'ticks': 0,
+                }
+                candles.append(current)
+            current['high'] = max(current['high'], price)
+            current['low'] = min(current['low'], price)
+            current['close'] = price
+            current['ticks'] += 1
+            current.update(zip(config['extra_fields'], extras))
+        return candles
+
+    def _candles(self, config, asset_id, resolution, start, end):
+        fields = ['bucket_start', 'open', 'high', 'low', 'close', 'ticks', *config['extra_fields']]
+        return list(
+            config['rollup_model'].objects
+            .filter(
+                resolution=resolution,
+                bucket_start__gte=start,
+                bucket_start__lt=end,
+                **{config['asset_field']: asset_id},
+            )
+            .order_by('bucket_start')
+            .values(*fields)
+        )
+
+    def _merge(self, candles, floor):
+        """Merge ordered candles into coarser ones"""
+        merged = []
+        current = None
+        for candle in candles:
+            bucket = floor(candle['bucket_start'])
+            if current is None or current['bucket_start'] != bucket:
+                current = dict(candle, bucket_start=bucket)
+                merged.append(current)
+                continue
+            current['high'] = max(current['high'], candle['high'])
+            current['low'] = min(current['low'], candle['low'])
+            current['ticks'] += candle['ticks']
+            # Close and market data come from the latest candle
+            current.update({k: v for k, v in candle.items() if k not in ('bucket_start', 'open', 'high', 'low', 'ticks')})
+        return merged
+
+    def _save(self, config, asset_id, resolution, candles):
+        model = config['rollup_model']
+        objects = [
+            model(resolution=resolution, **{f"{config['asset_field']}_id": asset_id}, **candle)
+            for candle in candles
+        ]
+        model.objects.bulk_create(
+            objects,
+            batch_size=self.BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=[config['asset_field'], 'resolution', 'bucket_start'],
+            update_fields=['open', 'high', 'low', 'close', 'ticks', *config['extra_fields']],
+        )
@@ -0,0 +1,77 @@
+"""
+Latest-rate snapshot of every currency for the currency list endpoint
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from ..models import Currency, CurrencyHistory, CurrencyRateSnapshot
+
+logger = logging.getLogger(__name__)
+
+SPARKLINE_WINDOW = timedelta(days=30)
+
+
+class CurrencySnapshotService:
+    """
+    Maintains CurrencyRateSnapshot, the latest and the previous rate of every
+    currency, so listing currencies does not touch CurrencyHistory per row.
+    """
+
+    def refresh(self, codes=None):
+        """
+        Recompute the snapshot of the given currencies (all when None).
+        The latest two ticks of every currency are resolved in one query, and
+        currencies left without history lose their snapshot. Returns the
+        number of snapshots written.
+        """
+        latest = CurrencyHistory.objects.filter(currency=OuterRef('pk')).order_by('-timestamp')
+        currencies = Currency.objects.all()
+        if codes is not None:
+            currencies = currencies.filter(code__in=codes)
+        rows = (
+            currencies
+            .annotate(
+                rate=Subquery(latest.values('rate')[:1]),
+                previous_rate=Subquery(latest.values('rate')[1:2]),
+                timestamp=Subquery(latest.values('timestamp')[:1]),
+            )
+            .filter(rate__isnull=False)
+            .values('code', 'rate', 'previous_rate', 'timestamp')
+        )
+
+        snapshots = [
+            CurrencyRateSnapshot(
+                currency_id=row['code'],
+                rate=row['rate'],
+                previous_rate=row['previous_rate'],
+                timestamp=row['timestamp'],
+            )
+            for row in rows
+        ]
+        CurrencyRateSnapshot.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=['currency'],
+            update_fields=['rate', 'previous_rate', 'timestamp', 'updated_at'],
+        )
+        CurrencyRateSnapshot.objects.filter(currency__in=currencies).exclude(
+            currency__in=[snapshot.currency_id for snapshot in snapshots]
+        ).delete()
+        logger.info(f"Refreshed {len(snapshots)} currency snapshots")
+        return len(snapshots)
+
+    def sparklines(self, codes, now=None):
+        """Ticks of the last 30 days for all given currencies in one query"""
+        since = (now or timezone.now()) - SPARKLINE_WINDOW
+        history = (
+            CurrencyHistory.objects
+            .filter(currency__in=codes, timestamp__gte=since)
+            .order_by('timestamp')
+            .only('currency_id', 'rate', 'timestamp')
+        )
+        by_currency = defaultdict(list)
+        for tick in history:
+            by_currency[tick.currency_id].append(tick)
+        return by_currency
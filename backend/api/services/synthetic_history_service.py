@@ -0,0 +1,233 @@
+"""
+Vectorized synthetic price history for load testing and benchmarks
+"""
+import io
+import logging
+import uuid
+from functools import partial
+from datetime import datetime, timedelta, timezone as dt_timezone
+import numpy as np
+from django.db import connection, transaction
+from ..models import (
+    Currency, CurrencyHistory, CurrencyRateSnapshot,
+    CryptoCurrency, CryptoPriceHistory,
+)
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+YEAR = timedelta(days=365)
+
+# Starting RUB rates for currencies without history
+BASE_RATES = {
+    'USD': 78.49,
+    'EUR': 90.25,
+    'CNY': 10.92,
+    'GBP': 105.50,
+    'JPY': 0.54,
+    'KZT': 0.15,
+}
+DEFAULT_RATE = 50.0
+DEFAULT_CRYPTO_PRICE = 100.0
+DEFAULT_CRYPTO_SUPPLY = 10_000_000
+
+# volatility - annualized volatility of the random walk
+# decimals   - decimal places of the price column
+SOURCES = {
+    'currency': {
+        'asset_model': Currency,
+        'tick_model': CurrencyHistory,
+        'asset_field': 'currency',
+        'volatility': 0.10,
+        'decimals': 10,
+    },
+    'crypto': {
+        'asset_model': CryptoCurrency,
+        'tick_model': CryptoPriceHistory,
+        'asset_field': 'cryptocurrency',
+        'volatility': 0.60,
+        'decimals': 8,
+    },
+}
+
+
+class SyntheticHistoryService:
+    """
+    Generates price ticks with a geometric Brownian motion.
+
+    Prices, timestamps and ids are produced chunk by chunk with NumPy, so
+    memory stays flat no matter how long the range is. Chunks are written
+    with COPY on PostgreSQL and with bulk_create elsewhere (or whenever
+    existing rows have to be skipped).
+    """
+
+    CHUNK_SIZE = 200_000
+    BULK_BATCH_SIZE = 5000
+
+    METHOD_AUTO = 'auto'
+    METHOD_BULK = 'bulk'
+    METHOD_COPY = 'copy'
+
+    def __init__(self, seed=None, method=METHOD_AUTO, chunk_size=None):
+        self.rng = np.random.default_rng(seed)
+        # Ids must stay unique across runs with the same seed
+        self.id_rng = np.random.default_rng()
+        self.method = method
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+
+    def start_prices(self, source, asset_ids=None):
+        """Latest known price of every asset, or a default one"""
+        if source == 'currency':
+            currencies = Currency.objects.exclude(code='RUB')
+            if asset_ids is not None:
+                currencies = currencies.filter(code__in=asset_ids)
+            snapshots = dict(CurrencyRateSnapshot.objects.values_list('currency', 'rate'))
+            return {
+                code: float(snapshots.get(code) or BASE_RATES.get(code, DEFAULT_RATE))
+                for code in currencies.values_list('code', flat=True)
+            }
+
+        cryptos = CryptoCurrency.objects.filter(is_active=True)
+        if asset_ids is not None:
+            cryptos = cryptos.filter(id__in=asset_ids)
+        return {
+            crypto_id: float(price) or DEFAULT_CRYPTO_PRICE
+            for crypto_id, price in cryptos.values_list('id', 'current_price_usd')
+        }
+
+    def generate(self, source, start, end, interval, asset_ids=None, volatility=None, ignore_conflicts=False):
+        """Generate [start, end) for every asset of the source, returns rows written"""
+        written = 0
+        for asset_id, price in self.start_prices(source, asset_ids).items():
+            written += self.generate_asset(
+                source, asset_id, price, start, end, interval,
+                volatility=volatility, ignore_conflicts=ignore_conflicts,
+            )
+        return written
+
+    def generate_asset(self, source, asset_id, start_price, start, end, interval,
+                       volatility=None, ignore_conflicts=False):
+        """
+        Generate ticks of one asset every `interval` in [start, end).
+
+        ignore_conflicts - skip ticks that already exist instead of failing
+                           (forces bulk_create, COPY cannot skip rows)
+        Returns the number of rows written.
+        """
+        config = SOURCES[source]
+        step = interval // timedelta(microseconds=1)
+        first = (start - EPOCH) // timedelta(microseconds=1)
+        total = max(0, -(-((end - start) // timedelta(microseconds=1)) // step))
+        volatility = config['volatility'] if volatility is None else volatility
+        write = self._writer(ignore_conflicts)
+
+        before = self._count(config, asset_id, start, end) if ignore_conflicts else 0
+        price = start_price
+        supply = self._supply(asset_id) if source == 'crypto' else None
+        written = 0
+        for offset in range(0, total, self.chunk_size):
+            size = min(self.chunk_size, total - offset)
+            timestamps = first + (np.arange(offset, offset + size, dtype=np.int64) * step)
+            prices = self.random_walk(price, size, interval, volatility)
+            price = prices[-1]
+            with transaction.atomic():
+                written += write(source, asset_id, timestamps, np.round(prices, config['decimals']), supply)
+
+        if ignore_conflicts:
+            written = self._count(config, asset_id, start, end) - before
+        logger.info(f"Generated {written} {source} ticks for {asset_id}")
+        return written
+
+    def random_walk(self, start_price, steps, interval, volatility):
+        """Geometric Brownian motion with zero drift, starting one step after start_price"""
+        dt = interval / YEAR
+        shocks = self.rng.standard_normal(steps) * (volatility * np.sqrt(dt)) - (volatility ** 2 / 2) * dt
+        return start_price * np.exp(np.cumsum(shocks))
+
+    def _writer(self, ignore_conflicts):
+        method = self.method
+        if method == self.METHOD_AUTO:
+            method = self.METHOD_COPY if connection.vendor == 'postgresql' else self.METHOD_BULK
+        if method == self.METHOD_COPY and not ignore_conflicts:
+            return self._write_copy
+        return partial(self._write_bulk, ignore_conflicts=ignore_conflicts)
+
+    def _uuids(self, size):
+        """Random version 4 UUIDs as a (size, 16) byte matrix"""
+        raw = self.id_rng.integers(0, 256, size=(size, 16), dtype=np.uint8)
+        raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+        raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+        return raw
+
+    def _supply(self, asset_id):
+        crypto = CryptoCurrency.objects.filter(pk=asset_id).values('current_price_usd', 'market_cap').first() or {}
+        if crypto.get('current_price_usd') and crypto.get('market_cap'):
+            return crypto['market_cap'] / float(crypto['current_price_usd'])
+        return DEFAULT_CRYPTO_SUPPLY
+
+    def _market_data(self, prices, supply):
+        market_caps = (prices * supply).astype(np.int64)
+        volumes = (market_caps * self.rng.uniform(0.02, 0.10, len(prices))).astype(np.int64)
+        return market_caps, volumes
+
+    def _write_bulk(self, source, asset_id, timestamps, prices, supply, ignore_conflicts=False):
+        config = SOURCES[source]
+        ids = self._uuids(len(prices)).tobytes()
+        moments = [EPOCH + timedelta(microseconds=int(value)) for value in timestamps]
+        common = {f"{config['asset_field']}_id": asset_id}
+
+        if source == 'currency':
+            rows = [
+                CurrencyHistory(id=uuid.UUID(bytes=ids[i * 16:i * 16 + 16]), rate=price, timestamp=moment, **common)
+                for i, (price, moment) in enumerate(zip(prices.tolist(), moments))
+            ]
+        else:
+            market_caps, volumes = self._market_data(prices, supply)
+            rows = [
+                CryptoPriceHistory(
+                    id=uuid.UUID(bytes=ids[i * 16:i * 16 + 16]), price_usd=price,
+                    market_cap=cap, volume_24h=volume, timestamp=moment, **common
+                )
+                for i, (price, cap, volume, moment) in enumerate(
+                    zip(prices.tolist(), market_caps.tolist(), volumes.tolist(), moments)
+                )
+            ]
+        config['tick_model'].objects.bulk_create(
+            rows, batch_size=self.BULK_BATCH_SIZE, ignore_conflicts=ignore_conflicts
+        )
+        return len(rows)
+
+    def _write_copy(self, source, asset_id, timestamps, prices, supply):
+        config = SOURCES[source]
+        hex_ids = self._uuids(len(prices)).tobytes().hex()
+        moments = np.datetime_as_string(timestamps.astype('datetime64[us]'), unit='us')
+        price_format = f"%.{config['decimals']}f"
+
+        if source == 'currency':
+            columns = ['id', 'currency_id', 'base_currency', 'rate', 'timestamp']
+            lines = (
+                f"{hex_ids[i * 32:i * 32 + 32]},{asset_id},RUB,{price_format % price},{moment}+00\n"
+                for i, (price, moment) in enumerate(zip(prices.tolist(), moments.tolist()))
+            )
+        else:
+            columns = ['id', 'cryptocurrency_id', 'price_usd', 'market_cap', 'volume_24h', 'timestamp']
+            market_caps, volumes = self._market_data(prices, supply)
+            lines = (
+                f"{hex_ids[i * 32:i * 32 + 32]},{asset_id},{price_format % price},{cap},{volume},{moment}+00\n"
+                for i, (price, cap, volume, moment) in enumerate(
+                    zip(prices.tolist(), market_caps.tolist(), volumes.tolist(), moments.tolist())
+                )
+            )
+
+        buffer = io.StringIO(''.join(lines))
+        table = config['tick_model']._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        return len(prices)
+
+    def _count(self, config, asset_id, start, end):
+        return config['tick_model'].objects.filter(
+            timestamp__gte=start, timestamp__lt=end, **{config['asset_field']: asset_id}
+        ).count()
@@ -1,5 +1,11 @@
 from celery import shared_task
 from .services.currency_service import CurrencyAPIService
+from .services.rollup_service import RollupService
+from .services.retention_service import RetentionService
+from .services.balance_service import BalanceReconciliationService
+from .services.idempotency_service import IdempotencyService
+from .services.ledger_service import LedgerService
+from .services.credit_score_service import CreditScoreService
 
 @shared_task
 def update_currency_rates_task():
@@ -8,4 +14,66 @@ def update_currency_rates_task():
     """
     print("Executing update_currency_rates_task...")
     CurrencyAPIService.update_currency_history()
-    print("Finished update_currency_rates_task.") 
\ No newline at end of file
+    print("Finished update_currency_rates_task.")
+
+@shared_task
+def refresh_price_rollups_task():
+    """
+    A Celery task to roll new price ticks up into OHLC candles.
+    """
+    written = RollupService().refresh_all()
+    print(f"Refreshed {written} price candles.")
+
+@shared_task
+def apply_price_retention_task():
+    """
+    A Celery task to compact and prune raw price ticks older than
+    PRICE_HISTORY_RETENTION_DAYS.
+    """
+    results = RetentionService().apply_all()
+    for source, result in results.items():
+        print(f"Retention {source}: deleted {result['deleted']} ticks, dropped {result['dropped']} with partitions.")
+
+@shared_task
+def reconcile_total_balances_task():
+    """
+    A Celery task to repair users whose total_balance drifted from the sum
+    of their cards and deposits.
+    """
+    corrected = BalanceReconciliationService().reconcile()
+    print(f"Reconciled total balances: {corrected} accounts corrected.")
+
+@shared_task
+def purge_idempotency_keys_task():
+    """
+    A Celery task to delete Idempotency-Key records past their TTL.
+    """
+    deleted = IdempotencyService().purge_expired()
+    print(f"Purged {deleted} expired idempotency keys.")
+
+@shared_task
+def ledger_checkpoint_task():
+    """
+    A Celery task to checkpoint card balances in the ledger, so a balance
+    read never scans more than the postings since the last run.
+    """
+    written = LedgerService().checkpoint()
+    print(f"Wrote {written} ledger checkpoints.")
+
+@shared_task
+def refresh_credit_scores_task(check_watermarks=False):
+    """
+    A Celery task to recompute the stored credit scores whose inputs
+    changed or that were scored on an earlier day.
+    """
+    refreshed = CreditScoreService().refresh(check_watermarks=check_watermarks)
+    print(f"Refreshed {refreshed} credit scores.")
+
+@shared_task
+def rescore_all_credit_scores_task():
+    """
+    A Celery task to recompute the credit score of every user, run nightly
+    so that risk has a current score for each customer.
+    """
+    stats = CreditScoreService().rescore_all()
+    print(f"Rescored {stats['users']} users in {stats['seconds']}s ({stats['users_per_second']} users/s).")
@@ -0,0 +1,55 @@
+"""
+Test runner and assertions for query budgets, and factories shared by the tests
+"""
+from decimal import Decimal
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from .models import Card
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """
+    Runs the suite with QUERY_BUDGET_ENFORCE on, so that any test request
+    to a view over its declared query_budget fails with QueryBudgetExceeded.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._enforce_budgets = override_settings(QUERY_BUDGET_ENFORCE=True)
+        self._enforce_budgets.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._enforce_budgets.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetAssertionsMixin:
+    """Assertions on the query_stats that QueryBudgetMiddleware leaves on a response"""
+
+    def assertWithinQueryBudget(self, response, budget=None):
+        """At most budget queries, by default the view's declared query_budget"""
+        budget = response.query_budget if budget is None else budget
+        self.assertIsNotNone(budget, "The view declares no query_budget")
+        self.assertLessEqual(
+            response.query_stats.count, budget,
+            f"{response.query_stats.count} queries, over the budget of {budget}",
+        )
+
+    def assertNoRepeatedQueries(self, response, threshold=None):
+        """No query shape run threshold times or more, QUERY_REPEAT_THRESHOLD by default"""
+        threshold = threshold or settings.QUERY_REPEAT_THRESHOLD
+        repeated = response.query_stats.repeated(threshold)
+        self.assertFalse(repeated, f"Repeated queries, possible N+1: {repeated}")
+
+
+def make_card(owner, balance, number=None):
+    """A card of owner holding balance, with a generated number unless one is given"""
+    return Card.objects.create(
+        owner=owner,
+        card_name='Nyota Card',
+        card_number=number or Card.generate_card_number(),
+        balance=Decimal(balance),
+        card_expiry_date=Card.generate_expiration_date(),
+        cvv=Card.generate_cvv(),
+    )
@@ -1,9 +1,14 @@
-from django.test import TestCase
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import User, Card, Transaction
+from .models import User, Card, Transaction, LedgerPosting
 from decimal import Decimal
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .services.transfer_service import TransferService, TransferError
 
 # Create your tests here.
 
@@ -161,3 +166,281 @@ class TransferAPITest(APITestCase):
 
         self.assertEqual(self.alice_card_1.balance, Decimal('800.00'))
         self.assertEqual(self.alice_card_2.balance, Decimal('250.00'))
+
+    def test_transfer_by_card_number_with_spaces(self):
+        """
+        Ensure a card number typed with spaces resolves to the stored card.
+        """
+        self.client.force_authenticate(user=self.user_alice)
+        data = {
+            "source_card_id": self.alice_card_1.id,
+            "target_card_number": "3333 0000 3333 0000",
+            "amount": "10.00"
+        }
+        response = self.client.post(self.transfer_url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.bob_card_1.refresh_from_db()
+        self.assertEqual(self.bob_card_1.balance, Decimal('10.00'))
+
+    def transfer_queries(self):
+        data = {
+            "source_card_id": self.alice_card_1.id,
+            "target_card_number": self.bob_card_1.card_number,
+            "amount": "1.00"
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.transfer_url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_transfer_query_count_does_not_grow_with_cards(self):
+        """
+        Ensure a card-number transfer runs the same number of queries
+        however many cards exist.
+        """
+        self.client.force_authenticate(user=self.user_alice)
+        baseline = self.transfer_queries()
+
+        Card.objects.bulk_create([
+            Card(
+                owner=self.user_bob,
+                card_name=f'Card {i}',
+                card_number=f'{4000000000000000 + i}',
+                card_expiry_date='2030-01-01',
+                cvv='123'
+            )
+            for i in range(200)
+        ])
+        self.assertEqual(self.transfer_queries(), baseline)
+
+    def test_transfer_to_card_stored_with_spaces(self):
+        """
+        Ensure a card stored with spaces is found by its digits-only number.
+        """
+        spaced_card = Card.objects.create(
+            owner=self.user_bob,
+            card_number='5555 0000 5555 0000',
+            card_expiry_date='2030-01-01',
+            cvv='123'
+        )
+        self.assertEqual(spaced_card.card_number_normalized, '5555000055550000')
+
+        self.client.force_authenticate(user=self.user_alice)
+        data = {
+            "source_card_id": self.alice_card_1.id,
+            "target_card_number": "5555000055550000",
+            "amount": "25.00"
+        }
+        response = self.client.post(self.transfer_url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        spaced_card.refresh_from_db()
+        self.assertEqual(spaced_card.balance, Decimal('25.00'))
+
+    def test_transfer_by_phone_uses_default_card(self):
+        """
+        Ensure a phone-number transfer credits the recipient's default card.
+        """
+        default_card = Card.objects.create(
+            owner=self.user_bob,
+            card_number='6666000066660000',
+            card_expiry_date='2030-01-01',
+            cvv='123',
+            is_default=True
+        )
+        self.client.force_authenticate(user=self.user_alice)
+        data = {
+            "source_card_id": self.alice_card_1.id,
+            "target_card_number": self.user_bob.phone_number,
+            "amount": "40.00"
+        }
+        response = self.client.post(self.transfer_url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        default_card.refresh_from_db()
+        self.bob_card_1.refresh_from_db()
+        self.assertEqual(default_card.balance, Decimal('40.00'))
+        self.assertEqual(self.bob_card_1.balance, Decimal('0.00'))
+
+    def test_transfer_to_unknown_recipient(self):
+        """
+        Ensure an unknown card or phone number is reported as not found.
+        """
+        self.client.force_authenticate(user=self.user_alice)
+        data = {
+            "source_card_id": self.alice_card_1.id,
+            "target_card_number": "9999000099990000",
+            "amount": "10.00"
+        }
+        response = self.client.post(self.transfer_url, data)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecipientResolutionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone_number='+79997778899',
+            password='password789',
+            first_name='Ева',
+            last_name='Иванова'
+        )
+        self.card = Card.objects.create(
+            owner=self.user,
+            card_number='7777000077770000',
+            card_expiry_date='2030-01-01',
+            cvv='123'
+        )
+        self.service = TransferService()
+
+    def test_resolves_card_number_in_one_query(self):
+        with self.assertNumQueries(1):
+            card, is_phone_transfer = self.service.find_recipient('7777 0000 7777 0000')
+        self.assertEqual(card, self.card)
+        self.assertFalse(is_phone_transfer)
+
+    def test_resolves_phone_number_in_one_query(self):
+        with self.assertNumQueries(1):
+            card, is_phone_transfer = self.service.find_recipient(self.user.phone_number)
+            self.assertEqual(card.owner.phone_number, self.user.phone_number)
+        self.assertEqual(card, self.card)
+        self.assertTrue(is_phone_transfer)
+
+    def test_recipient_without_cards(self):
+        self.card.delete()
+        with self.assertRaises(TransferError) as raised:
+            self.service.find_recipient(self.user.phone_number)
+        self.assertEqual(raised.exception.status_code, 400)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentTransferTest(TransactionTestCase):
+    def test_concurrent_transfers_lose_no_updates(self):
+        """
+        Ensure transfers racing on the same cards in both directions keep
+        every balance exact. The command raises CommandError otherwise.
+        """
+        out = StringIO()
+        call_command('stress_transfers', cards=3, threads=6, transfers=30, seed=7, stdout=out)
+        self.assertIn('No lost updates', out.getvalue())
+        self.assertIn('0 given up', out.getvalue())
+
+
+class BatchTransferAPITest(APITestCase):
+    def setUp(self):
+        self.payer = User.objects.create_user(
+            phone_number='+79991112233',
+            password='password123',
+            first_name='Алиса',
+            last_name='Селезнева'
+        )
+        self.source_card = Card.objects.create(
+            owner=self.payer,
+            card_number='1111000011110000',
+            balance=Decimal('1000.00'),
+            card_expiry_date='2030-01-01',
+            cvv='123'
+        )
+        self.employees = []
+        for i in range(3):
+            employee = User.objects.create_user(
+                phone_number=f'+7999000000{i}',
+                password='password',
+                first_name='Сотрудник',
+                last_name=str(i)
+            )
+            Card.objects.create(
+                owner=employee,
+                card_number=f'400000000000000{i}',
+                card_expiry_date='2030-01-01',
+                cvv='123'
+            )
+            self.employees.append(employee)
+        self.url = reverse('transfers-batch')
+        self.client.force_authenticate(user=self.payer)
+
+    def post(self, rows):
+        return self.client.post(self.url, {
+            "source_card_id": str(self.source_card.id),
+            "transfers": rows
+        }, format='json')
+
+    def test_pays_every_recipient_and_reports_each_row(self):
+        response = self.post([
+            {"recipient": "4000 0000 0000 0000", "amount": "100.00", "comment": "Зарплата"},
+            {"recipient": self.employees[1].phone_number, "amount": "200.00"},
+            {"recipient": "4000000000000002", "amount": "50.00"},
+            {"recipient": "4000000000000002", "amount": "25.00"},
+            {"recipient": "+70000000000", "amount": "10.00"},
+            {"recipient": self.source_card.card_number, "amount": "10.00"},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['completed'], 4)
+        self.assertEqual(response.data['failed'], 2)
+        self.assertEqual([row['status'] for row in response.data['results']],
+                         ['completed'] * 4 + ['failed'] * 2)
+        self.assertEqual(response.data['results'][4]['error'], "Recipient not found.")
+
+        balances = [employee.cards.get().balance for employee in self.employees]
+        self.assertEqual(balances, [Decimal('100.00'), Decimal('200.00'), Decimal('75.00')])
+        self.source_card.refresh_from_db()
+        self.assertEqual(self.source_card.balance, Decimal('625.00'))
+        self.payer.refresh_from_db()
+        self.assertEqual(self.payer.total_balance, Decimal('625.00'))
+        self.employees[2].refresh_from_db()
+        self.assertEqual(self.employees[2].total_balance, Decimal('75.00'))
+        self.assertEqual(Transaction.objects.count(), 8)
+        self.assertTrue(Transaction.objects.filter(title='Transfer to Сотрудник 0 | Зарплата').exists())
+
+    def test_insufficient_funds_refuses_whole_batch(self):
+        response = self.post([
+            {"recipient": "4000000000000000", "amount": "600.00"},
+            {"recipient": "4000000000000001", "amount": "600.00"},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.source_card.refresh_from_db()
+        self.assertEqual(self.source_card.balance, Decimal('1000.00'))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def queries(rows):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.post(rows)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(captured)
+
+        def inserts(model, count):
+            """INSERTs of count rows, as many as the database's parameter limit requires"""
+            fields = [field for field in model._meta.concrete_fields if field is not model._meta.auto_field]
+            return -(-count // connection.ops.bulk_batch_size(fields, [None] * count))
+
+        few = queries([{"recipient": "4000000000000000", "amount": "1.00"}])
+        many = queries([
+            {"recipient": f"400000000000000{i % 3}", "amount": "1.00"} for i in range(60)
+        ] + [
+            {"recipient": employee.phone_number, "amount": "1.00"} for employee in self.employees
+        ])
+        # Two transactions and two card postings per row
+        extra_inserts = inserts(Transaction, 126) - 1 + inserts(LedgerPosting, 126) - 1
+        self.assertEqual(many, few + extra_inserts)
+
+
+class CardNumberBackfillTest(TestCase):
+    def backfill(self):
+        from django.apps import apps
+        from importlib import import_module
+        migration = import_module('api.migrations.0021_card_card_number_normalized')
+        migration.backfill_normalized_numbers(apps, None)
+
+    def test_cards_differing_by_spacing_stop_the_migration(self):
+        owner = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        spaced = Card.objects.create(owner=owner, card_number='5555 0000 5555 0000', card_expiry_date='2030-01-01', cvv='123')
+        plain = Card.objects.create(owner=owner, card_number='4444000044440000', card_expiry_date='2030-01-01', cvv='123')
+        # As before the migration: the same digits, no normalized number
+        Card.objects.update(card_number_normalized=None)
+        Card.objects.filter(pk=plain.pk).update(card_number='5555000055550000')
+
+        with self.assertRaisesMessage(RuntimeError, str(spaced.pk)):
+            self.backfill()
+        self.assertFalse(Card.objects.exclude(card_number_normalized=None).exists())
+
+        Card.objects.filter(pk=plain.pk).update(card_number='4444000044440000')
+        self.backfill()
+        self.assertEqual(Card.objects.get(pk=spaced.pk).card_number_normalized, '5555000055550000')
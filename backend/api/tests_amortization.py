@@ -0,0 +1,154 @@
+from datetime import date
+from decimal import Decimal
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .credit_logic import CreditLogicManager
+from .models import User, Loan, Mortgage
+from .services.amortization_service import AmortizationService, add_months
+
+
+def loop_balances(principal, annual_rate, payment, months):
+    """Balances after each month, one iteration per month"""
+    rate = annual_rate / 100 / 12
+    balances = []
+    balance = principal
+    for _ in range(months):
+        balance = balance * (1 + rate) - payment
+        balances.append(balance)
+    return balances
+
+
+class AmortizationServiceTest(SimpleTestCase):
+    def setUp(self):
+        self.service = AmortizationService()
+
+    def assertConsistent(self, schedule, principal):
+        columns = schedule['columns']
+        self.assertEqual(len({len(column) for column in columns.values()}), 1)
+        self.assertEqual(columns['month'], list(range(1, schedule['months'] + 1)))
+        self.assertEqual(columns['balance'][-1], 0.0)
+        self.assertAlmostEqual(sum(columns['principal']), principal, delta=0.01 * schedule['months'])
+        for payment, extra, interest, repaid in zip(columns['payment'], columns['extra'], columns['interest'], columns['principal']):
+            self.assertAlmostEqual(payment + extra, interest + repaid, delta=0.02)
+
+    def test_annuity_schedule(self):
+        schedule = self.service.schedule(4_000_000, 7, 360, start_date=date(2026, 1, 31))
+        payment = CreditLogicManager().calculate_monthly_payment(Decimal('4000000'), Decimal('7'), 360)
+        self.assertEqual(schedule['monthly_payment'], float(payment))
+        self.assertEqual(schedule['months'], 360)
+        self.assertEqual(schedule['payoff_date'], '2056-01-31')
+        self.assertConsistent(schedule, 4_000_000)
+
+        expected = loop_balances(4_000_000, 7, float(payment), 359)
+        for month in (0, 100, 358):
+            self.assertAlmostEqual(schedule['columns']['balance'][month], expected[month], delta=0.01)
+        self.assertAlmostEqual(schedule['total_paid'], schedule['total_interest'] + 4_000_000, delta=0.01)
+
+    def test_extra_monthly_shortens_the_term(self):
+        base = self.service.schedule(1_000_000, 12, 120)
+        faster = self.service.schedule(1_000_000, 12, 120, extra_monthly=5000)
+        self.assertLess(faster['months'], 120)
+        self.assertLess(faster['total_interest'], base['total_interest'])
+        self.assertConsistent(faster, 1_000_000)
+
+    def test_lump_sum_strategies(self):
+        shorter = self.service.schedule(1_000_000, 12, 120, lump_sums={24: 300_000})
+        lower = self.service.schedule(1_000_000, 12, 120, lump_sums={24: 300_000}, strategy='reduce_payment')
+        self.assertConsistent(shorter, 1_000_000)
+        self.assertConsistent(lower, 1_000_000)
+
+        self.assertLess(shorter['months'], 120)
+        self.assertEqual(shorter['columns']['payment'][30], shorter['monthly_payment'])
+        self.assertEqual(lower['months'], 120)
+        self.assertLess(lower['columns']['payment'][30], lower['monthly_payment'])
+        self.assertEqual(lower['columns']['extra'][23], 300_000)
+        # Shortening the term saves more interest than lowering the payment
+        self.assertLess(shorter['total_interest'], lower['total_interest'])
+
+    def test_lump_sum_larger_than_the_debt(self):
+        schedule = self.service.schedule(100_000, 10, 24, lump_sums={6: 1_000_000})
+        self.assertEqual(schedule['months'], 6)
+        self.assertConsistent(schedule, 100_000)
+
+    def test_zero_rate(self):
+        schedule = self.service.schedule(120_000, 0, 12)
+        self.assertEqual(schedule['columns']['payment'], [10_000.0] * 12)
+        self.assertEqual(schedule['total_interest'], 0.0)
+
+    def test_invalid_inputs(self):
+        with self.assertRaises(ValueError):
+            self.service.schedule(0, 10, 12)
+        with self.assertRaises(ValueError):
+            self.service.schedule(1000, 10, 12, strategy='skip')
+        with self.assertRaises(ValueError):
+            self.service.schedule(float('nan'), 10, 12)
+        with self.assertRaises(ValueError):
+            self.service.schedule(1000, 10, 12, extra_monthly=float('inf'))
+        with self.assertRaises(ValueError):
+            self.service.schedule(1_000_000, 100_000, 600)
+
+    def test_add_months_clamps_the_day(self):
+        self.assertEqual(add_months(date(2026, 1, 31), 1), date(2026, 2, 28))
+        self.assertEqual(add_months(date(2026, 11, 15), 14), date(2028, 1, 15))
+
+
+class ScheduleEndpointTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.client.force_authenticate(user=self.user)
+
+    def test_mortgage_schedule(self):
+        mortgage = Mortgage.objects.create(
+            user=self.user, property_cost=Decimal('5000000'), initial_payment=Decimal('1000000'),
+            total_amount=Decimal('4000000'), term_years=30, interest_rate=Decimal('7'), monthly_payment=Decimal('26612.10'),
+        )
+        response = self.client.get(
+            reverse('mortgage-schedule', kwargs={'pk': mortgage.pk}),
+            {'lump_sum': ['12:500000', '24:100000'], 'strategy': 'reduce_payment'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['months'], 360)
+        self.assertEqual(set(response.data['columns']), {'month', 'payment', 'extra', 'interest', 'principal', 'balance'})
+        self.assertEqual(response.data['columns']['extra'][11], 500000.0)
+
+    def test_loan_schedule_of_another_user_is_not_found(self):
+        other = User.objects.create_user(phone_number='+79994445566', password='pw', first_name='Боб', last_name='Строитель')
+        loan = Loan.objects.create(
+            user=other, total_amount=Decimal('1000'), remaining_debt=Decimal('1000'), interest_rate=Decimal('12'),
+            term_months=12, monthly_payment=Decimal('100'), next_payment_date=date(2026, 2, 1),
+        )
+        response = self.client.get(reverse('loan-schedule', kwargs={'pk': loan.pk}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_calculator(self):
+        url = reverse('amortization-calculator')
+        response = self.client.get(url, {'principal': '300000', 'annual_rate': '14', 'term_months': '36', 'extra_monthly': '2000'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLess(response.data['months'], 36)
+
+        self.assertEqual(self.client.get(url, {'principal': '300000'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(url, {'principal': '1', 'annual_rate': '1', 'term_months': '12', 'lump_sum': 'soon'}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        self.assertEqual(
+            self.client.get(url, {'principal': '1', 'annual_rate': '1', 'term_months': '6000'}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    def test_calculator_rejects_numbers_out_of_range(self):
+        url = reverse('amortization-calculator')
+        base = {'principal': '300000', 'annual_rate': '14', 'term_months': '36'}
+        for name, value in [
+            ('principal', '1e30'), ('principal', 'Infinity'), ('principal', 'NaN'), ('principal', '-5'),
+            ('annual_rate', '1e9'), ('annual_rate', 'NaN'), ('extra_monthly', 'NaN'), ('extra_monthly', '-1'),
+            ('lump_sum', '12:Infinity'),
+        ]:
+            with self.subTest(name=name, value=value):
+                response = self.client.get(url, {**base, name: value})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(url, {'principal': '9999999999999.99', 'annual_rate': '999.99', 'term_months': '600'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
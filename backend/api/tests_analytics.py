@@ -0,0 +1,260 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .models import (
+    User, Card, Transaction, TransactionMonthlyRollup, Loan, Deposit, Mortgage, CryptoCurrency, CryptoWallet,
+)
+from .services.analytics_cache_service import AnalyticsSnapshotService
+from .views import UserAnalyticsView
+
+
+def rollups(user):
+    return {
+        (row.month, row.transaction_type): (row.count, row.total)
+        for row in TransactionMonthlyRollup.objects.filter(user=user)
+    }
+
+
+class TransactionRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.month = timezone.now().date().replace(day=1)
+
+    def test_created_and_deleted_transactions_are_counted(self):
+        first = Transaction.objects.create(user=self.user, title='Salary', amount=Decimal('100.00'), transaction_type=1)
+        Transaction.objects.create(user=self.user, title='Bonus', amount=Decimal('50.00'), transaction_type=1)
+        Transaction.objects.create(user=self.user, title='Coffee', amount=Decimal('-3.50'), transaction_type=0)
+        self.assertEqual(rollups(self.user), {
+            (self.month, 1): (2, Decimal('150.00')),
+            (self.month, 0): (1, Decimal('-3.50')),
+        })
+
+        first.delete()
+        self.assertEqual(rollups(self.user)[(self.month, 1)], (1, Decimal('50.00')))
+
+    def test_edited_transaction_is_moved(self):
+        record = Transaction.objects.create(user=self.user, title='Salary', amount=Decimal('100.00'), transaction_type=1)
+        record.timestamp = datetime(2025, 12, 31, 23, 0, tzinfo=dt_timezone.utc)
+        record.amount = Decimal('80.00')
+        record.save()
+        self.assertEqual(rollups(self.user), {(date(2025, 12, 1), 1): (1, Decimal('80.00'))})
+
+    def test_add_matches_rebuild(self):
+        records = Transaction.objects.bulk_create([
+            Transaction(user=self.user, title=str(i), amount=Decimal(i) - 5, transaction_type=i % 2)
+            for i in range(10)
+        ])
+        TransactionMonthlyRollup.add(records)
+        TransactionMonthlyRollup.add(records[:3])
+        row_ids = set(TransactionMonthlyRollup.objects.values_list('pk', flat=True))
+        TransactionMonthlyRollup.rebuild([self.user.pk])
+        self.assertEqual(rollups(self.user), {
+            (self.month, 0): (5, Decimal('-5.00')),
+            (self.month, 1): (5, Decimal('0.00')),
+        })
+        # Updated in place, so a concurrent add() waiting on a row still finds it
+        self.assertEqual(set(TransactionMonthlyRollup.objects.values_list('pk', flat=True)), row_ids)
+
+
+class UserAnalyticsRollupTest(APITestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.bob = User.objects.create_user(phone_number='+79994445566', password='pw', first_name='Боб', last_name='Строитель')
+        self.alice_card = Card.objects.create(
+            owner=self.alice, card_number='1111000011110000', balance=Decimal('1000.00'),
+            card_expiry_date='2030-01-01', cvv='123'
+        )
+        Card.objects.create(
+            owner=self.bob, card_number='3333000033330000', balance=Decimal('0.00'),
+            card_expiry_date='2030-01-01', cvv='123'
+        )
+        self.client.force_authenticate(user=self.alice)
+        cache.clear()
+
+    def transfer(self, amount):
+        response = self.client.post(reverse('transfers'), {
+            "source_card_id": str(self.alice_card.id),
+            "target_card_number": '3333000033330000',
+            "amount": amount,
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_transfers_feed_the_analytics(self):
+        self.transfer('100.00')
+        self.transfer('50.00')
+        # Last month's income
+        last_month = (timezone.now().replace(day=1) - timedelta(days=1)).replace(hour=12)
+        income = Transaction.objects.create(user=self.alice, title='Salary', amount=Decimal('300.00'), transaction_type=1)
+        Transaction.objects.filter(pk=income.pk).update(timestamp=last_month)
+        TransactionMonthlyRollup.rebuild([self.alice.pk])
+
+        response = self.client.get(reverse('user-analytics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data['transactions']
+        self.assertEqual(data['total_transactions'], 3)
+        self.assertEqual(data['current_month_transactions'], 2)
+        self.assertEqual(data['total_income'], 300.0)
+        self.assertEqual(data['total_expense'], 150.0)
+        self.assertEqual(data['net_balance'], 150.0)
+        self.assertEqual(data['current_month'], {'income': 0.0, 'expense': 150.0, 'net': -150.0, 'transaction_count': 2})
+        self.assertEqual(data['last_month']['income'], 300.0)
+        self.assertEqual(data['trends']['expense_trend'], 100)
+        self.assertEqual(data['average_transaction'], 50.0)
+
+    def test_transaction_analytics_cost_one_query(self):
+        for _ in range(5):
+            self.transfer('10.00')
+        now = timezone.now()
+        current_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        last_month = (current_month - timedelta(days=1)).replace(day=1)
+        with self.assertNumQueries(1):
+            data = UserAnalyticsView()._get_transactions_analytics(self.alice, current_month, last_month)
+        self.assertEqual(data['current_month']['expense'], 50.0)
+
+
+class UserAnalyticsQueryBudgetTest(APITestCase):
+    """The dashboard costs one query per section, whatever the number of products"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.client.force_authenticate(user=self.user)
+        cache.clear()
+
+    def add_products(self, count):
+        offset = Card.objects.count()
+        for i in range(offset, offset + count):
+            Card.objects.create(
+                owner=self.user, card_number=f'4000{i:012d}', balance=Decimal('10.00'),
+                card_expiry_date='2030-01-01', cvv='123', is_blocked=i % 2 == 0
+            )
+            Loan.objects.create(
+                user=self.user, total_amount=Decimal('1000'), remaining_debt=Decimal('500'), interest_rate=Decimal('10'),
+                term_months=12, monthly_payment=Decimal('90'), next_payment_date=date(2030, 1, i % 28 + 1), is_active=i % 2 == 0
+            )
+            Deposit.objects.create(user=self.user, amount=Decimal('100'), interest_rate=Decimal('5'), term_months=12)
+            Mortgage.objects.create(
+                user=self.user, property_cost=Decimal('100000'), initial_payment=Decimal('20000'), total_amount=Decimal('80000'),
+                term_years=10, interest_rate=Decimal('8'), monthly_payment=Decimal('900')
+            )
+            coin = CryptoCurrency.objects.create(id=f'coin-{i}', symbol=f'C{i}', name=f'Coin {i}', current_price_usd=Decimal('2'))
+            CryptoWallet.objects.create(user=self.user, cryptocurrency=coin, balance=Decimal('3'))
+
+    def test_query_budget_does_not_grow_with_products(self):
+        self.add_products(1)
+        # cards, transactions, loans, deposits, mortgages, crypto
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('user-analytics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_products(4)
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('user-analytics'))
+        data = response.data
+        self.assertEqual((data['cards']['total_cards'], data['cards']['blocked_cards']), (5, 3))
+        self.assertEqual((data['loans']['active_loans'], data['loans']['total_remaining_debt']), (3, 1500.0))
+        self.assertEqual(data['deposits']['average_interest_rate'], 5.0)
+        self.assertEqual(data['mortgages']['total_loan_amount'], 400000.0)
+        self.assertEqual(data['crypto']['total_portfolio_value_usd'], 30.0)
+
+    def test_most_used_card_counts_its_own_transactions(self):
+        self.add_products(2)
+        first, second = Card.objects.filter(owner=self.user).order_by('card_number')
+        Card.objects.filter(pk__in=[first.pk, second.pk]).update(is_blocked=False)
+        Card.objects.filter(pk=second.pk).update(balance=Decimal('100.00'))
+        for _ in range(2):
+            self.client.post(reverse('transfers'), {
+                "source_card_id": str(second.id),
+                "target_card_number": first.card_number,
+                "amount": "1.00",
+            })
+        cards = self.client.get(reverse('user-analytics')).data['cards']
+        # Each transfer between the user's own cards moves both of them
+        self.assertEqual(cards['most_used_card']['transaction_count'], 2)
+
+
+class AnalyticsSnapshotCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.other = User.objects.create_user(phone_number='+79994445566', password='pw', first_name='Боб', last_name='Строитель')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('user-analytics')
+
+    def test_snapshot_is_reused_until_a_product_changes(self):
+        self.assertEqual(self.client.get(self.url)['X-Analytics-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Analytics-Cache'], 'hit')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Deposit.objects.create(user=self.user, amount=Decimal('100'), interest_rate=Decimal('5'), term_months=12)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Analytics-Cache'], 'miss')
+        self.assertEqual(response.data['deposits']['total_deposits'], 1)
+
+    def test_other_users_writes_keep_the_snapshot(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Deposit.objects.create(user=self.other, amount=Decimal('100'), interest_rate=Decimal('5'), term_months=12)
+        self.assertEqual(self.client.get(self.url)['X-Analytics-Cache'], 'hit')
+
+    def test_version_is_bumped_only_on_commit(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Deposit.objects.create(user=self.user, amount=Decimal('100'), interest_rate=Decimal('5'), term_months=12)
+            # Still uncommitted: a snapshot built now could miss the deposit
+            self.assertEqual(self.client.get(self.url)['X-Analytics-Cache'], 'hit')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(self.url)['X-Analytics-Cache'], 'miss')
+
+    def test_transfer_invalidates_both_users(self):
+        source = Card.objects.create(owner=self.user, card_number='1111000011110000', balance=Decimal('100.00'),
+                                     card_expiry_date='2030-01-01', cvv='123')
+        Card.objects.create(owner=self.other, card_number='3333000033330000', balance=Decimal('0.00'),
+                            card_expiry_date='2030-01-01', cvv='123')
+        service = AnalyticsSnapshotService()
+        keys = (service.snapshot_key(self.user.pk), service.snapshot_key(self.other.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('transfers'), {
+                "source_card_id": str(source.id),
+                "target_card_number": '3333000033330000',
+                "amount": "10.00",
+            })
+        self.assertNotEqual(service.snapshot_key(self.user.pk), keys[0])
+        self.assertNotEqual(service.snapshot_key(self.other.pk), keys[1])
+
+    def test_price_refresh_invalidates_holders_only(self):
+        coin = CryptoCurrency.objects.create(id='bitcoin', symbol='BTC', name='Bitcoin', current_price_usd=Decimal('50000'))
+        CryptoWallet.objects.create(user=self.user, cryptocurrency=coin, balance=Decimal('0'))
+        service = AnalyticsSnapshotService()
+        keys = (service.snapshot_key(self.user.pk), service.snapshot_key(self.other.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            service.invalidate_prices(['bitcoin'])
+        self.assertNotEqual(service.snapshot_key(self.user.pk), keys[0])
+        self.assertEqual(service.snapshot_key(self.other.pk), keys[1])
+
+    def test_evicted_version_does_not_revive_old_snapshots(self):
+        service = AnalyticsSnapshotService()
+        old_key = service.snapshot_key(self.user.pk)
+        cache.delete(f'analytics:version:user:{self.user.pk}')
+        self.assertNotEqual(service.snapshot_key(self.user.pk), old_key)
+
+    def test_hit_ratio(self):
+        service = AnalyticsSnapshotService()
+        self.assertIsNone(service.stats()['hit_ratio'])
+        for _ in range(4):
+            self.client.get(self.url)
+        self.assertEqual(service.stats(), {'hits': 3, 'misses': 1, 'hit_ratio': 0.75})
+
+    def test_errors_are_not_cached(self):
+        with mock.patch.object(UserAnalyticsView, '_get_loans_analytics', side_effect=RuntimeError('boom')):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(self.client.get(self.url)['X-Analytics-Cache'], 'miss')
@@ -0,0 +1,121 @@
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .models import User, Card, Deposit, CryptoCurrency
+from .services.crypto_service import CryptoService
+from .services.balance_service import BalanceReconciliationService
+from .testing import make_card
+
+
+class TotalBalanceTest(APITestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.bob = User.objects.create_user(phone_number='+79994445566', password='pw', first_name='Боб', last_name='Строитель')
+        self.alice_card = make_card(self.alice, '1000.00', number='1111000011110000')
+        self.bob_card = make_card(self.bob, '0.00', number='3333000033330000')
+
+    def total(self, user):
+        user.refresh_from_db()
+        return user.total_balance
+
+    def test_cards_and_deposits_are_counted_on_create_and_delete(self):
+        make_card(self.alice, '50.00', number='2222000022220000')
+        deposit = Deposit.objects.create(user=self.alice, amount=Decimal('300.00'), interest_rate=Decimal('6.5'), term_months=12)
+        self.assertEqual(self.total(self.alice), Decimal('1350.00'))
+
+        deposit.delete()
+        self.alice_card.delete()
+        self.assertEqual(self.total(self.alice), Decimal('50.00'))
+
+    def test_deposit_changes_are_counted(self):
+        deposit = Deposit.objects.create(user=self.alice, amount=Decimal('300.00'), interest_rate=Decimal('6.5'), term_months=12)
+        deposit.amount = Decimal('250.00')
+        deposit.save()
+        self.assertEqual(self.total(self.alice), Decimal('1250.00'))
+
+        # As the admin saves it: loaded, then edited
+        deposit = Deposit.objects.get(pk=deposit.pk)
+        deposit.user = self.bob
+        deposit.amount = Decimal('400.00')
+        deposit.save()
+        deposit.save()
+        self.assertEqual(self.total(self.alice), Decimal('1000.00'))
+        self.assertEqual(self.total(self.bob), Decimal('400.00'))
+
+        deposit.delete()
+        self.assertEqual(self.total(self.bob), Decimal('0.00'))
+
+    def test_transfer_moves_total_balance(self):
+        self.client.force_authenticate(user=self.alice)
+        response = self.client.post(reverse('transfers'), {
+            "source_card_id": self.alice_card.id,
+            "target_card_number": self.bob_card.card_number,
+            "amount": "150.50"
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.total(self.alice), Decimal('849.50'))
+        self.assertEqual(self.total(self.bob), Decimal('150.50'))
+
+    def test_transfer_between_own_cards_keeps_total_balance(self):
+        own_card = make_card(self.alice, '0.00', number='2222000022220000')
+        self.client.force_authenticate(user=self.alice)
+        response = self.client.post(reverse('transfers'), {
+            "source_card_id": self.alice_card.id,
+            "target_card_number": own_card.card_number,
+            "amount": "200.00"
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.total(self.alice), Decimal('1000.00'))
+
+
+    def test_crypto_trades_apply_to_the_current_card_balance(self):
+        CryptoCurrency.objects.create(id='bitcoin', symbol='BTC', name='Bitcoin', current_price_usd=Decimal('50000'))
+        stale_card = Card.objects.get(pk=self.alice_card.pk)
+        # A transfer commits between reading the default card and the payment
+        Card.objects.filter(pk=self.alice_card.pk).update(balance=Decimal('500.00'))
+        self.alice.adjust_total_balance(Decimal('-500.00'))
+
+        with mock.patch.object(User, 'get_default_card', return_value=stale_card):
+            bought = CryptoService().buy_cryptocurrency(self.alice, 'bitcoin', Decimal('100.00'))
+            CryptoService().sell_cryptocurrency(self.alice, bought.wallet_id, Decimal('0.001'))
+        self.alice_card.refresh_from_db()
+        self.assertEqual(self.alice_card.balance, Decimal('448.50'))
+        self.assertEqual(self.total(self.alice), Decimal('448.50'))
+
+        with mock.patch.object(User, 'get_default_card', return_value=stale_card):
+            with self.assertRaisesMessage(ValueError, 'Insufficient funds including fees'):
+                CryptoService().buy_cryptocurrency(self.alice, 'bitcoin', Decimal('900.00'))
+        self.alice_card.refresh_from_db()
+        self.assertEqual(self.alice_card.balance, Decimal('448.50'))
+
+
+class BalanceReconciliationTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.bob = User.objects.create_user(phone_number='+79994445566', password='pw', first_name='Боб', last_name='Строитель')
+        make_card(self.alice, '1000.00', number='1111000011110000')
+        make_card(self.bob, '20.00', number='3333000033330000')
+        self.service = BalanceReconciliationService()
+
+    def test_consistent_accounts_are_left_alone(self):
+        self.assertEqual(self.service.drifted_users(), [])
+        self.assertEqual(self.service.reconcile(), 0)
+
+    def test_repairs_drifted_accounts(self):
+        # A write that bypasses the delta updates
+        Card.objects.filter(owner=self.alice).update(balance=Decimal('700.00'))
+        User.objects.filter(pk=self.bob.pk).update(total_balance=Decimal('0.00'))
+
+        self.assertEqual(self.service.reconcile(dry_run=True), 2)
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.total_balance, Decimal('1000.00'))
+
+        self.assertEqual(self.service.reconcile(), 2)
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual(self.alice.total_balance, Decimal('700.00'))
+        self.assertEqual(self.bob.total_balance, Decimal('20.00'))
+        self.assertEqual(self.service.reconcile(), 0)
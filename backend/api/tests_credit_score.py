@@ -0,0 +1,197 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .credit_logic import CreditLogicManager
+from .models import User, Transaction, Loan, Mortgage, Application, CreditScore
+from .services.credit_score_service import CreditScoreService
+from .testing import QueryBudgetAssertionsMixin, make_card
+
+
+def create_scored_user(phone_number='+79991112233'):
+    """A user scoring 630: every factor of the score contributes"""
+    user = User.objects.create_user(phone_number=phone_number, password='pw', first_name='Алиса', last_name='Селезнева')
+    User.objects.filter(pk=user.pk).update(date_joined=timezone.now() - timedelta(days=70))
+    user.refresh_from_db()
+    Transaction.objects.bulk_create([Transaction(user=user, title='T', amount=Decimal('10')) for _ in range(3)])
+    make_card(user, '60000')
+    today = timezone.now().date()
+    Loan.objects.create(
+        user=user, total_amount=Decimal('1000'), remaining_debt=Decimal('500'), interest_rate=Decimal('12'),
+        term_months=12, monthly_payment=Decimal('100'), next_payment_date=today - timedelta(days=3),
+    )
+    Loan.objects.create(
+        user=user, total_amount=Decimal('1000'), remaining_debt=Decimal('0'), interest_rate=Decimal('12'),
+        term_months=12, monthly_payment=Decimal('100'), next_payment_date=today, is_active=False,
+    )
+    Mortgage.objects.create(
+        user=user, property_cost=Decimal('5000000'), initial_payment=Decimal('1000000'),
+        total_amount=Decimal('4000000'), term_years=20, interest_rate=Decimal('7'),
+        monthly_payment=Decimal('30000'), is_active=False,
+    )
+    return user
+
+
+class CreditScoringContextTest(TestCase):
+    def setUp(self):
+        self.user = create_scored_user()
+
+    def test_breakdown(self):
+        breakdown = CreditLogicManager().get_detailed_credit_score(self.user)
+        self.assertEqual(breakdown, {
+            'base_score': 400,
+            'account_age_bonus': 10,
+            'account_age_days': 70,
+            'transaction_bonus': 15,
+            'transaction_count': 3,
+            'balance_bonus': 50,
+            'current_balance': 60000.0,
+            'loan_penalty': 70,
+            'completed_loan_bonus': 75,
+            'recent_activity_bonus': 0,
+            'recent_transactions_count': 3,
+            'final_score': 630,
+        })
+
+    def test_offer_loads_the_inputs_once(self):
+        manager = CreditLogicManager()
+        # Transactions, cards, loans and mortgages
+        with self.assertNumQueries(4):
+            offer = (
+                manager.get_max_credit_amount(self.user),
+                manager.get_credit_interest_rate(self.user),
+                manager.can_take_mortgage(self.user),
+                manager.get_max_mortgage_amount(self.user),
+                manager.get_mortgage_interest_rate(self.user),
+                manager.get_detailed_credit_score(self.user)['final_score'],
+            )
+        self.assertEqual(offer, (
+            Decimal('1000000'), Decimal('14.0'), True, Decimal('1440000.0'), Decimal('21.0'), 630,
+        ))
+
+    def test_invalidate(self):
+        manager = CreditLogicManager()
+        self.assertEqual(manager.calculate_credit_score(self.user), 630)
+        Transaction.objects.bulk_create([Transaction(user=self.user, title='T', amount=Decimal('10')) for _ in range(2)])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(manager.calculate_credit_score(self.user), 630)
+        manager.invalidate(self.user)
+        # Two more transactions, and now five in the last month
+        self.assertEqual(manager.calculate_credit_score(self.user), 630 + 10 + 25)
+
+
+class BatchCreditScoringTest(QueryBudgetAssertionsMixin, APITestCase):
+    def setUp(self):
+        self.users = [create_scored_user()]
+        for i in range(11):
+            user = User.objects.create_user(phone_number=f'+7999200{i:04d}', password='pw', first_name='Клиент', last_name=str(i))
+            Transaction.objects.bulk_create([Transaction(user=user, title='T', amount=Decimal('1')) for _ in range(i * 3)])
+            if i % 3 == 0:
+                make_card(user, str(i * 20000))
+            if i % 4 == 0:
+                Loan.objects.create(
+                    user=user, total_amount=Decimal('1000'), remaining_debt=Decimal('1000'), interest_rate=Decimal('12'),
+                    term_months=12, monthly_payment=Decimal('100'), next_payment_date=timezone.now().date(),
+                )
+            self.users.append(user)
+        for user in self.users:
+            Application.objects.create(user=user, application_type='LOAN', details={'amount': 1000, 'term': 12})
+
+    def test_batch_matches_single_scores(self):
+        manager = CreditLogicManager()
+        with self.assertNumQueries(4):
+            scores = manager.score_users(self.users)
+        self.assertEqual(scores, {user.pk: CreditLogicManager().calculate_credit_score(user) for user in self.users})
+        self.assertEqual(
+            manager.get_detailed_credit_score(self.users[0]),
+            CreditLogicManager().get_detailed_credit_score(self.users[0]),
+        )
+
+    def test_admin_queue_scores_the_page_at_once(self):
+        admin = User.objects.create_superuser(phone_number='+79990000000', password='pw', first_name='Админ', last_name='Админов')
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(reverse('admin-applications-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertWithinQueryBudget(response)
+        self.assertNoRepeatedQueries(response)
+        scores = {row['user_phone']: row['credit_score'] for row in response.data['results']}
+        self.assertEqual(scores['+79991112233'], 630)
+        self.assertEqual(len(scores), 12)
+
+
+class StoredCreditScoreTest(TestCase):
+    def setUp(self):
+        self.user = create_scored_user()
+        self.other = create_scored_user('+79994445566')
+        self.service = CreditScoreService()
+        self.service.breakdowns([self.user, self.other])
+
+    def test_read_is_one_lookup(self):
+        with self.assertNumQueries(1):
+            breakdown = self.service.breakdown(self.user)
+        self.assertEqual(breakdown, CreditLogicManager().get_detailed_credit_score(self.user))
+        self.assertEqual(CreditScore.objects.get(pk=self.user.pk).final_score, 630)
+
+    def test_writes_mark_the_score_dirty(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                Transaction.objects.create(user=self.user, title='T', amount=Decimal('10'))
+        self.assertTrue(CreditScore.objects.get(pk=self.user.pk).is_dirty)
+        self.assertFalse(CreditScore.objects.get(pk=self.other.pk).is_dirty)
+
+        self.assertEqual(self.service.breakdown(self.user)['final_score'], 630 + 10 + 25)
+        self.assertFalse(CreditScore.objects.get(pk=self.user.pk).is_dirty)
+
+    def test_refresh_recomputes_only_outdated_scores(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_card(self.user, '100')
+        self.assertEqual(self.service.refresh(), 1)
+        self.assertEqual(self.service.refresh(), 0)
+
+        CreditScore.objects.filter(pk=self.other.pk).update(scored_on=timezone.now().date() - timedelta(days=1))
+        self.assertEqual(self.service.refresh(), 1)
+
+    def test_watermarks_catch_writes_without_signals(self):
+        Transaction.objects.bulk_create([Transaction(user=self.other, title='T', amount=Decimal('1')) for _ in range(4)])
+        self.assertEqual(self.service.refresh(), 0)
+        self.assertEqual(self.service.refresh(check_watermarks=True), 1)
+        self.assertEqual(CreditScore.objects.get(pk=self.other.pk).transaction_count, 7)
+
+    def test_watermarks_catch_backdated_and_deleted_transactions(self):
+        # Older than last_transaction_at: only the stored count tells
+        backdated, = Transaction.objects.bulk_create([Transaction(user=self.other, title='T', amount=Decimal('1'))])
+        Transaction.objects.filter(pk=backdated.pk).update(timestamp=timezone.now() - timedelta(days=400))
+        self.assertEqual(self.service.refresh(check_watermarks=True), 1)
+        self.assertEqual(CreditScore.objects.get(pk=self.other.pk).transaction_count, 4)
+
+        Transaction.objects.filter(user=self.other)._raw_delete(Transaction.objects.db)
+        self.assertEqual(self.service.refresh(check_watermarks=True), 1)
+        self.assertEqual(CreditScore.objects.get(pk=self.other.pk).transaction_count, 0)
+        self.assertEqual(self.service.refresh(check_watermarks=True), 0)
+
+
+class RescoreAllTest(TestCase):
+    def test_every_user_is_rescored_in_chunks(self):
+        users = [create_scored_user()] + [
+            User.objects.create_user(phone_number=f'+7999300{i:04d}', password='pw', first_name='Клиент', last_name=str(i))
+            for i in range(10)
+        ]
+        for i, user in enumerate(users[1:]):
+            Transaction.objects.bulk_create([Transaction(user=user, title='T', amount=Decimal('1')) for _ in range(i)])
+        total = User.objects.count()
+        chunks = -(-total // 4)
+
+        # Per chunk the users, four aggregates and the upsert; then the empty chunk
+        with self.assertNumQueries(chunks * 6 + 1):
+            stats = CreditScoreService().rescore_all(chunk_size=4)
+        self.assertEqual((stats['users'], stats['chunks']), (total, chunks))
+        self.assertGreater(stats['users_per_second'], 0)
+
+        stored = dict(CreditScore.objects.values_list('user_id', 'final_score'))
+        self.assertEqual(len(stored), total)
+        for user in users:
+            self.assertEqual(stored[user.pk], CreditLogicManager().calculate_credit_score(user))
@@ -0,0 +1,207 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from decimal import Decimal
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .models import Currency, CurrencyHistory, CurrencyRateSnapshot
+from .services.currency_service import CurrencyAPIService
+from .services.history_service import CurrencyHistoryService, PERIODS
+from .services.rollup_service import RollupService
+from .services.snapshot_service import CurrencySnapshotService
+
+
+class CurrencyHistoryServiceTest(TestCase):
+    def setUp(self):
+        self.currency = Currency.objects.get(code='USD')
+        self.now = datetime(2025, 3, 15, 12, 30, tzinfo=dt_timezone.utc)
+        self.service = CurrencyHistoryService()
+
+    def add_tick(self, delta, rate):
+        CurrencyHistory.objects.create(
+            currency=self.currency,
+            rate=Decimal(rate),
+            timestamp=self.now - delta
+        )
+
+    def test_point_counts_and_labels(self):
+        expected = {'day': 24, 'week': 7, 'month': 30, 'year': 12}
+        for period, count in expected.items():
+            points = self.service.get_points(self.currency, period, now=self.now)
+            self.assertEqual(len(points), count)
+        day = self.service.get_points(self.currency, 'day', now=self.now)
+        self.assertEqual(day[0]['timestamp'], '12:00')
+        month = self.service.get_points(self.currency, 'month', now=self.now)
+        self.assertEqual([p['timestamp'] for p in month[:3]], ['1', '2', '3'])
+
+    def test_empty_history_is_zero(self):
+        points = self.service.get_points(self.currency, 'week', now=self.now)
+        self.assertTrue(all(p['rate'] == 0 for p in points))
+
+    def test_day_uses_first_tick_and_forward_fills(self):
+        # Bucket 0 covers [now-24h, now-23h)
+        self.add_tick(timedelta(hours=23, minutes=50), '90.0')
+        self.add_tick(timedelta(hours=23, minutes=10), '91.0')
+        # Bucket 3 covers [now-21h, now-20h)
+        self.add_tick(timedelta(hours=20, minutes=30), '95.0')
+
+        rates = [p['rate'] for p in self.service.get_points(self.currency, 'day', now=self.now)]
+        self.assertEqual(rates[0], 90.0)
+        # Empty buckets repeat the last known rate, not the first one
+        self.assertEqual(rates[1], 91.0)
+        self.assertEqual(rates[2], 91.0)
+        self.assertEqual(rates[3], 95.0)
+        self.assertEqual(rates[-1], 95.0)
+
+    def test_week_uses_last_tick(self):
+        # Both ticks fall into the first bucket [now-7d, now-6d)
+        self.add_tick(timedelta(days=6, hours=20), '80.0')
+        self.add_tick(timedelta(days=6, hours=2), '81.0')
+        self.add_tick(timedelta(days=4, hours=1), '83.0')
+        rates = [p['rate'] for p in self.service.get_points(self.currency, 'week', now=self.now)]
+        self.assertEqual(rates[:4], [81.0, 81.0, 83.0, 83.0])
+
+    def test_strategies_agree(self):
+        for i in range(0, 365 * 24, 7):
+            self.add_tick(timedelta(hours=i), str(70 + (i % 97) / 10))
+        for period in PERIODS:
+            memory = self.service.get_points(
+                self.currency, period, now=self.now, strategy=CurrencyHistoryService.STRATEGY_MEMORY
+            )
+            aggregate = self.service.get_points(
+                self.currency, period, now=self.now, strategy=CurrencyHistoryService.STRATEGY_AGGREGATE
+            )
+            self.assertEqual(memory, aggregate, period)
+
+    def test_single_query_per_period(self):
+        self.add_tick(timedelta(hours=3), '90.0')
+        self.add_tick(timedelta(days=100), '91.0')
+        RollupService().refresh('currency')
+        for period in PERIODS:
+            with self.assertNumQueries(1):
+                self.service.get_points(self.currency, period, now=self.now)
+
+    def test_year_reads_daily_candles(self):
+        self.add_tick(timedelta(days=300), '60.0')
+        self.add_tick(timedelta(days=100), '70.0')
+        self.assertEqual(self.service.choose_strategy('year'), CurrencyHistoryService.STRATEGY_ROLLUP)
+
+        # Without candles the year chart falls back to the raw ticks
+        fallback = self.service.get_points(self.currency, 'year', now=self.now)
+        RollupService().refresh('currency')
+        CurrencyHistory.objects.all().delete()
+        from_candles = self.service.get_points(self.currency, 'year', now=self.now)
+        self.assertEqual(fallback, from_candles)
+        self.assertIn(70.0, [p['rate'] for p in from_candles])
+
+
+class CurrencyHistoryAPITest(APITestCase):
+    def test_history_endpoint_shape(self):
+        url = reverse('currency-get-history', kwargs={'pk': 'USD'})
+        response = self.client.get(url, {'period': 'month'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['currency'], 'USD')
+        self.assertEqual(response.data['period'], 'month')
+        self.assertEqual(len(response.data['data']), 30)
+
+    def test_unknown_period_is_an_error(self):
+        url = reverse('currency-get-history', kwargs={'pk': 'USD'})
+        response = self.client.get(url, {'period': 'decade'})
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class CurrencyListAPITest(APITestCase):
+    def setUp(self):
+        self.url = reverse('currency-list')
+        now = timezone.now()
+        for currency in Currency.objects.all():
+            for days, rate in ((40, '70'), (2, '80'), (1, '88')):
+                CurrencyHistory.objects.create(
+                    currency=currency, rate=Decimal(rate), timestamp=now - timedelta(days=days)
+                )
+
+    def test_snapshot_holds_latest_two_rates(self):
+        CurrencySnapshotService().refresh(codes=['USD'])
+        snapshot = CurrencyRateSnapshot.objects.get(currency='USD')
+        self.assertEqual(snapshot.rate, Decimal('88'))
+        self.assertEqual(snapshot.previous_rate, Decimal('80'))
+        self.assertEqual(snapshot.change_percent, 10.0)
+        self.assertEqual(CurrencyRateSnapshot.objects.count(), 1)
+
+    def test_list_reads_snapshot_and_batched_history(self):
+        CurrencySnapshotService().refresh()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        usd = next(c for c in response.data if c['code'] == 'USD')
+        self.assertEqual(usd['rate'], 88.0)
+        self.assertEqual(usd['change_percent'], 10.0)
+        # Only the last 30 days, oldest first
+        self.assertEqual([h['rate'] for h in usd['history']], ['80.0000000000', '88.0000000000'])
+
+    def test_list_query_count_does_not_depend_on_currencies(self):
+        CurrencySnapshotService().refresh()
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        for code in ('XAA', 'XAB', 'XAC'):
+            Currency.objects.create(code=code, name=code)
+        CurrencySnapshotService().refresh()
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(next(c for c in response.data if c['code'] == 'XAA')['rate'], 0.0)
+
+    def test_retrieve_without_snapshot(self):
+        # The history of setUp is never committed, so no snapshot was made
+        response = self.client.get(reverse('currency-detail', kwargs={'pk': 'USD'}))
+        self.assertEqual(response.data['rate'], 88.0)
+        self.assertEqual(response.data['change_percent'], 0.0)
+        self.assertEqual(len(response.data['history']), 2)
+
+    def test_history_writes_refresh_the_snapshot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tick = CurrencyHistory.objects.create(currency_id='USD', rate=Decimal('99'), timestamp=timezone.now())
+        snapshot = CurrencyRateSnapshot.objects.get(currency='USD')
+        self.assertEqual((snapshot.rate, snapshot.previous_rate), (Decimal('99'), Decimal('88')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tick.delete()
+        self.assertEqual(CurrencyRateSnapshot.objects.get(currency='USD').rate, Decimal('88'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CurrencyHistory.objects.filter(currency='USD').delete()
+        self.assertFalse(CurrencyRateSnapshot.objects.filter(currency='USD').exists())
+
+
+class CurrencyIngestTest(TestCase):
+    def setUp(self):
+        self.timestamp = datetime(2025, 3, 15, 12, 0, tzinfo=dt_timezone.utc)
+        self.rates = {'RUB': 1, 'USD': 0.0125, 'EUR': 0.01, 'XYZ': 3.0}
+        self.service = CurrencyAPIService(api_key='test')
+
+    def test_ingest_is_idempotent(self):
+        self.assertEqual(self.service.ingest_rates(self.rates, self.timestamp), 2)
+        self.assertEqual(self.service.ingest_rates(self.rates, self.timestamp), 0)
+        self.assertEqual(CurrencyHistory.objects.count(), 2)
+        usd = CurrencyHistory.objects.get(currency='USD')
+        self.assertEqual(usd.rate, Decimal('80'))
+        self.assertEqual(CurrencyRateSnapshot.objects.get(currency='USD').rate, Decimal('80'))
+
+    def test_write_path_is_constant_in_queries(self):
+        # Currency lookup, count, insert, count, plus the transaction savepoint pair;
+        # the rollup and snapshot refreshes are covered by their own tests
+        with mock.patch('api.services.currency_service.RollupService'), \
+                mock.patch('api.services.currency_service.CurrencySnapshotService'):
+            with self.assertNumQueries(6):
+                self.service.ingest_rates(self.rates, self.timestamp)
+
+    def test_zero_rate_is_skipped(self):
+        self.assertEqual(self.service.ingest_rates({'USD': 0, 'EUR': 0.01}, self.timestamp), 1)
+        self.assertFalse(CurrencyHistory.objects.filter(currency='USD').exists())
+
+    def test_update_currency_history_rerun_writes_nothing(self):
+        data = {'result': 'success', 'time_last_update_unix': 1742040000, 'conversion_rates': self.rates}
+        with mock.patch.object(CurrencyAPIService, 'fetch_latest_rates', return_value=data):
+            CurrencyAPIService.update_currency_history()
+            CurrencyAPIService.update_currency_history()
+        self.assertEqual(CurrencyHistory.objects.count(), 2)
@@ -0,0 +1,108 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .models import User, Card, Transaction, CryptoCurrency, CryptoTransaction, IdempotencyKey
+from .services.idempotency_service import IdempotencyService
+
+
+class IdempotentTransferTest(APITestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.bob = User.objects.create_user(phone_number='+79994445566', password='pw', first_name='Боб', last_name='Строитель')
+        self.alice_card = Card.objects.create(
+            owner=self.alice, card_number='1111000011110000', balance=Decimal('1000.00'),
+            card_expiry_date='2030-01-01', cvv='123'
+        )
+        self.bob_card = Card.objects.create(
+            owner=self.bob, card_number='3333000033330000', balance=Decimal('0.00'),
+            card_expiry_date='2030-01-01', cvv='123'
+        )
+        self.url = reverse('transfers')
+        self.data = {
+            "source_card_id": str(self.alice_card.id),
+            "target_card_number": self.bob_card.card_number,
+            "amount": "100.00"
+        }
+        self.client.force_authenticate(user=self.alice)
+
+    def post(self, data=None, key='retry-1'):
+        return self.client.post(self.url, data or self.data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_response_without_transferring_again(self):
+        first = self.post()
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(1):
+            retry = self.post()
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+        self.alice_card.refresh_from_db()
+        self.assertEqual(self.alice_card.balance, Decimal('900.00'))
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_rejections_are_replayed_too(self):
+        data = {**self.data, "amount": "5000.00"}
+        self.assertEqual(self.post(data).status_code, status.HTTP_400_BAD_REQUEST)
+        self.alice_card.balance = Decimal('10000.00')
+        self.alice_card.save()
+        self.assertEqual(self.post(data).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_key_reused_with_another_request_is_refused(self):
+        self.post()
+        response = self.post({**self.data, "amount": "1.00"})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.alice_card.refresh_from_db()
+        self.assertEqual(self.alice_card.balance, Decimal('900.00'))
+
+    def test_different_keys_transfer_twice(self):
+        self.post(key='a')
+        self.post(key='b')
+        self.alice_card.refresh_from_db()
+        self.assertEqual(self.alice_card.balance, Decimal('800.00'))
+
+    def test_expired_key_runs_the_request_again(self):
+        self.post()
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertNotIn('Idempotent-Replayed', self.post())
+        self.alice_card.refresh_from_db()
+        self.assertEqual(self.alice_card.balance, Decimal('800.00'))
+
+    def test_purge_expired(self):
+        self.post(key='a')
+        self.post(key='b')
+        IdempotencyKey.objects.filter(key='a').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(IdempotencyService().purge_expired(), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['b'])
+
+    def test_requests_without_key_are_not_recorded(self):
+        self.client.post(self.url, self.data, format='json')
+        self.client.post(self.url, self.data, format='json')
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.alice_card.refresh_from_db()
+        self.assertEqual(self.alice_card.balance, Decimal('800.00'))
+
+
+class IdempotentCryptoBuyTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.card = Card.objects.create(
+            owner=self.user, card_number='1111000011110000', balance=Decimal('1000.00'),
+            card_expiry_date='2030-01-01', cvv='123'
+        )
+        CryptoCurrency.objects.create(id='bitcoin', symbol='BTC', name='Bitcoin', current_price_usd=Decimal('50000'))
+        self.client.force_authenticate(user=self.user)
+
+    def test_retried_buy_charges_once(self):
+        data = {'cryptocurrency_id': 'bitcoin', 'usd_amount': '100.00'}
+        first = self.client.post(reverse('crypto-buy'), data, format='json', HTTP_IDEMPOTENCY_KEY='buy-1')
+        retry = self.client.post(reverse('crypto-buy'), data, format='json', HTTP_IDEMPOTENCY_KEY='buy-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(CryptoTransaction.objects.count(), 1)
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal('899.00'))
@@ -0,0 +1,142 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .models import User, Card, CryptoCurrency, LedgerPosting, LedgerCheckpoint
+from .services.ledger_service import LedgerService
+from .testing import make_card
+
+
+class LedgerIntegrationTest(APITestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.bob = User.objects.create_user(phone_number='+79994445566', password='pw', first_name='Боб', last_name='Строитель')
+        self.alice_card = make_card(self.alice, '1000.00', number='1111000011110000')
+        self.bob_card = make_card(self.bob, '0.00', number='3333000033330000')
+        self.service = LedgerService()
+
+    def assert_ledger_matches_cards(self):
+        self.assertEqual(self.service.discrepancies(), [])
+        journals = defaultdict(Decimal)
+        for journal_id, amount in LedgerPosting.objects.values_list('journal_id', 'amount'):
+            journals[journal_id] += amount
+        self.assertEqual(set(journals.values()), {Decimal('0')})
+
+    def test_opening_balance_is_posted(self):
+        self.assertEqual(self.service.balance_at(self.alice_card.id), Decimal('1000.00'))
+        self.assertEqual(LedgerPosting.objects.filter(kind='opening').count(), 2)
+
+    def test_transfer_posts_both_legs(self):
+        self.client.force_authenticate(user=self.alice)
+        response = self.client.post(reverse('transfers'), {
+            "source_card_id": self.alice_card.id,
+            "target_card_number": self.bob_card.card_number,
+            "amount": "150.00"
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        debit, credit = LedgerPosting.objects.filter(kind='transfer').order_by('amount')
+        self.assertEqual((debit.card_id, debit.counterparty_card_id, debit.amount),
+                         (self.alice_card.id, self.bob_card.id, Decimal('-150.00')))
+        self.assertEqual((credit.card_id, credit.counterparty_card_id, credit.amount),
+                         (self.bob_card.id, self.alice_card.id, Decimal('150.00')))
+        self.assertEqual(debit.transaction.user, self.alice)
+        self.assertEqual(credit.transaction.user, self.bob)
+        self.assert_ledger_matches_cards()
+
+    def test_batch_transfer_posts_a_journal_per_row(self):
+        self.client.force_authenticate(user=self.alice)
+        response = self.client.post(reverse('transfers-batch'), {
+            "source_card_id": str(self.alice_card.id),
+            "transfers": [
+                {"recipient": self.bob_card.card_number, "amount": "10.00"},
+                {"recipient": self.bob.phone_number, "amount": "20.00"},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(LedgerPosting.objects.filter(kind='transfer').values('journal_id').distinct().count(), 2)
+        self.assert_ledger_matches_cards()
+
+    def test_crypto_buy_posts_fee_and_settlement(self):
+        CryptoCurrency.objects.create(id='bitcoin', symbol='BTC', name='Bitcoin', current_price_usd=Decimal('50000'))
+        self.client.force_authenticate(user=self.alice)
+        response = self.client.post(reverse('crypto-buy'), {'cryptocurrency_id': 'bitcoin', 'usd_amount': '100.55'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        legs = dict(LedgerPosting.objects.filter(kind='crypto_buy').values_list('account', 'amount'))
+        self.assertEqual(legs, {
+            'card': Decimal('-101.56'),
+            'crypto_settlement': Decimal('100.55'),
+            'fees': Decimal('1.01'),
+        })
+        self.assert_ledger_matches_cards()
+
+    def test_admin_balance_change_is_posted(self):
+        admin = User.objects.create_superuser(phone_number='+79990000000', password='pw', first_name='Админ', last_name='Админов')
+        self.client.force_authenticate(user=admin)
+        url = reverse('admin-update-balance', kwargs={'user_id': self.alice.id})
+        response = self.client.post(url, {'card_id': str(self.alice_card.id), 'amount': '400', 'operation': 'set'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        card_leg = LedgerPosting.objects.get(kind='adjustment', account='card')
+        self.assertEqual(card_leg.amount, Decimal('-600.00'))
+        self.assertIsNotNone(card_leg.transaction)
+        self.assert_ledger_matches_cards()
+
+    def test_deleted_card_is_closed(self):
+        self.alice_card.delete()
+        self.assertEqual(self.service.balance_at(self.alice_card.id), 0)
+
+
+class LedgerCheckpointTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.card = make_card(self.user, '100.00', number='1111000011110000')
+        self.service = LedgerService()
+
+    def post(self, amount, at):
+        posting, _ = LedgerPosting.record('adjustment', [
+            LedgerPosting.card_leg(self.card.id, Decimal(amount)),
+            LedgerPosting.account_leg('adjustments', -Decimal(amount)),
+        ])
+        LedgerPosting.objects.filter(journal_id=posting.journal_id).update(created_at=at)
+
+    def test_unbalanced_journal_is_refused(self):
+        with self.assertRaises(ValueError):
+            LedgerPosting.record('adjustment', [LedgerPosting.card_leg(self.card.id, Decimal('5'))])
+
+    def test_balance_is_checkpoint_plus_recent_postings(self):
+        now = timezone.now()
+        LedgerPosting.objects.update(created_at=now - timedelta(days=3))
+        self.post('50', now - timedelta(days=2))
+        self.post('-30', now - timedelta(days=1))
+
+        self.assertEqual(self.service.checkpoint(now=now), 1)
+        checkpoint = LedgerCheckpoint.objects.get()
+        self.assertEqual(checkpoint.balance, Decimal('120.00'))
+        # Nothing moved since
+        self.assertEqual(self.service.checkpoint(now=now), 0)
+
+        self.post('5', now)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.service.balance_at(self.card.id), Decimal('125.00'))
+        self.assertEqual(self.service.balance_at(self.card.id, at=now - timedelta(days=2)), Decimal('150.00'))
+        self.assertEqual(self.service.balance_at(self.card.id, at=now - timedelta(hours=1)), Decimal('120.00'))
+        self.assertEqual(self.service.balances([self.card.id]), {self.card.id: Decimal('125.00')})
+
+        self.assertEqual(self.service.checkpoint(now=now + timedelta(hours=1)), 1)
+        self.assertEqual(LedgerCheckpoint.objects.latest('last_posting_id').balance, Decimal('125.00'))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.service.balances_at_checkpoint(), {self.card.id: Decimal('125.00')})
+
+    def test_checkpoint_skips_postings_of_the_last_minutes(self):
+        self.assertEqual(self.service.checkpoint(), 0)
+        self.assertEqual(self.service.checkpoint(now=timezone.now() + timedelta(minutes=10)), 1)
+
+    def test_discrepancy_is_reported(self):
+        Card.objects.filter(pk=self.card.pk).update(balance=Decimal('90.00'))
+        self.assertEqual(self.service.discrepancies(), [(self.card.id, Decimal('90.00'), Decimal('100.00'))])
@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .models import User, Transaction, ForumPost
+from .pagination import EstimatedCountPagination, estimate_count
+
+
+class TransactionHistoryPaginationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        other = User.objects.create_user(phone_number='+79994445566', password='pw', first_name='Боб', last_name='Строитель')
+        self.start = datetime(2026, 3, 1, 12, 0, tzinfo=dt_timezone.utc)
+        # 30 transactions, one per day, with pairs sharing a timestamp to
+        # exercise the id tie-break
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, title=f'T{i}', amount=Decimal(i), transaction_type=i % 2)
+            for i in range(30)
+        ] + [Transaction(user=other, title='Other', amount=Decimal('1'))])
+        for i, pk in enumerate(Transaction.objects.filter(user=self.user).order_by('amount').values_list('pk', flat=True)):
+            Transaction.objects.filter(pk=pk).update(timestamp=self.start + timedelta(days=i // 2))
+        self.url = reverse('transaction-list')
+        self.client.force_authenticate(user=self.user)
+
+    def walk(self, params):
+        """Follow next links from the first page, returning every row"""
+        rows = []
+        response = self.client.get(self.url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            rows.extend(response.data['results'])
+            if not response.data['next']:
+                return rows
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_history_once_in_order(self):
+        rows = self.walk({'page_size': 7})
+        expected = list(
+            Transaction.objects.filter(user=self.user)
+            .order_by('-timestamp', '-id')
+            .values_list('id', flat=True)
+        )
+        self.assertEqual([row['id'] for row in rows], [str(pk) for pk in expected])
+
+    def test_page_costs_one_query(self):
+        response = self.client.get(self.url, {'page_size': 5})
+        with self.assertNumQueries(1):
+            self.client.get(response.data['next'])
+
+    def test_page_size_is_capped(self):
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, title='Bulk', amount=Decimal('1')) for _ in range(250)
+        ])
+        response = self.client.get(self.url, {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 200)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_type_filter(self):
+        rows = self.walk({'type': 'income', 'page_size': 4})
+        self.assertEqual(len(rows), 15)
+        self.assertEqual({row['transaction_type'] for row in rows}, {1})
+        self.assertEqual(len(self.walk({'type': '0'})), 15)
+
+    def test_date_filter_includes_both_days(self):
+        rows = self.walk({'date_from': '2026-03-03', 'date_to': '2026-03-05', 'page_size': 4})
+        self.assertEqual(len(rows), 6)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'garbage'}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(self.url, {'type': 'refund'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'date_from': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ForumFeedPaginationTest(APITestCase):
+    def setUp(self):
+        author = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        ForumPost.objects.bulk_create([
+            ForumPost(author=author, title=f'Post {i}', content='...', is_pinned=i in (3, 11))
+            for i in range(25)
+        ])
+
+    def test_pinned_posts_come_first_and_pages_do_not_overlap(self):
+        titles = []
+        response = self.client.get(reverse('forum-post-list'), {'page_size': 10})
+        while True:
+            titles.extend(post['title'] for post in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(len(titles), 25)
+        self.assertEqual(len(set(titles)), 25)
+        self.assertEqual(set(titles[:2]), {'Post 3', 'Post 11'})
+
+
+class AdminListPaginationTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(phone_number='+79990000000', password='pw', first_name='Админ', last_name='Админов')
+        User.objects.bulk_create([
+            User(phone_number=f'+7999100{i:04d}', first_name='Клиент', last_name=str(i))
+            for i in range(60)
+        ])
+        self.total = User.objects.count()
+        self.client.force_authenticate(user=self.admin)
+        self.url = reverse('admin-users-list')
+
+    def test_limit_offset_pages(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], self.total)
+        self.assertFalse(response.data['count_is_estimate'])
+        self.assertEqual(len(response.data['results']), 50)
+
+        last = self.client.get(response.data['next'])
+        self.assertEqual(len(last.data['results']), self.total - 50)
+        self.assertIsNone(last.data['next'])
+
+    def test_limit_is_capped(self):
+        with mock.patch.object(EstimatedCountPagination, 'max_limit', 20):
+            response = self.client.get(self.url, {'limit': 500})
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_large_estimate_replaces_the_count(self):
+        with mock.patch('api.pagination.estimate_count', return_value=2_000_000):
+            response = self.client.get(self.url, {'limit': 10})
+        self.assertEqual(response.data['count'], 2_000_000)
+        self.assertTrue(response.data['count_is_estimate'])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_next_link_follows_rows_not_the_estimate(self):
+        with mock.patch('api.pagination.estimate_count', return_value=20_000), \
+                mock.patch('api.pagination.EXACT_COUNT_THRESHOLD', 10):
+            response = self.client.get(self.url, {'limit': 50, 'offset': 50})
+        self.assertEqual(len(response.data['results']), self.total - 50)
+        self.assertIsNone(response.data['next'])
+
+
+class EstimateCountTest(TestCase):
+    def test_estimate_only_on_postgresql(self):
+        if connection.vendor == 'postgresql':
+            self.assertIsInstance(estimate_count(User.objects.all()), int)
+        else:
+            self.assertIsNone(estimate_count(User.objects.all()))
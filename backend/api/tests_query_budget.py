@@ -0,0 +1,136 @@
+from decimal import Decimal
+from unittest import mock
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from .middleware import QueryBudgetExceeded, QueryStats, sql_shape
+from .models import (
+    User, Transaction, ForumPost, ForumComment, ForumLike, AIChat, AIChatMessage,
+    PredictionPost, PredictionComment,
+)
+from .testing import QueryBudgetAssertionsMixin
+from .views import ForumPostViewSet
+
+
+class SqlShapeTest(TestCase):
+    def test_literals_and_in_lists_are_removed(self):
+        self.assertEqual(
+            sql_shape("SELECT * FROM api_card WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            sql_shape("SELECT * FROM api_card WHERE id IN (%s) AND name = 'it''s' LIMIT 5"),
+        )
+        self.assertNotEqual(sql_shape('SELECT 1 FROM api_card'), sql_shape('SELECT 1 FROM api_loan'))
+
+    def test_repeated_shapes(self):
+        stats = QueryStats()
+        with connection.execute_wrapper(stats):
+            for pk in range(6):
+                list(User.objects.filter(pk=pk))
+            list(User.objects.all()[:1])
+        self.assertEqual(stats.count, 7)
+        [(shape, count)] = stats.repeated(5)
+        self.assertEqual(count, 6)
+
+    def test_sql_is_kept_only_when_recorded(self):
+        stats = QueryStats(record_sql=False)
+        with connection.execute_wrapper(stats):
+            for pk in range(6):
+                list(User.objects.filter(pk=pk))
+        self.assertEqual(stats.count, 6)
+        self.assertIsNone(stats.statements)
+        self.assertEqual(stats.repeated(5), [])
+
+
+class QueryBudgetMiddlewareTest(QueryBudgetAssertionsMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        self.readers = User.objects.bulk_create([
+            User(phone_number=f'+7999100{i:04d}', first_name='Читатель', last_name=str(i)) for i in range(8)
+        ])
+        for i in range(8):
+            post = ForumPost.objects.create(author=self.readers[i], title=f'Post {i}', content='...')
+            ForumComment.objects.bulk_create([
+                ForumComment(post=post, author=reader, content='+1') for reader in self.readers[:3]
+            ])
+            if i % 2:
+                ForumLike.objects.create(post=post, user=self.user)
+        # Token authentication, as the apps send it
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_forum_feed_within_budget(self):
+        response = self.client.get(reverse('forum-post-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertWithinQueryBudget(response)
+        self.assertNoRepeatedQueries(response)
+        liked = {post['title']: post['is_liked'] for post in response.data['results']}
+        self.assertEqual(liked['Post 1'], True)
+        self.assertEqual(liked['Post 2'], False)
+        self.assertEqual(len(response.data['results'][0]['comments']), 3)
+
+    def test_prediction_feed_within_budget(self):
+        for i in range(6):
+            post = PredictionPost.objects.create(
+                author=self.readers[i], currency_pair='USD/RUB', prediction_text='...', direction='up', confidence=60,
+            )
+            PredictionComment.objects.create(post=post, author=self.readers[0], content='+1')
+        response = self.client.get(reverse('prediction-list'))
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertWithinQueryBudget(response)
+        self.assertNoRepeatedQueries(response)
+
+    def test_chat_list_within_budget(self):
+        for i in range(6):
+            chat = AIChat.objects.create(user=self.user)
+            AIChatMessage.objects.create(chat=chat, role='user', content=f'Вопрос {i}')
+            AIChatMessage.objects.create(chat=chat, role='assistant', content='Ответ ' * 30)
+        AIChat.objects.create(user=self.user)
+
+        response = self.client.get(reverse('ai-chat-list'))
+        self.assertWithinQueryBudget(response)
+        self.assertNoRepeatedQueries(response)
+        chats = response.data['results']
+        self.assertEqual(len(chats), 7)
+        self.assertEqual((chats[0]['title'], chats[0]['messages_count'], chats[0]['last_message']), ('New Chat', 0, None))
+        self.assertEqual(chats[1]['title'], 'Вопрос 5')
+        self.assertEqual(chats[1]['messages_count'], 2)
+        self.assertEqual(chats[1]['last_message']['role'], 'assistant')
+        self.assertTrue(chats[1]['last_message']['content'].endswith('...'))
+
+    def test_transaction_history_within_budget(self):
+        Transaction.objects.bulk_create([Transaction(user=self.user, title='T', amount=Decimal('1')) for _ in range(20)])
+        self.assertWithinQueryBudget(self.client.get(reverse('transaction-list')))
+
+    @override_settings(QUERY_INSPECTOR_HEADERS=True, QUERY_REPEAT_THRESHOLD=2)
+    def test_headers_and_repeated_query_warnings(self):
+        with self.assertNoLogs('api.middleware', 'WARNING'):
+            response = self.client.get(reverse('forum-post-list'))
+        self.assertEqual(response['X-DB-Queries'], str(response.query_stats.count))
+        self.assertIn('X-DB-Time-ms', response)
+        self.assertEqual(response['X-DB-Repeated-Queries'], '0')
+
+        # The serializers' own queries, once per post without the annotations
+        with mock.patch.object(ForumPostViewSet, 'get_queryset', lambda view: ForumPost.objects.all()), \
+                override_settings(QUERY_BUDGET_ENFORCE=False):
+            with self.assertLogs('api.middleware', 'WARNING') as logs:
+                response = self.client.get(reverse('forum-post-list'))
+        # The budget warning follows the repeated query warnings
+        self.assertEqual(response['X-DB-Repeated-Queries'], str(len(logs.output) - 1))
+        self.assertIn('possible N+1', logs.output[0])
+
+    @mock.patch.object(ForumPostViewSet, 'query_budget', {'GET': 1})
+    def test_over_budget_fails_under_the_test_runner(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('forum-post-list'))
+        with override_settings(QUERY_BUDGET_ENFORCE=False), self.assertLogs('api.middleware', 'WARNING'):
+            response = self.client.get(reverse('forum-post-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(QUERY_INSPECTOR_HEADERS=False, QUERY_BUDGET_ENFORCE=False)
+    def test_production_settings_only_count(self):
+        response = self.client.get(reverse('forum-post-list'))
+        self.assertGreater(response.query_stats.count, 0)
+        self.assertIsNone(response.query_stats.statements)
+        self.assertNotIn('X-DB-Queries', response)
@@ -0,0 +1,59 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from unittest import skipIf
+from django.test import TestCase
+from django.utils import timezone
+from .models import Currency, CurrencyHistory, CurrencyHistoryRollup
+from .services.retention_service import RetentionService
+
+
+class RetentionServiceTest(TestCase):
+    def setUp(self):
+        self.currency = Currency.objects.get(code='USD')
+        self.now = timezone.now()
+        for days in (200, 120, 100, 10, 1):
+            for hour in range(3):
+                CurrencyHistory.objects.create(
+                    currency=self.currency,
+                    rate=Decimal(70 + days / 10 + hour),
+                    timestamp=self.now - timedelta(days=days, hours=hour),
+                )
+
+    def test_compacts_then_deletes_expired_ticks(self):
+        result = RetentionService(days=90, batch_size=4).apply('currency', now=self.now)
+        self.assertEqual(result, {'deleted': 9, 'dropped': 0})
+        self.assertEqual(CurrencyHistory.objects.count(), 6)
+        self.assertFalse(CurrencyHistory.objects.filter(timestamp__lt=self.now - timedelta(days=90)).exists())
+        # The deleted days survive as candles
+        oldest = CurrencyHistoryRollup.objects.filter(resolution='day').order_by('bucket_start').first()
+        self.assertEqual(oldest.ticks, 3)
+        self.assertLess(oldest.bucket_start, self.now - timedelta(days=199))
+
+    def test_dry_run_deletes_nothing(self):
+        RetentionService(days=90).apply('currency', now=self.now)
+        CurrencyHistory.objects.create(
+            currency=self.currency, rate=Decimal('1'), timestamp=self.now - timedelta(days=150)
+        )
+        result = RetentionService(days=90).apply('currency', now=self.now, dry_run=True)
+        self.assertEqual(result['deleted'], 1)
+        self.assertEqual(CurrencyHistory.objects.count(), 7)
+
+    def test_retention_cannot_cut_into_chart_windows(self):
+        with self.assertRaises(ValueError):
+            RetentionService(days=7)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('apply_retention', '--days', '110', stdout=out)
+        self.assertIn('currency: deleted 6 ticks', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('apply_retention', '--days', '5', stdout=StringIO())
+
+    @skipIf(connection.vendor == 'postgresql', 'Would convert the test tables')
+    def test_partitioning_requires_postgresql(self):
+        with self.assertRaises(CommandError):
+            call_command('partition_price_history', stdout=StringIO())
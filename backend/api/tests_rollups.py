@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .models import (
+    Currency, CurrencyHistory, CurrencyHistoryRollup,
+    CryptoCurrency, CryptoPriceHistory, CryptoPriceRollup,
+)
+from .services.rollup_service import RollupService
+
+
+class RollupServiceTest(TestCase):
+    def setUp(self):
+        self.currency = Currency.objects.get(code='USD')
+        self.service = RollupService()
+
+    def add_tick(self, timestamp, rate):
+        CurrencyHistory.objects.create(currency=self.currency, rate=Decimal(rate), timestamp=timestamp)
+
+    def candle(self, resolution, bucket_start):
+        return CurrencyHistoryRollup.objects.get(
+            currency=self.currency, resolution=resolution, bucket_start=bucket_start
+        )
+
+    def test_builds_hour_day_and_month_candles(self):
+        day = datetime(2025, 5, 10, tzinfo=dt_timezone.utc)
+        self.add_tick(day.replace(hour=9, minute=5), '90')
+        self.add_tick(day.replace(hour=9, minute=20), '95')
+        self.add_tick(day.replace(hour=9, minute=40), '88')
+        self.add_tick(day.replace(hour=14, minute=0), '91')
+
+        self.service.refresh('currency', asset_ids=['USD'])
+
+        hour = self.candle('hour', day.replace(hour=9))
+        self.assertEqual((hour.open, hour.high, hour.low, hour.close, hour.ticks),
+                         (Decimal('90'), Decimal('95'), Decimal('88'), Decimal('88'), 3))
+        daily = self.candle('day', day)
+        self.assertEqual((daily.open, daily.high, daily.low, daily.close, daily.ticks),
+                         (Decimal('90'), Decimal('95'), Decimal('88'), Decimal('91'), 4))
+        monthly = self.candle('month', day.replace(day=1))
+        self.assertEqual(monthly.close, Decimal('91'))
+        self.assertEqual(monthly.ticks, 4)
+
+    def test_incremental_refresh_only_touches_new_buckets(self):
+        day = datetime(2025, 5, 10, tzinfo=dt_timezone.utc)
+        self.add_tick(day.replace(hour=1), '90')
+        self.add_tick(day.replace(hour=2), '92')
+        self.service.refresh('currency', asset_ids=['USD'])
+
+        self.add_tick(day.replace(hour=2, minute=30), '99')
+        self.add_tick(day + timedelta(days=1, hours=3), '80')
+        # Only the last rolled-up hour, the new hour and their day/month are rewritten
+        written = self.service.refresh('currency', asset_ids=['USD'])
+        self.assertEqual(written, 2 + 2 + 1)
+
+        self.assertEqual(self.candle('hour', day.replace(hour=1)).close, Decimal('90'))
+        self.assertEqual(self.candle('hour', day.replace(hour=2)).high, Decimal('99'))
+        self.assertEqual(self.candle('day', day).close, Decimal('99'))
+        self.assertEqual(self.candle('month', day.replace(day=1)).low, Decimal('80'))
+        self.assertEqual(self.candle('month', day.replace(day=1)).ticks, 4)
+
+    def test_refresh_since_picks_up_backfilled_ticks(self):
+        day = datetime(2025, 5, 10, tzinfo=dt_timezone.utc)
+        self.add_tick(day.replace(hour=5), '90')
+        self.service.refresh('currency', asset_ids=['USD'])
+
+        self.add_tick(day.replace(hour=1), '70')
+        self.service.refresh('currency', asset_ids=['USD'])
+        self.assertEqual(self.candle('day', day).low, Decimal('90'))
+
+        self.service.refresh('currency', asset_ids=['USD'], since=day)
+        self.assertEqual(self.candle('day', day).low, Decimal('70'))
+        self.assertEqual(self.candle('day', day).open, Decimal('70'))
+
+
+class CryptoHistoryEndpointTest(APITestCase):
+    def setUp(self):
+        self.crypto = CryptoCurrency.objects.create(id='bitcoin', symbol='BTC', name='Bitcoin')
+        now = timezone.now()
+        for hours in range(0, 400 * 24, 6):
+            CryptoPriceHistory.objects.create(
+                cryptocurrency=self.crypto,
+                price_usd=Decimal(30000 + hours),
+                market_cap=1,
+                timestamp=now - timedelta(hours=hours),
+            )
+        self.url = reverse('crypto-currency-price-history', kwargs={'pk': 'bitcoin'})
+
+    def test_falls_back_to_raw_ticks_without_candles(self):
+        response = self.client.get(self.url, {'days': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 24)
+        self.assertNotIn('open', response.data[0])
+
+    def test_reads_daily_candles_for_long_ranges(self):
+        RollupService().refresh('crypto')
+        response = self.client.get(self.url, {'days': 365})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 365)
+        self.assertEqual(set(response.data[0]), {'price_usd', 'market_cap', 'volume_24h', 'timestamp', 'open', 'high', 'low'})
+        # Newest candle first, like the raw history
+        self.assertGreater(response.data[0]['timestamp'], response.data[1]['timestamp'])
+        # One candle per UTC day with ticks: 400 or 401 depending on the time of day
+        days = {timestamp.date() for timestamp in CryptoPriceHistory.objects.values_list('timestamp', flat=True)}
+        self.assertEqual(CryptoPriceRollup.objects.filter(resolution='day').count(), len(days))
+
+    def test_reads_hourly_candles_for_short_ranges(self):
+        RollupService().refresh('crypto')
+        response = self.client.get(self.url, {'days': 2})
+        self.assertEqual(len(response.data), 8)
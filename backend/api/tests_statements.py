@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .models import User, Transaction, CryptoCurrency, CryptoWallet, CryptoTransaction
+from .services import statement_service
+
+
+class StatementExportTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='+79991112233', password='pw', first_name='Алиса', last_name='Селезнева')
+        other = User.objects.create_user(phone_number='+79994445566', password='pw', first_name='Боб', last_name='Строитель')
+        start = datetime(2026, 3, 1, 9, 30, tzinfo=dt_timezone.utc)
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, title=f'Покупка, №{i}', amount=Decimal(f'{i}.50'), transaction_type=i % 2)
+            for i in range(10)
+        ] + [Transaction(user=other, title='Other', amount=Decimal('1'))])
+        for i, pk in enumerate(Transaction.objects.filter(user=self.user).order_by('amount').values_list('pk', flat=True)):
+            Transaction.objects.filter(pk=pk).update(timestamp=start + timedelta(days=i))
+        self.url = reverse('statement-export')
+        self.client.force_authenticate(user=self.user)
+
+    def content(self, response):
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_statement(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="statement-transactions-', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(io.StringIO(self.content(response))))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0]['title'], 'Покупка, №0')
+        self.assertEqual(rows[0]['amount'], '0.50')
+        self.assertEqual(rows[0]['timestamp'], '2026-03-01T09:30:00+00:00')
+        self.assertEqual([row['type'] for row in rows[:2]], ['Expense', 'Income'])
+
+    def test_ndjson_statement_with_period(self):
+        response = self.client.get(self.url, {'output': 'ndjson', 'date_from': '2026-03-03', 'date_to': '2026-03-04'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['amount'] for row in rows], ['2.50', '3.50'])
+
+    def test_body_is_streamed_in_chunks(self):
+        with mock.patch.object(statement_service, 'ROWS_PER_CHUNK', 3):
+            response = self.client.get(self.url)
+            chunks = list(response.streaming_content)
+        # Header line and 10 rows, three lines per chunk
+        self.assertEqual(len(chunks), 4)
+
+    def test_crypto_statement(self):
+        bitcoin = CryptoCurrency.objects.create(id='bitcoin', symbol='BTC', name='Bitcoin', current_price_usd=Decimal('50000'))
+        wallet = CryptoWallet.objects.create(user=self.user, cryptocurrency=bitcoin)
+        CryptoTransaction.objects.create(
+            user=self.user, wallet=wallet, transaction_type='buy', status='completed',
+            crypto_amount=Decimal('0.002'), usd_amount=Decimal('100.00'), fee_amount=Decimal('1.00'),
+            exchange_rate=Decimal('50000'),
+        )
+        response = self.client.get(self.url, {'source': 'crypto', 'output': 'ndjson'})
+        [row] = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual((row['symbol'], row['crypto_amount'], row['usd_amount']), ('BTC', '0.00200000', '100.00'))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'output': 'xlsx'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'source': 'loans'}).status_code, status.HTTP_400_BAD_REQUEST)
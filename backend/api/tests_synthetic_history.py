@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError
+from django.test import TestCase
+from .models import Currency, CurrencyHistory, CryptoCurrency, CryptoPriceHistory, CurrencyRateSnapshot
+from .services.synthetic_history_service import SyntheticHistoryService
+
+
+class SyntheticHistoryServiceTest(TestCase):
+    def setUp(self):
+        self.start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        self.end = self.start + timedelta(days=1)
+
+    def test_generates_evenly_spaced_ticks(self):
+        service = SyntheticHistoryService(seed=1, chunk_size=100)
+        written = service.generate_asset('currency', 'USD', 80.0, self.start, self.end, timedelta(minutes=5))
+        self.assertEqual(written, 288)
+
+        ticks = list(CurrencyHistory.objects.filter(currency='USD').order_by('timestamp'))
+        self.assertEqual(len(ticks), 288)
+        self.assertEqual(ticks[0].timestamp, self.start)
+        self.assertEqual(ticks[-1].timestamp, self.end - timedelta(minutes=5))
+        self.assertTrue(all(70 < tick.rate < 90 for tick in ticks))
+        self.assertEqual(len({tick.id for tick in ticks}), 288)
+
+    def test_seed_makes_walk_reproducible(self):
+        walks = [
+            SyntheticHistoryService(seed=7).random_walk(100.0, 1000, timedelta(minutes=1), 0.5)
+            for _ in range(2)
+        ]
+        self.assertEqual(walks[0].tolist(), walks[1].tolist())
+        self.assertTrue((walks[0] > 0).all())
+
+    def test_ignore_conflicts_skips_existing_ticks(self):
+        service = SyntheticHistoryService(seed=1)
+        service.generate_asset('currency', 'EUR', 90.0, self.start, self.end, timedelta(hours=1))
+        written = service.generate_asset(
+            'currency', 'EUR', 90.0, self.start - timedelta(hours=2), self.end, timedelta(hours=1),
+            ignore_conflicts=True,
+        )
+        self.assertEqual(written, 2)
+        self.assertEqual(CurrencyHistory.objects.filter(currency='EUR').count(), 26)
+
+    def test_conflicts_fail_without_ignore_conflicts(self):
+        service = SyntheticHistoryService(seed=1, method=SyntheticHistoryService.METHOD_BULK)
+        service.generate_asset('currency', 'EUR', 90.0, self.start, self.end, timedelta(hours=1))
+        with self.assertRaises(IntegrityError):
+            service.generate_asset('currency', 'EUR', 90.0, self.start - timedelta(hours=2), self.end, timedelta(hours=1))
+        self.assertEqual(CurrencyHistory.objects.filter(currency='EUR').count(), 24)
+
+    def test_crypto_ticks_carry_market_data(self):
+        CryptoCurrency.objects.create(
+            id='bitcoin', symbol='BTC', name='Bitcoin', current_price_usd=50000, market_cap=1_000_000_000_000
+        )
+        written = SyntheticHistoryService(seed=1).generate('crypto', self.start, self.end, timedelta(hours=1))
+        self.assertEqual(written, 24)
+        tick = CryptoPriceHistory.objects.order_by('timestamp').first()
+        self.assertAlmostEqual(tick.market_cap / float(tick.price_usd), 20_000_000, delta=1)
+        self.assertGreater(tick.volume_24h, 0)
+
+
+class GeneratePriceHistoryCommandTest(TestCase):
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('generate_price_history', '--source', 'currency', '--assets', 'USD', 'EUR',
+                     '--days', '1', '--interval', '3600', *args, stdout=out)
+        return out.getvalue()
+
+    def test_generates_and_refreshes_snapshots(self):
+        output = self.run_command('--seed', '3')
+        self.assertIn('Generated 48 ticks', output)
+        self.assertEqual(CurrencyRateSnapshot.objects.filter(currency__in=['USD', 'EUR']).count(), 2)
+
+    def test_refuses_to_overwrite_without_flag(self):
+        self.run_command()
+        with self.assertRaises(CommandError):
+            self.run_command()
+        self.run_command('--replace')
+        self.assertEqual(CurrencyHistory.objects.count(), 48)
+
+    def test_create_historical_data_is_idempotent(self):
+        call_command('create_historical_data', stdout=StringIO())
+        count = CurrencyHistory.objects.count()
+        self.assertGreater(count, 0)
+        call_command('create_historical_data', stdout=StringIO())
+        self.assertEqual(CurrencyHistory.objects.count(), count)
+        currencies = Currency.objects.exclude(code='RUB').count()
+        self.assertEqual(CurrencyHistory.objects.values('currency').distinct().count(), currencies)
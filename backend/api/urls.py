@@ -8,6 +8,7 @@ from .views import (
     CardListView,
     SetDefaultCardView,
     TransactionListView,
+    StatementExportView,
     AdminCreditScoreCheck,
     LoanCreateView,
     MortgageCreateView,
@@ -16,6 +17,7 @@ from .views import (
     ApplicationUpdateView,
     AdminApplicationListView,
     TransferView,
+    BatchTransferView,
     CurrencyViewSet,
     ForumPostViewSet,
     ForumCommentViewSet,
@@ -41,6 +43,9 @@ from .views import (
     UserLoansView,
     UserDepositsView,
     UserMortgagesView,
+    LoanScheduleView,
+    MortgageScheduleView,
+    AmortizationCalculatorView,
     # Admin management views
     AdminUserListView,
     AdminUpdateUserBalanceView,
@@ -74,7 +79,9 @@ urlpatterns = [
     path('cards/create/', CardCreateView.as_view(), name='card-create'),
     path('cards/<uuid:pk>/set-default/', SetDefaultCardView.as_view(), name='card-set-default'),
     path('transactions/', TransactionListView.as_view(), name='transaction-list'),
+    path('statements/export/', StatementExportView.as_view(), name='statement-export'),
     path('transfers/', TransferView.as_view(), name='transfers'),
+    path('transfers/batch/', BatchTransferView.as_view(), name='transfers-batch'),
     path('admin/check-score/<int:user_id>/', AdminCreditScoreCheck.as_view(), name='admin-check-score'),
     
     # Application endpoints
@@ -109,6 +116,9 @@ urlpatterns = [
     path('user/loans/', UserLoansView.as_view(), name='user-loans'),
     path('user/deposits/', UserDepositsView.as_view(), name='user-deposits'),
     path('user/mortgages/', UserMortgagesView.as_view(), name='user-mortgages'),
+    path('user/loans/<uuid:pk>/schedule/', LoanScheduleView.as_view(), name='loan-schedule'),
+    path('user/mortgages/<uuid:pk>/schedule/', MortgageScheduleView.as_view(), name='mortgage-schedule'),
+    path('calculators/amortization/', AmortizationCalculatorView.as_view(), name='amortization-calculator'),
     
     # Admin management endpoints
     path('admin/users/', AdminUserListView.as_view(), name='admin-users-list'),
@@ -5,7 +5,7 @@ from rest_framework.authtoken.models import Token
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import viewsets, generics, permissions, status
-from .models import User, Transaction, Card, Deposit, Loan, Mortgage, Application, Currency, CurrencyHistory, ForumPost, ForumComment, ForumLike, Terminal, AIChat, AIChatMessage, PredictionPost, PredictionComment, PredictionLike, CryptoCurrency, CryptoWallet, CryptoTransaction, CryptoPriceHistory
+from .models import User, Transaction, TransactionMonthlyRollup, Card, Deposit, Loan, Mortgage, Application, Currency, CurrencyHistory, ForumPost, ForumComment, ForumLike, Terminal, AIChat, AIChatMessage, PredictionPost, PredictionComment, PredictionLike, CryptoCurrency, CryptoWallet, CryptoTransaction, CryptoPriceHistory, LedgerPosting
 from .serializers import (
     UserRegistrationSerializer, 
     UserSerializer, 
@@ -17,6 +17,7 @@ from .serializers import (
     MortgageSerializer,
     UserProfileSerializer,
     TransferSerializer,
+    BatchTransferSerializer,
     ApplicationSerializer,
     AdminApplicationSerializer,
     CurrencySerializer,
@@ -33,18 +34,28 @@ from .serializers import (
 )
 from rest_framework.renderers import JSONRenderer, TemplateHTMLRenderer, BrowsableAPIRenderer
 from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
-from datetime import date, timedelta
+from datetime import date, datetime, time, timedelta
 from rest_framework import status
-from .credit_logic import CreditLogicManager
+from .services.transfer_service import TransferService, TransferError
+from .services.idempotency_service import idempotent
+from .services.statement_service import StatementService
+from .services.analytics_cache_service import AnalyticsSnapshotService
+from .services.credit_score_service import CreditScoreService
+from .services.amortization_service import AmortizationService
+from .pagination import KeysetPagination
 from decimal import Decimal, Inexact
+from collections import defaultdict
 from django.db import transaction
 from rest_framework.views import APIView
-import re
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import action
 from django.utils import timezone
-from django.db.models import Sum, Avg
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from django.db.models import Count, Sum, Avg
 from rest_framework.parsers import MultiPartParser, FormParser
 from PIL import Image
 import os
@@ -90,155 +101,75 @@ class TransferView(generics.CreateAPIView):
     serializer_class = TransferSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         import logging
         logger = logging.getLogger(__name__)
-        
-        try:
-            logger.info(f"Transfer request data: {request.data}")
-            serializer = self.get_serializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            source_card_id = serializer.validated_data['source_card_id']
-            
-            target_card_number = serializer.validated_data['target_card_number']
-            amount = serializer.validated_data['amount']
-            comment = serializer.validated_data.get('comment', '')
-            logger.info(f"Transfer details - source: {source_card_id}, target: {target_card_number}, amount: {amount}")
-
-            with transaction.atomic():
-                # Get and lock the source card inside transaction
-                logger.info(f"Looking for source card: {source_card_id}")
-                try:
-                    source_card = Card.objects.select_for_update().get(id=source_card_id, owner=request.user)
-                    logger.info(f"Found source card: {source_card.card_name}, balance: {source_card.balance}")
-                except Card.DoesNotExist:
-                    logger.error(f"Source card not found: {source_card_id}")
-                    return Response({"error": "Source card not found or you are not the owner."}, status=status.HTTP_404_NOT_FOUND)
-
-                if not source_card.is_active:
-                    logger.error(f"Source card is blocked: {source_card_id}")
-                    return Response({"error": "Source card is blocked."}, status=status.HTTP_403_FORBIDDEN)
-                # Get the sender's card
-                sender_card = source_card
-
-                # Check for sufficient funds
-                if sender_card.balance < amount:
-                    return Response({"detail": "Insufficient funds."}, status=status.HTTP_400_BAD_REQUEST)
-
-                # Determine recipient
-                recipient_user = None
-                recipient_card = None
-                is_phone_transfer = False
-
-                # Check if identifier is a card number (with or without spaces)
-                logger.info(f"Checking if {target_card_number} is card number")
-                # Remove spaces and check if it's 16 digits
-                card_number_clean = target_card_number.replace(' ', '')
-                if re.match(r'^\d{16}$', card_number_clean):
-                    logger.info("Recognized as card number, looking for card")
-                    
-                    # Debug: Log all existing cards
-                    all_cards = Card.objects.all()
-                    logger.info(f"All cards in database: {[(card.card_number, card.owner.get_full_name()) for card in all_cards]}")
-                    
-                    try:
-                        # Try to find card by the exact format first
-                        logger.info(f"Searching for exact match: '{target_card_number}'")
-                        recipient_card = Card.objects.get(card_number=target_card_number)
-                        recipient_user = recipient_card.owner
-                        logger.info(f"Found recipient card: {recipient_card.card_name}, owner: {recipient_user.get_full_name()}")
-                    except Card.DoesNotExist:
-                        try:
-                            # Try to find card by clean number (without spaces)
-                            logger.info(f"Searching for clean number: '{card_number_clean}'")
-                            recipient_card = Card.objects.get(card_number=card_number_clean)
-                            recipient_user = recipient_card.owner
-                            logger.info(f"Found recipient card by clean number: {recipient_card.card_name}, owner: {recipient_user.get_full_name()}")
-                        except Card.DoesNotExist:
-                            logger.warning(f"Card not found with both formats: '{target_card_number}' and '{card_number_clean}', will try as phone number")
-                            pass # It's not a card number, will check if it's a phone number
-                
-                # If not a card, check if it's a phone number
-                if recipient_card is None:
-                    logger.info("Treating as phone number")
-                    is_phone_transfer = True
-                    try:
-                        recipient_user = User.objects.get(phone_number=target_card_number)
-                        logger.info(f"Found recipient user by phone: {recipient_user.get_full_name()}")
-                        # Find the recipient's default card, or just any card if no default is set
-                        recipient_card = Card.objects.filter(owner=recipient_user).first() 
-                        if not recipient_card:
-                                logger.error(f"Recipient {recipient_user.get_full_name()} has no cards")
-                                return Response({"detail": "Recipient does not have a card to receive funds."}, status=status.HTTP_400_BAD_REQUEST)
-                        logger.info(f"Using recipient card: {recipient_card.card_name}")
-                    except User.DoesNotExist:
-                        logger.error(f"No user found with phone: {target_card_number}")
-                        return Response({"detail": "Recipient not found."}, status=status.HTTP_404_NOT_FOUND)
-                
-                # Check for transfer to self
-                if sender_card == recipient_card:
-                    return Response({"detail": "Cannot transfer to the same card."}, status=status.HTTP_400_BAD_REQUEST)
-                
-                # Check for transfer to self by phone number only
-                if is_phone_transfer and request.user == recipient_user:
-                    return Response({"detail": "Cannot transfer to yourself."}, status=status.HTTP_400_BAD_REQUEST)
-                
-                # Perform the transfer
-                logger.info(f"Performing transfer: {amount} from {sender_card.balance}")
-                sender_card.balance -= amount
-                recipient_card.balance += amount
-                sender_card.save()
-                recipient_card.save()
-                logger.info("Card balances updated")
-
-                # Update total balance for both users
-                logger.info("Updating total balances")
-                request.user.update_total_balance()
-                recipient_user.update_total_balance()
-                logger.info("Total balances updated")
-
-                # Create transaction records
-                logger.info("Creating transaction records")
-                
-                # Формируем title с комментарием если он есть
-                sender_title = f"Transfer to {recipient_user.get_full_name()}"
-                recipient_title = f"Transfer from {request.user.get_full_name()}"
-                
-                if comment:
-                    sender_title += f" | {comment}"
-                    recipient_title += f" | {comment}"
-                
-                Transaction.objects.create(
-                    user=request.user,
-                    title=sender_title,
-                    amount=-amount,
-                    transaction_type=0 # Expense
-                )
-                Transaction.objects.create(
-                    user=recipient_user,
-                    title=recipient_title,
-                    amount=amount,
-                    transaction_type=1 # Income
-                )
-                logger.info("Transaction records created")
-                
-                return Response({
-                    "detail": "Transfer successful.",
-                    "sender_balance": sender_card.balance
-                }, status=status.HTTP_200_OK)
 
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        try:
+            source_card = TransferService().transfer(
+                user=request.user,
+                source_card_id=data['source_card_id'],
+                target=data['target_card_number'],
+                amount=data['amount'],
+                comment=data.get('comment', ''),
+            )
+        except TransferError as e:
+            return Response({e.key: e.message}, status=e.status_code)
         except Exception as e:
             # Log the exception e for debugging
             logger.error(f"Transfer error: {str(e)}", exc_info=True)
             return Response({"detail": f"Произошла внутренняя ошибка при выполнении перевода: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        return Response({
+            "detail": "Transfer successful.",
+            "sender_balance": source_card.balance
+        }, status=status.HTTP_200_OK)
+
+class BatchTransferView(APIView):
+    """
+    Pay many recipients (card or phone numbers) from one card at once,
+    e.g. for payroll. Returns a result per row.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @idempotent
+    def post(self, request):
+        import logging
+        logger = logging.getLogger(__name__)
+
+        serializer = BatchTransferSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        try:
+            source_card, results = TransferService().batch_transfer(
+                user=request.user,
+                source_card_id=data['source_card_id'],
+                rows=data['transfers'],
+            )
+        except TransferError as e:
+            return Response({e.key: e.message}, status=e.status_code)
+        except Exception as e:
+            logger.error(f"Batch transfer error: {str(e)}", exc_info=True)
+            return Response({"detail": f"Произошла внутренняя ошибка при выполнении перевода: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        completed = sum(1 for result in results if result['status'] == 'completed')
+        return Response({
+            "detail": "Batch transfer processed.",
+            "completed": completed,
+            "failed": len(results) - completed,
+            "sender_balance": source_card.balance,
+            "results": results,
+        }, status=status.HTTP_200_OK)
+
 class AdminCreditScoreCheck(APIView):
     permission_classes = [permissions.IsAdminUser]
     
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.credit_logic_manager = CreditLogicManager()
-
     def get(self, request, user_id):
         if not user_id:
             return Response(
@@ -254,7 +185,7 @@ class AdminCreditScoreCheck(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        score_details = self.credit_logic_manager.get_detailed_credit_score(user)
+        score_details = CreditScoreService().breakdown(user)
         return Response(score_details)
 
 class ApplicationUpdateView(APIView):
@@ -338,11 +269,26 @@ class AdminApplicationListView(generics.ListAPIView):
     """
     serializer_class = AdminApplicationSerializer
     permission_classes = [permissions.IsAdminUser]
+    query_budget = 10
     
     def get_queryset(self):
         # Возвращаем только заявки со статусом PENDING
         return Application.objects.filter(status='PENDING').select_related('user').order_by('-created_at')
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        applications = page if page is not None else list(queryset)
+
+        # Stored scores of the page's users, the outdated ones recomputed together
+        breakdowns = CreditScoreService().breakdowns(application.user for application in applications)
+        context = self.get_serializer_context()
+        context['credit_scores'] = {user_id: breakdown['final_score'] for user_id, breakdown in breakdowns.items()}
+        serializer = self.get_serializer_class()(applications, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
 class LoanCreateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -422,6 +368,8 @@ class CardListView(generics.ListAPIView):
     """
     serializer_class = CardSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # A user holds a handful of cards
+    pagination_class = None
 
     def get_queryset(self):
         return Card.objects.filter(owner=self.request.user)
@@ -448,17 +396,85 @@ class SetDefaultCardView(APIView):
 
         return Response({'status': f'Card {card_to_set_default.card_number} is now the default.'}, status=status.HTTP_200_OK)
 
+def period_bounds(query_params):
+    """
+    Bounds from ?date_from= and ?date_to=, both inclusive and given as
+    YYYY-MM-DD or an ISO datetime, as lookups: {'gte': ..., 'lt': ...}
+    """
+    bounds = {}
+    for param, lookup in (('date_from', 'gte'), ('date_to', 'lt')):
+        value = query_params.get(param)
+        if not value:
+            continue
+        try:
+            day = parse_date(value)
+            moment = None if day else parse_datetime(value)
+        except ValueError:
+            day = moment = None
+        if day is not None:
+            # The whole date_to day is included
+            if param == 'date_to':
+                day += timedelta(days=1)
+            moment = datetime.combine(day, time.min)
+        elif moment is None:
+            raise ValidationError({param: 'Expected YYYY-MM-DD or an ISO 8601 datetime.'})
+        elif param == 'date_to':
+            lookup = 'lte'
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        bounds[lookup] = moment
+    return bounds
+
+
 class TransactionListView(generics.ListAPIView):
     """
-    An endpoint for the user to view their transaction history.
+    An endpoint for the user to view their transaction history, newest first.
+
+    Paged by a cursor on (timestamp, id) rather than by offset, see
+    KeysetPagination. Optional filters: ?type=expense|income (or 0|1),
+    ?date_from= and ?date_to=. Both filters are covered by the Transaction
+    indexes, so any page reads page_size rows from the index.
     """
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering = ('-timestamp', '-id')
+    query_budget = 3
 
     def get_queryset(self):
-        # Based on the current Transaction model, it's only linked to one user.
-        # This will show all transactions associated with the logged-in user.
-        return Transaction.objects.filter(user=self.request.user).order_by('-timestamp')
+        period = {f'timestamp__{lookup}': value for lookup, value in period_bounds(self.request.query_params).items()}
+        queryset = Transaction.objects.filter(user=self.request.user, **period)
+        transaction_type = self.request.query_params.get('type')
+        if transaction_type:
+            types = {label.lower(): value for value, label in Transaction.TRANSACTION_TYPES}
+            types.update({str(value): value for value in types.values()})
+            if transaction_type.lower() not in types:
+                raise ValidationError({'type': f"Expected one of: {', '.join(types)}."})
+            queryset = queryset.filter(transaction_type=types[transaction_type.lower()])
+        return queryset
+
+class StatementExportView(APIView):
+    """
+    Download the user's statement as a file, streamed as it is read.
+
+    ?source=transactions|crypto, ?output=csv|ndjson, and the ?date_from= /
+    ?date_to= filters of the transaction history.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        source = request.query_params.get('source', 'transactions')
+        output = request.query_params.get('output', 'csv')
+        if source not in StatementService.SOURCES:
+            raise ValidationError({'source': f"Expected one of: {', '.join(StatementService.SOURCES)}."})
+        if output not in StatementService.FORMATS:
+            raise ValidationError({'output': f"Expected one of: {', '.join(StatementService.FORMATS)}."})
+
+        service = StatementService(request.user, source, period_bounds(request.query_params))
+        response = StreamingHttpResponse(service.stream(output), content_type=StatementService.FORMATS[output])
+        filename = f"statement-{source}-{timezone.localdate().isoformat()}.{output}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 class CardCreateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -484,9 +500,24 @@ class CurrencyViewSet(viewsets.ReadOnlyModelViewSet):
     Provides a list of all available currencies and allows retrieving
     a specific currency with its historical data.
     """
-    queryset = Currency.objects.all().prefetch_related('history')
+    queryset = Currency.objects.all().select_related('snapshot').annotate(
+        # A currency without a snapshot yet shows its latest tick, read only
+        # for those rows
+        latest_rate=Coalesce('snapshot__rate', Subquery(
+            CurrencyHistory.objects.filter(currency=OuterRef('pk')).order_by('-timestamp').values('rate')[:1]
+        )),
+    )
     serializer_class = CurrencySerializer
     permission_classes = [permissions.AllowAny] # Data is public
+    # A fixed catalogue, returned whole
+    pagination_class = None
+
+    def get_queryset(self):
+        if self.action == 'get_history':
+            # The chart is built by CurrencyHistoryService, prefetching the
+            # whole history of the currency here would only waste memory
+            return Currency.objects.all()
+        return super().get_queryset()
 
     @action(detail=False, methods=['post'], url_path='update-rates')
     def update_rates(self, request):
@@ -533,156 +564,10 @@ class CurrencyViewSet(viewsets.ReadOnlyModelViewSet):
         try:
             currency = self.get_object()
             period = request.query_params.get('period', 'week')
-            
-            from datetime import datetime, timedelta
-            from django.utils import timezone
-            
-            # Определяем период и количество точек данных
-            now = timezone.now()
-            if period == 'day':
-                # 24 точки за последние 24 часа
-                start_time = now - timedelta(hours=24)
-                history = CurrencyHistory.objects.filter(
-                    currency=currency,
-                    timestamp__gte=start_time
-                ).order_by('timestamp')
-                
-                # Группируем по часам
-                points = []
-                for i in range(24):
-                    hour_start = start_time + timedelta(hours=i)
-                    hour_end = hour_start + timedelta(hours=1)
-                    
-                    hour_data = history.filter(
-                        timestamp__gte=hour_start,
-                        timestamp__lt=hour_end
-                    ).first()
-                    
-                    if hour_data:
-                        points.append({
-                            'timestamp': hour_start.strftime('%H:00'),
-                            'rate': float(hour_data.rate)
-                        })
-                    else:
-                        # Если нет данных за этот час, используем последнее известное значение
-                        last_rate = history.filter(timestamp__lt=hour_start).last()
-                        rate = float(last_rate.rate) if last_rate else 0
-                        points.append({
-                            'timestamp': hour_start.strftime('%H:00'),
-                            'rate': rate
-                        })
-                        
-            elif period == 'week':
-                # 7 точек за последнюю неделю
-                start_time = now - timedelta(days=7)
-                history = CurrencyHistory.objects.filter(
-                    currency=currency,
-                    timestamp__gte=start_time
-                ).order_by('timestamp')
-                
-                points = []
-                days = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-                for i in range(7):
-                    day_start = start_time + timedelta(days=i)
-                    day_end = day_start + timedelta(days=1)
-                    
-                    day_data = history.filter(
-                        timestamp__gte=day_start,
-                        timestamp__lt=day_end
-                    ).last()  # Берем последнее значение за день
-                    
-                    if day_data:
-                        points.append({
-                            'timestamp': days[day_start.weekday()],
-                            'rate': float(day_data.rate)
-                        })
-                    else:
-                        last_rate = history.filter(timestamp__lt=day_start).last()
-                        rate = float(last_rate.rate) if last_rate else 0
-                        points.append({
-                            'timestamp': days[day_start.weekday()],
-                            'rate': rate
-                        })
-                        
-            elif period == 'month':
-                # 30 точек за последний месяц
-                start_time = now - timedelta(days=30)
-                history = CurrencyHistory.objects.filter(
-                    currency=currency,
-                    timestamp__gte=start_time
-                ).order_by('timestamp')
-                
-                points = []
-                for i in range(30):
-                    day_start = start_time + timedelta(days=i)
-                    day_end = day_start + timedelta(days=1)
-                    
-                    day_data = history.filter(
-                        timestamp__gte=day_start,
-                        timestamp__lt=day_end
-                    ).last()
-                    
-                    if day_data:
-                        points.append({
-                            'timestamp': str(i + 1),
-                            'rate': float(day_data.rate)
-                        })
-                    else:
-                        last_rate = history.filter(timestamp__lt=day_start).last()
-                        rate = float(last_rate.rate) if last_rate else 0
-                        points.append({
-                            'timestamp': str(i + 1),
-                            'rate': rate
-                        })
-                        
-            elif period == 'year':
-                # 12 точек за последний год
-                start_time = now - timedelta(days=365)
-                history = CurrencyHistory.objects.filter(
-                    currency=currency,
-                    timestamp__gte=start_time
-                ).order_by('timestamp')
-                
-                points = []
-                months = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 
-                         'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
-                
-                for i in range(12):
-                    month_start = start_time + timedelta(days=i * 30)
-                    month_end = month_start + timedelta(days=30)
-                    
-                    month_data = history.filter(
-                        timestamp__gte=month_start,
-                        timestamp__lt=month_end
-                    ).last()
-                    
-                    if month_data:
-                        points.append({
-                            'timestamp': months[month_start.month - 1],
-                            'rate': float(month_data.rate)
-                        })
-                    else:
-                        last_rate = history.filter(timestamp__lt=month_start).last()
-                        rate = float(last_rate.rate) if last_rate else 0
-                        points.append({
-                            'timestamp': months[month_start.month - 1],
-                            'rate': rate
-                        })
-            
-            # Если нет исторических данных, создаем заглушку
-            if not points:
-                current_rate = float(currency.current_rate) if hasattr(currency, 'current_rate') else 90.0
-                if period == 'day':
-                    points = [{'timestamp': f'{i}:00', 'rate': current_rate} for i in range(24)]
-                elif period == 'week':
-                    days = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-                    points = [{'timestamp': day, 'rate': current_rate} for day in days]
-                elif period == 'month':
-                    points = [{'timestamp': str(i + 1), 'rate': current_rate} for i in range(30)]
-                elif period == 'year':
-                    months = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
-                    points = [{'timestamp': month, 'rate': current_rate} for month in months]
-            
+
+            from .services.history_service import CurrencyHistoryService
+            points = CurrencyHistoryService().get_points(currency, period)
+
             return Response({
                 'currency': currency.code,
                 'period': period,
@@ -706,6 +591,9 @@ class ForumPostViewSet(viewsets.ModelViewSet):
     queryset = ForumPost.objects.all()
     serializer_class = ForumPostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    ordering = ('-is_pinned', '-created_at', '-id')
+    query_budget = {'GET': 5}
 
     def get_queryset(self):
         queryset = ForumPost.objects.all()
@@ -726,7 +614,15 @@ class ForumPostViewSet(viewsets.ModelViewSet):
         pinned_only = self.request.query_params.get('pinned', None)
         if pinned_only == 'true':
             queryset = queryset.filter(is_pinned=True)
-            
+
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.select_related('author').prefetch_related(
+                Prefetch('comments', queryset=ForumComment.objects.select_related('author'))
+            )
+            if self.request.user.is_authenticated:
+                queryset = queryset.annotate(liked_by_user=Exists(
+                    ForumLike.objects.filter(post=OuterRef('pk'), user=self.request.user)
+                ))
         return queryset
 
     def get_serializer_context(self):
@@ -771,7 +667,7 @@ class ForumPostViewSet(viewsets.ModelViewSet):
     def comments(self, request, pk=None):
         """Get comments for a specific post"""
         post = self.get_object()
-        comments = post.comments.all()
+        comments = post.comments.select_related('author')
         serializer = ForumCommentSerializer(comments, many=True, context={'request': request})
         return Response(serializer.data)
 
@@ -803,10 +699,13 @@ class ForumCommentViewSet(viewsets.ModelViewSet):
     queryset = ForumComment.objects.all()
     serializer_class = ForumCommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    ordering = ('created_at', 'id')
+    query_budget = {'GET': 4}
 
     def get_queryset(self):
         # Filter comments by the post_pk from the URL
-        return self.queryset.filter(post_id=self.kwargs.get('post_pk'))
+        return self.queryset.filter(post_id=self.kwargs.get('post_pk')).select_related('author')
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -835,6 +734,7 @@ class TerminalViewSet(viewsets.ReadOnlyModelViewSet):
 class CardViewSet(viewsets.ModelViewSet):
     serializer_class = CardSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
 
     def get_queryset(self):
         """
@@ -850,7 +750,7 @@ class CardViewSet(viewsets.ModelViewSet):
         """
         card = self.get_object()
         card.is_active = False
-        card.save()
+        card.save(update_fields=['is_active'])
         return Response({'status': 'card blocked'}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], url_path='unblock')
@@ -860,12 +760,23 @@ class CardViewSet(viewsets.ModelViewSet):
         """
         card = self.get_object()
         card.is_active = True
-        card.save()
+        card.save(update_fields=['is_active'])
         return Response({'status': 'card unblocked'}, status=status.HTTP_200_OK)
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    def perform_update(self, serializer):
+        old_balance = serializer.instance.balance
+        card = serializer.save()
+        delta = card.balance - old_balance
+        self.request.user.adjust_total_balance(delta)
+        if delta:
+            LedgerPosting.record('adjustment', [
+                LedgerPosting.card_leg(card.id, delta),
+                LedgerPosting.account_leg('adjustments', -delta),
+            ])
+
 
 class CreateCardApplicationView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -902,9 +813,24 @@ class AIChatViewSet(viewsets.ModelViewSet):
     - Delete chat
     """
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering = ('-updated_at', '-id')
+    query_budget = {'GET': 5}
 
     def get_queryset(self):
-        return self.request.user.ai_chats.filter(is_active=True).order_by('-updated_at')
+        queryset = self.request.user.ai_chats.filter(is_active=True).order_by('-updated_at')
+        if self.action == 'list':
+            # Everything AIChatListSerializer shows, in the same query
+            messages = AIChatMessage.objects.filter(chat=OuterRef('pk'))
+            last = messages.order_by('-created_at')
+            queryset = queryset.annotate(
+                messages_total=Count('messages'),
+                last_message_role=Subquery(last.values('role')[:1]),
+                last_message_content=Subquery(last.values('content')[:1]),
+                last_message_at=Subquery(last.values('created_at')[:1]),
+                first_user_message=Subquery(messages.filter(role='user').order_by('created_at').values('content')[:1]),
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -981,6 +907,21 @@ class PredictionPostViewSet(viewsets.ModelViewSet):
     """
     queryset = PredictionPost.objects.all().order_by('-created_at')
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    ordering = ('-created_at', '-id')
+    query_budget = {'GET': 5}
+
+    def get_queryset(self):
+        queryset = self.queryset
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.select_related('author').prefetch_related(
+                Prefetch('comments', queryset=PredictionComment.objects.select_related('author'))
+            )
+            if self.request.user.is_authenticated:
+                queryset = queryset.annotate(liked_by_user=Exists(
+                    PredictionLike.objects.filter(post=OuterRef('pk'), user=self.request.user)
+                ))
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -1017,7 +958,7 @@ class PredictionPostViewSet(viewsets.ModelViewSet):
     def comments(self, request, pk=None):
         """Get comments for a prediction post"""
         post = self.get_object()
-        comments = post.comments.all().order_by('created_at')
+        comments = post.comments.select_related('author').order_by('created_at')
         serializer = PredictionCommentSerializer(comments, many=True, context={'request': request})
         return Response(serializer.data)
 
@@ -1042,7 +983,8 @@ class PredictionPostViewSet(viewsets.ModelViewSet):
 from .serializers import (
     CryptoCurrencySerializer, CryptoWalletSerializer, CryptoWalletCreateSerializer,
     CryptoTransactionSerializer, CryptoBuySerializer, CryptoSellSerializer,
-    CryptoTransferSerializer, CryptoPortfolioSerializer, CryptoPriceHistorySerializer
+    CryptoTransferSerializer, CryptoPortfolioSerializer, CryptoPriceHistorySerializer,
+    CryptoPriceRollupSerializer
 )
 from .services.crypto_service import CryptoService
 
@@ -1056,6 +998,8 @@ class CryptoCurrencyViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = CryptoCurrency.objects.filter(is_active=True)
     serializer_class = CryptoCurrencySerializer
     permission_classes = [permissions.AllowAny]
+    # A fixed catalogue, returned whole
+    pagination_class = None
 
     @action(detail=True, methods=['get'], url_path='history')
     def price_history(self, request, pk=None):
@@ -1070,6 +1014,18 @@ class CryptoCurrencyViewSet(viewsets.ReadOnlyModelViewSet):
         except ValueError:
             days = 7
         
+        # Hourly candles for a week at most, daily candles beyond that,
+        # so a one-year chart reads 365 rows instead of 8760
+        since = timezone.now() - timedelta(days=days)
+        if days <= 7:
+            candles = crypto.price_rollups.filter(resolution='hour', bucket_start__gte=since)[:days * 24]
+        else:
+            candles = crypto.price_rollups.filter(resolution='day', bucket_start__gte=since)[:days]
+        serializer = CryptoPriceRollupSerializer(candles, many=True)
+        if serializer.data:
+            return Response(serializer.data)
+
+        # Candles have not been built yet, fall back to raw ticks
         history = crypto.price_history.all()[:days * 24]  # Limit results
         serializer = CryptoPriceHistorySerializer(history, many=True)
         return Response(serializer.data)
@@ -1100,6 +1056,8 @@ class CryptoWalletViewSet(viewsets.ModelViewSet):
     """
     serializer_class = CryptoWalletSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # One wallet per cryptocurrency at most
+    pagination_class = None
 
     def get_queryset(self):
         return CryptoWallet.objects.filter(user=self.request.user, is_active=True)
@@ -1139,15 +1097,19 @@ class CryptoTransactionViewSet(viewsets.ReadOnlyModelViewSet):
     """
     serializer_class = CryptoTransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering = ('-created_at', '-id')
+    query_budget = {'GET': 3}
 
     def get_queryset(self):
-        return CryptoTransaction.objects.filter(user=self.request.user)
+        return CryptoTransaction.objects.filter(user=self.request.user).select_related('wallet__cryptocurrency')
 
 
 class CryptoBuyView(APIView):
     """Buy cryptocurrency with USD"""
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         serializer = CryptoBuySerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
@@ -1177,6 +1139,7 @@ class CryptoSellView(APIView):
     """Sell cryptocurrency for USD"""
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         serializer = CryptoSellSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
@@ -1264,51 +1227,17 @@ class UserAnalyticsView(APIView):
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 7
     
     def get(self, request):
         user = request.user
         
         try:
-            # Get current date for calculations
-            now = timezone.now()
-            current_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            last_month = (current_month - timedelta(days=1)).replace(day=1)
-            
-            # Cards analytics
-            cards_data = self._get_cards_analytics(user)
-            
-            # Transactions analytics
-            transactions_data = self._get_transactions_analytics(user, current_month, last_month)
-            
-            # Financial products analytics
-            loans_data = self._get_loans_analytics(user)
-            deposits_data = self._get_deposits_analytics(user)
-            mortgages_data = self._get_mortgages_analytics(user)
-            
-            # Crypto analytics
-            crypto_data = self._get_crypto_analytics(user)
-            
-            # Overall financial health
-            financial_health = self._calculate_financial_health(user, cards_data, loans_data, deposits_data)
-            
-            analytics = {
-                'user_info': {
-                    'full_name': user.get_full_name(),
-                    'phone_number': user.phone_number,
-                    'member_since': user.date_joined.strftime('%Y-%m-%d'),
-                    'last_activity': user.last_login.strftime('%Y-%m-%d %H:%M') if user.last_login else None,
-                },
-                'cards': cards_data,
-                'transactions': transactions_data,
-                'loans': loans_data,
-                'deposits': deposits_data,
-                'mortgages': mortgages_data,
-                'crypto': crypto_data,
-                'financial_health': financial_health,
-                'generated_at': now.strftime('%Y-%m-%d %H:%M:%S')
-            }
-            
-            return Response(analytics, status=status.HTTP_200_OK)
+            # Served from the user's snapshot until one of their products changes
+            analytics, hit = AnalyticsSnapshotService().get_or_build(user.pk, lambda: self._build_analytics(user))
+            response = Response(analytics, status=status.HTTP_200_OK)
+            response['X-Analytics-Cache'] = 'hit' if hit else 'miss'
+            return response
             
         except Exception as e:
             return Response(
@@ -1316,34 +1245,79 @@ class UserAnalyticsView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def _build_analytics(self, user):
+        """The analytics payload, one query per section"""
+        # Get current date for calculations
+        now = timezone.now()
+        current_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        last_month = (current_month - timedelta(days=1)).replace(day=1)
+        
+        # Cards analytics
+        cards_data = self._get_cards_analytics(user)
+        
+        # Transactions analytics
+        transactions_data = self._get_transactions_analytics(user, current_month, last_month)
+        
+        # Financial products analytics
+        loans_data = self._get_loans_analytics(user)
+        deposits_data = self._get_deposits_analytics(user)
+        mortgages_data = self._get_mortgages_analytics(user)
+        
+        # Crypto analytics
+        crypto_data = self._get_crypto_analytics(user)
+        
+        # Overall financial health
+        financial_health = self._calculate_financial_health(user, cards_data, loans_data, deposits_data)
+        
+        analytics = {
+            'user_info': {
+                'full_name': user.get_full_name(),
+                'phone_number': user.phone_number,
+                'member_since': user.date_joined.strftime('%Y-%m-%d'),
+                'last_activity': user.last_login.strftime('%Y-%m-%d %H:%M') if user.last_login else None,
+            },
+            'cards': cards_data,
+            'transactions': transactions_data,
+            'loans': loans_data,
+            'deposits': deposits_data,
+            'mortgages': mortgages_data,
+            'crypto': crypto_data,
+            'financial_health': financial_health,
+            'generated_at': now.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        
+        return analytics
+    
     def _get_cards_analytics(self, user):
-        """Get detailed cards analytics"""
-        cards = Card.objects.filter(owner=user)
+        """
+        Get detailed cards analytics with one query: the card list, each card
+        annotated with the number of Transaction records that moved it
+        """
+        cards = list(
+            Card.objects.filter(owner=user).annotate(
+                transaction_count=Count('postings', filter=Q(postings__transaction__isnull=False))
+            )
+        )
         
         total_balance = sum(card.balance for card in cards)
-        active_cards = cards.filter(is_blocked=False).count()
-        blocked_cards = cards.filter(is_blocked=True).count()
+        blocked_cards = sum(1 for card in cards if card.is_blocked)
         
-        # Find most used card (by transaction count)
+        # Most used card (by transaction count)
         most_used_card = None
-        max_transactions = 0
-        
-        for card in cards:
-            transaction_count = Transaction.objects.filter(user=user).count()  # Simplified
-            if transaction_count > max_transactions:
-                max_transactions = transaction_count
-                most_used_card = {
-                    'name': card.card_name,
-                    'number': card.card_number[-4:],  # Last 4 digits
-                    'transaction_count': transaction_count
-                }
+        busiest = max(cards, key=lambda card: card.transaction_count, default=None)
+        if busiest is not None and busiest.transaction_count > 0:
+            most_used_card = {
+                'name': busiest.card_name,
+                'number': busiest.card_number[-4:],  # Last 4 digits
+                'transaction_count': busiest.transaction_count
+            }
         
         return {
-            'total_cards': cards.count(),
-            'active_cards': active_cards,
+            'total_cards': len(cards),
+            'active_cards': len(cards) - blocked_cards,
             'blocked_cards': blocked_cards,
             'total_balance': float(total_balance),
-            'average_balance': float(total_balance / cards.count()) if cards.count() > 0 else 0,
+            'average_balance': float(total_balance / len(cards)) if cards else 0,
             'most_used_card': most_used_card,
             'cards_list': [
                 {
@@ -1359,47 +1333,44 @@ class UserAnalyticsView(APIView):
         }
     
     def _get_transactions_analytics(self, user, current_month, last_month):
-        """Get detailed transactions analytics"""
-        all_transactions = Transaction.objects.filter(user=user)
-        current_month_transactions = all_transactions.filter(timestamp__gte=current_month)
-        last_month_transactions = all_transactions.filter(
-            timestamp__gte=last_month, 
-            timestamp__lt=current_month
-        )
-        
-        # Income vs Expense analysis
-        total_income = all_transactions.filter(transaction_type=1).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-        
-        total_expense = all_transactions.filter(transaction_type=2).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-        
-        # Monthly comparison
-        current_month_income = current_month_transactions.filter(transaction_type=1).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-        
-        current_month_expense = current_month_transactions.filter(transaction_type=2).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-        
-        last_month_income = last_month_transactions.filter(transaction_type=1).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-        
-        last_month_expense = last_month_transactions.filter(transaction_type=2).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-        
+        """
+        Get detailed transactions analytics from the monthly rollups, one
+        query over a couple of rows per month of history
+        """
+        EXPENSE, INCOME = 0, 1
+        # {period: {transaction_type: [count, total]}}
+        totals = {period: defaultdict(lambda: [0, Decimal('0')]) for period in ('all', 'current', 'last')}
+        rollups = TransactionMonthlyRollup.objects.filter(user=user).values_list('month', 'transaction_type', 'count', 'total')
+        for month, transaction_type, count, total in rollups:
+            periods = ['all']
+            if month == current_month.date():
+                periods.append('current')
+            elif month == last_month.date():
+                periods.append('last')
+            for period in periods:
+                bucket = totals[period][transaction_type]
+                bucket[0] += count
+                bucket[1] += total
+
+        def summary(period):
+            # Expenses are stored as negative amounts
+            income = totals[period][INCOME][1]
+            expense = abs(totals[period][EXPENSE][1])
+            count = sum(bucket[0] for bucket in totals[period].values())
+            return income, expense, count
+
+        total_income, total_expense, total_count = summary('all')
+        current_month_income, current_month_expense, current_month_count = summary('current')
+        last_month_income, last_month_expense, last_month_count = summary('last')
+        all_amounts = sum(bucket[1] for bucket in totals['all'].values())
+
         # Calculate trends
         income_trend = self._calculate_trend(current_month_income, last_month_income)
         expense_trend = self._calculate_trend(current_month_expense, last_month_expense)
         
         return {
-            'total_transactions': all_transactions.count(),
-            'current_month_transactions': current_month_transactions.count(),
+            'total_transactions': total_count,
+            'current_month_transactions': current_month_count,
             'total_income': float(total_income),
             'total_expense': float(total_expense),
             'net_balance': float(total_income - total_expense),
@@ -1407,30 +1378,28 @@ class UserAnalyticsView(APIView):
                 'income': float(current_month_income),
                 'expense': float(current_month_expense),
                 'net': float(current_month_income - current_month_expense),
-                'transaction_count': current_month_transactions.count()
+                'transaction_count': current_month_count
             },
             'last_month': {
                 'income': float(last_month_income),
                 'expense': float(last_month_expense),
                 'net': float(last_month_income - last_month_expense),
-                'transaction_count': last_month_transactions.count()
+                'transaction_count': last_month_count
             },
             'trends': {
-                'income_trend': income_trend,
-                'expense_trend': expense_trend
+                'income_trend': float(income_trend),
+                'expense_trend': float(expense_trend)
             },
-            'average_transaction': float(
-                all_transactions.aggregate(avg=Avg('amount'))['avg'] or 0
-            )
+            'average_transaction': float(all_amounts / total_count) if total_count else 0
         }
     
     def _get_loans_analytics(self, user):
-        """Get detailed loans analytics"""
-        loans = Loan.objects.filter(user=user)
-        active_loans = loans.filter(is_active=True)
+        """Get detailed loans analytics, totals taken from the one loan list query"""
+        loans = list(Loan.objects.filter(user=user))
+        active_loans = [loan for loan in loans if loan.is_active]
         
-        total_borrowed = active_loans.aggregate(total=Sum('total_amount'))['total'] or 0
-        total_remaining = active_loans.aggregate(total=Sum('remaining_debt'))['total'] or 0
+        total_borrowed = sum(loan.total_amount for loan in active_loans)
+        total_remaining = sum(loan.remaining_debt for loan in active_loans)
         
         # Next payment calculation
         next_payment = None
@@ -1443,9 +1412,9 @@ class UserAnalyticsView(APIView):
                 next_payment_amount = loan.monthly_payment
         
         return {
-            'total_loans': loans.count(),
-            'active_loans': active_loans.count(),
-            'inactive_loans': loans.filter(is_active=False).count(),
+            'total_loans': len(loans),
+            'active_loans': len(active_loans),
+            'inactive_loans': len(loans) - len(active_loans),
             'total_borrowed': float(total_borrowed),
             'total_remaining_debt': float(total_remaining),
             'next_payment': {
@@ -1468,23 +1437,22 @@ class UserAnalyticsView(APIView):
         }
     
     def _get_deposits_analytics(self, user):
-        """Get detailed deposits analytics"""
-        deposits = Deposit.objects.filter(user=user)
-        active_deposits = deposits  # All deposits are considered active
+        """Get detailed deposits analytics, totals taken from the one deposit list query"""
+        deposits = list(Deposit.objects.filter(user=user))  # All deposits are considered active
         
-        total_deposited = active_deposits.aggregate(total=Sum('amount'))['total'] or 0
+        total_deposited = sum(deposit.amount for deposit in deposits)
         
         # Calculate total interest earned (simplified)
         total_interest = sum(
             float(deposit.amount) * (float(deposit.interest_rate)/100) * (deposit.term_months/12)
-            for deposit in active_deposits
+            for deposit in deposits
         )
         
-        average_rate = active_deposits.aggregate(avg=Avg('interest_rate'))['avg'] or 0
+        average_rate = sum(deposit.interest_rate for deposit in deposits) / len(deposits) if deposits else 0
         
         return {
-            'total_deposits': deposits.count(),
-            'active_deposits': active_deposits.count(),
+            'total_deposits': len(deposits),
+            'active_deposits': len(deposits),
             'total_deposited': float(total_deposited),
             'total_interest_earned': float(total_interest),
             'average_interest_rate': float(average_rate),
@@ -1501,17 +1469,17 @@ class UserAnalyticsView(APIView):
         }
     
     def _get_mortgages_analytics(self, user):
-        """Get detailed mortgages analytics"""
-        mortgages = Mortgage.objects.filter(user=user)
-        active_mortgages = mortgages.filter(is_active=True)
+        """Get detailed mortgages analytics, totals taken from the one mortgage list query"""
+        mortgages = list(Mortgage.objects.filter(user=user))
+        active_mortgages = [mortgage for mortgage in mortgages if mortgage.is_active]
         
-        total_mortgage_amount = active_mortgages.aggregate(total=Sum('property_cost'))['total'] or 0
-        total_loan_amount = active_mortgages.aggregate(total=Sum('total_amount'))['total'] or 0
+        total_mortgage_amount = sum(mortgage.property_cost for mortgage in active_mortgages)
+        total_loan_amount = sum(mortgage.total_amount for mortgage in active_mortgages)
         
         return {
-            'total_mortgages': mortgages.count(),
-            'active_mortgages': active_mortgages.count(),
-            'inactive_mortgages': mortgages.filter(is_active=False).count(),
+            'total_mortgages': len(mortgages),
+            'active_mortgages': len(active_mortgages),
+            'inactive_mortgages': len(mortgages) - len(active_mortgages),
             'total_property_value': float(total_mortgage_amount),
             'total_loan_amount': float(total_loan_amount),
             'mortgages_list': [
@@ -1533,7 +1501,7 @@ class UserAnalyticsView(APIView):
     def _get_crypto_analytics(self, user):
         """Get crypto portfolio analytics"""
         try:
-            wallets = CryptoWallet.objects.filter(user=user)
+            wallets = list(CryptoWallet.objects.filter(user=user).select_related('cryptocurrency'))
             total_portfolio_value = 0
             
             portfolio = []
@@ -1551,7 +1519,7 @@ class UserAnalyticsView(APIView):
                 })
             
             return {
-                'total_wallets': wallets.count(),
+                'total_wallets': len(wallets),
                 'total_portfolio_value_usd': total_portfolio_value,
                 'portfolio': portfolio
             }
@@ -2001,6 +1969,99 @@ class UserMortgagesView(generics.ListAPIView):
         return Mortgage.objects.filter(user=self.request.user)
 
 
+# The largest amount and annual rate (percent) a loan or mortgage stores
+MAX_SCHEDULE_AMOUNT = Decimal('9999999999999.99')
+MAX_SCHEDULE_RATE = Decimal('999.99')
+
+
+def bounded_decimal(value, maximum):
+    """value as a finite Decimal from 0 to maximum, else ValueError"""
+    number = Decimal(value)
+    if not number.is_finite() or not 0 <= number <= maximum:
+        raise ValueError(f"{value} is not a number from 0 to {maximum}")
+    return number
+
+
+def early_repayments(query_params):
+    """
+    Early repayment options of a schedule from ?extra_monthly=,
+    ?lump_sum=<month>:<amount> (repeatable) and ?strategy=
+    """
+    options = {'strategy': query_params.get('strategy', 'reduce_term'), 'lump_sums': {}}
+    try:
+        options['extra_monthly'] = bounded_decimal(query_params.get('extra_monthly', '0'), MAX_SCHEDULE_AMOUNT)
+        for value in query_params.getlist('lump_sum'):
+            month, amount = value.split(':')
+            options['lump_sums'][int(month)] = (
+                options['lump_sums'].get(int(month), 0) + bounded_decimal(amount, MAX_SCHEDULE_AMOUNT)
+            )
+    except (ValueError, ArithmeticError):
+        raise ValidationError({
+            'lump_sum': f'Expected ?extra_monthly=<amount> and ?lump_sum=<month>:<amount>, amounts up to {MAX_SCHEDULE_AMOUNT}.'
+        })
+    return options
+
+
+def amortization_schedule(*args, **kwargs):
+    """AmortizationService().schedule(), with invalid inputs as a 400"""
+    try:
+        return AmortizationService().schedule(*args, **kwargs)
+    except (ValueError, ArithmeticError) as e:
+        raise ValidationError({'detail': str(e)})
+
+
+class ProductScheduleView(APIView):
+    """
+    Month-by-month amortization schedule of one of the user's loans or
+    mortgages, from its issue date, with optional early repayments (see
+    early_repayments). The schedule is columnar: one list per column.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 3
+    model = None
+
+    def get(self, request, pk):
+        product = get_object_or_404(self.model, pk=pk, user=request.user)
+        term_months = product.term_months if self.model is Loan else product.term_years * 12
+        schedule = amortization_schedule(
+            product.total_amount, product.interest_rate, term_months,
+            start_date=product.issue_date, **early_repayments(request.query_params),
+        )
+        return Response(schedule)
+
+
+class LoanScheduleView(ProductScheduleView):
+    model = Loan
+
+
+class MortgageScheduleView(ProductScheduleView):
+    model = Mortgage
+
+
+class AmortizationCalculatorView(APIView):
+    """
+    Amortization schedule of a prospective loan for the app's calculators:
+    ?principal=, ?annual_rate= (percent) and ?term_months=, up to
+    MAX_TERM_MONTHS, with the early repayment options of ProductScheduleView
+    """
+    permission_classes = [permissions.AllowAny]
+    MAX_TERM_MONTHS = 600
+
+    def get(self, request):
+        try:
+            principal = bounded_decimal(request.query_params['principal'], MAX_SCHEDULE_AMOUNT)
+            annual_rate = bounded_decimal(request.query_params['annual_rate'], MAX_SCHEDULE_RATE)
+            term_months = int(request.query_params['term_months'])
+        except (KeyError, ValueError, ArithmeticError):
+            raise ValidationError({
+                'detail': f'principal (up to {MAX_SCHEDULE_AMOUNT}), annual_rate (percent, up to {MAX_SCHEDULE_RATE}) '
+                          'and term_months are required numbers.'
+            })
+        if term_months > self.MAX_TERM_MONTHS:
+            raise ValidationError({'term_months': f'At most {self.MAX_TERM_MONTHS} months.'})
+        return Response(amortization_schedule(principal, annual_rate, term_months, **early_repayments(request.query_params)))
+
+
 class AdminUserListView(generics.ListAPIView):
     """
     API endpoint для получения списка всех пользователей (только для админов)
@@ -2063,43 +2124,53 @@ class AdminUpdateUserBalanceView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            card = Card.objects.get(id=card_id, owner=user)
-        except Card.DoesNotExist:
-            return Response(
-                {'error': 'Карта не найдена или не принадлежит пользователю'}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
-        old_balance = card.balance
-        
-        if operation == 'set':
-            card.balance = amount
-        elif operation == 'add':
-            card.balance += amount
-        elif operation == 'subtract':
-            card.balance -= amount
-            if card.balance < 0:
-                card.balance = Decimal('0.00')
-        else:
+        if operation not in ('set', 'add', 'subtract'):
             return Response(
                 {'error': 'Некорректная операция. Используйте: set, add, subtract'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        card.save()
-        
-        # Обновляем общий баланс пользователя
-        user.update_total_balance()
-        
-        # Создаем транзакцию для истории
-        transaction_title = f"Админ: {operation} баланса"
-        Transaction.objects.create(
-            user=user,
-            title=transaction_title,
-            amount=amount if operation != 'set' else (amount - old_balance),
-            transaction_type=1 if (operation == 'add' or (operation == 'set' and amount > old_balance)) else 0
-        )
+        with transaction.atomic():
+            try:
+                card = Card.objects.select_for_update().get(id=card_id, owner=user)
+            except Card.DoesNotExist:
+                return Response(
+                    {'error': 'Карта не найдена или не принадлежит пользователю'}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            
+            old_balance = card.balance
+            
+            if operation == 'set':
+                card.balance = amount
+            elif operation == 'add':
+                card.balance += amount
+            elif operation == 'subtract':
+                card.balance -= amount
+                if card.balance < 0:
+                    card.balance = Decimal('0.00')
+            
+            card.save(update_fields=['balance'])
+            
+            # Обновляем общий баланс пользователя
+            user.adjust_total_balance(card.balance - old_balance)
+            
+            # Создаем транзакцию для истории
+            transaction_title = f"Админ: {operation} баланса"
+            record = Transaction.objects.create(
+                user=user,
+                title=transaction_title,
+                amount=amount if operation != 'set' else (amount - old_balance),
+                transaction_type=1 if (operation == 'add' or (operation == 'set' and amount > old_balance)) else 0
+            )
+            
+            # Проводка в журнале: карта против счета корректировок
+            delta = card.balance - old_balance
+            if delta:
+                LedgerPosting.record('adjustment', [
+                    LedgerPosting.card_leg(card.id, delta, transaction=record),
+                    LedgerPosting.account_leg('adjustments', -delta),
+                ])
         
         return Response({
             'message': 'Баланс успешно обновлен',
@@ -7,6 +7,7 @@ from pathlib import Path
 import os
 import dj_database_url
 from decouple import config
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -67,7 +68,11 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-    )
+    ),
+    # Every list endpoint is paged; time-ordered feeds override this with
+    # api.pagination.KeysetPagination
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.EstimatedCountPagination',
+    'PAGE_SIZE': 50,
 }
 
 MIDDLEWARE = [
@@ -80,6 +85,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.QueryBudgetMiddleware',
 ]
 
 # CORS настройки для веб-фронтенда
@@ -89,6 +95,9 @@ CORS_ALLOWED_ORIGINS = [
     "https://localhost:3000",
 ]
 
+# Клиенты передают Idempotency-Key при повторе платежных запросов
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+
 # В продакшене можно добавить домен фронтенда
 if not DEBUG:
     CORS_ALLOW_ALL_ORIGINS = True  # Временно для тестирования
@@ -173,6 +182,40 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom application settings
 MORTGAGE_BASE_RATE = 20.0
 
+# Raw price ticks older than this are compacted into candles and deleted
+PRICE_HISTORY_RETENTION_DAYS = config('PRICE_HISTORY_RETENTION_DAYS', default=90, cast=int)
+
+# How long the response of a request sent with an Idempotency-Key is replayed
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
+
+# Redis when REDIS_URL is set, otherwise a per-process memory cache
+# (local development and tests)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Lifetime of a cached /api/analytics/ payload; writes invalidate it sooner
+ANALYTICS_SNAPSHOT_TTL_SECONDS = config('ANALYTICS_SNAPSHOT_TTL_SECONDS', default=3600, cast=int)
+
+# Per-request query accounting (api.middleware.QueryBudgetMiddleware):
+# X-DB-* response headers and N+1 warnings, and whether a view over its
+# query_budget raises instead of logging (always on under the test runner)
+QUERY_INSPECTOR_HEADERS = config('QUERY_INSPECTOR_HEADERS', default=DEBUG, cast=bool)
+QUERY_REPEAT_THRESHOLD = config('QUERY_REPEAT_THRESHOLD', default=5, cast=int)
+QUERY_BUDGET_ENFORCE = config('QUERY_BUDGET_ENFORCE', default=False, cast=bool)
+TEST_RUNNER = 'api.testing.QueryBudgetTestRunner'
+
 # Безопасность для продакшена
 if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True